@@ -1,6 +1,9 @@
 from django_filters import rest_framework as filters
+from rest_framework.filters import SearchFilter
+from rest_framework.settings import api_settings
 
 from store.models import Product
+from store.search import search_products
 
 
 class CharInFilter(filters.BaseInFilter, filters.CharFilter):
@@ -21,3 +24,20 @@ class ProductFilter(filters.FilterSet):
         if value:
             return queryset.filter(old_price__isnull=False)
         return queryset
+
+
+class ProductSearchFilter(SearchFilter):
+    '''
+    Полнотекстовый поиск по товарам вместо ILIKE по search_fields.
+    '''
+
+    def filter_queryset(self, request, queryset, view):
+        term = ' '.join(self.get_search_terms(request))
+        if not term:
+            return queryset
+
+        return search_products(
+            queryset,
+            term,
+            rank=not request.query_params.get(api_settings.ORDERING_PARAM),
+        )
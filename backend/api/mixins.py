@@ -1,15 +1,85 @@
 import hashlib
-from copy import deepcopy
+import json
+import time
+from uuid import uuid4
 
 from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import (get_conditional_response, patch_cache_control,
+                                set_response_etag)
+from prometheus_client import Counter, Histogram
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 
+from store.cache import get_cache_generations
+
+CACHE_LOCK_WAITS = Counter(
+    'revolline_api_cache_lock_waits_total',
+    'Cache misses that waited for another worker to recompute the key.',
+    ('view', 'outcome'),
+)
+CACHE_LOCK_WAIT_DURATION = Histogram(
+    'revolline_api_cache_lock_wait_seconds',
+    'Time spent waiting for another worker to recompute a cache key.',
+    ('view',),
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+CACHE_STALE_SERVES = Counter(
+    'revolline_api_cache_stale_served_total',
+    'Expired cache entries served while another worker recomputes them.',
+    ('view',),
+)
+
+
+class ConditionalResponseMixin:
+    '''
+    Проставляет ETag успешным GET-ответам и отвечает 304 на If-None-Match.
+
+    Last-Modified не отдаётся: время изменения данных в кэше неизвестно,
+    а время сборки записи кэша им не является.
+    '''
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(
+            request, response, *args, **kwargs
+        )
+        if (
+            request.method not in ("GET", "HEAD")
+            or response.status_code != 200
+            or response.streaming
+        ):
+            return response
+
+        if not response.has_header("ETag"):
+            if isinstance(response, Response):
+                response.render()
+            set_response_etag(response)
+
+        # private=False Django записал бы в заголовок буквально.
+        if request.user.is_authenticated:
+            patch_cache_control(response, no_cache=True, private=True)
+        else:
+            patch_cache_control(response, no_cache=True)
+        return get_conditional_response(
+            request,
+            etag=response.get("ETag"),
+            response=response,
+        )
+
 
 class PublicCacheViewSetMixin:
     cache_timeouts = {
-        "list": 60,
-        "retrieve": 300,
+        "list": 60 * 60,
+        "retrieve": 60 * 60,
     }
+    # Модели, изменение которых сбрасывает кэш вьюсета.
+    cache_dependencies = ()
+    # Сколько истёкшее значение ещё можно отдавать, пока один воркер
+    # пересчитывает ключ.
+    cache_stale_timeout = 60
+    cache_lock_timeout = 30
+    cache_lock_wait = 2.0
+    cache_lock_poll_interval = 0.05
 
     def should_cache(self, request):
         return (
@@ -20,45 +90,143 @@ class PublicCacheViewSetMixin:
     def get_cache_key(self, action):
         path = self.request.get_full_path()
         digest = hashlib.sha256(path.encode()).hexdigest()
+        generations = get_cache_generations(self.cache_dependencies)
+        version = ".".join(
+            str(generations[model_name])
+            for model_name in self.cache_dependencies
+        )
 
         return (
             f"api:{self.__class__.__name__}:"
-            f"{action}:{digest}"
+            f"{action}:{version}:{digest}"
         )
 
     def enrich_response_data(self, data):
         return data
 
+    def needs_response_enrichment(self):
+        '''
+        Нужно ли подмешивать в закэшированный ответ персональные данные.
+        '''
+        return False
+
+    def build_cache_entry(self, data, timeout):
+        content = JSONRenderer().render(data)
+        return {
+            "content": content,
+            "etag": f'"{hashlib.md5(content).hexdigest()}"',
+            "expires_at": time.time() + timeout,
+        }
+
+    def patch_cached_content(self, entry):
+        '''
+        Подмешивает персональные данные прямо в байты закэшированного ответа.
+
+        Возвращает None, если это невозможно и нужен полный разбор JSON.
+        '''
+        return None
+
+    def get_cached_content_response(self, entry):
+        if self.request.accepted_renderer.format == "json":
+            if not self.needs_response_enrichment():
+                response = HttpResponse(
+                    entry["content"],
+                    content_type="application/json",
+                )
+                response["ETag"] = entry["etag"]
+                return response
+
+            content = self.patch_cached_content(entry)
+            if content is not None:
+                return HttpResponse(content, content_type="application/json")
+
+        data = self.enrich_response_data(json.loads(entry["content"]))
+        return Response(data)
+
+    def acquire_cache_lock(self, key):
+        token = uuid4().hex
+        if cache.add(f"{key}:lock", token, timeout=self.cache_lock_timeout):
+            return token
+        return None
+
+    def release_cache_lock(self, key, token):
+        lock_key = f"{key}:lock"
+        if cache.get(lock_key) == token:
+            cache.delete(lock_key)
+
+    def wait_for_cache(self, key):
+        view_name = self.__class__.__name__
+        started_at = time.monotonic()
+        deadline = started_at + self.cache_lock_wait
+        entry = None
+
+        lock_key = f"{key}:lock"
+        while time.monotonic() < deadline:
+            time.sleep(self.cache_lock_poll_interval)
+            values = cache.get_many((key, lock_key))
+            entry = values.get(key)
+            # Лок снят без записи в кэш (например, ответ 404) — ждать нечего.
+            if entry is not None or lock_key not in values:
+                break
+
+        CACHE_LOCK_WAIT_DURATION.labels(view_name).observe(
+            time.monotonic() - started_at
+        )
+        CACHE_LOCK_WAITS.labels(
+            view_name,
+            "hit" if entry is not None else "miss",
+        ).inc()
+        return entry
+
+    def refresh_cached_response(self, key, action, callback, lock_token):
+        try:
+            response = callback()
+
+            if response.status_code == 200:
+                timeout = self.cache_timeouts[action]
+                entry = self.build_cache_entry(response.data, timeout)
+                cache.set(
+                    key,
+                    entry,
+                    timeout=timeout + self.cache_stale_timeout,
+                )
+                response = self.get_cached_content_response(entry)
+        finally:
+            if lock_token:
+                self.release_cache_lock(key, lock_token)
+
+        return response
+
     def get_cached_response(self, action, callback):
         if not self.should_cache(self.request):
             response = callback()
             if response.status_code == 200:
-                response.data = self.enrich_response_data(
-                    deepcopy(response.data)
-                )
+                response.data = self.enrich_response_data(response.data)
             return response
 
         key = self.get_cache_key(action)
-        cached = cache.get(key)
+        entry = cache.get(key)
 
-        if cached is not None:
-            data = self.enrich_response_data(deepcopy(cached))
-            return Response(data)
+        if entry is not None:
+            if entry["expires_at"] > time.time():
+                return self.get_cached_content_response(entry)
 
-        response = callback()
+            lock_token = self.acquire_cache_lock(key)
+            if lock_token is None:
+                CACHE_STALE_SERVES.labels(self.__class__.__name__).inc()
+                return self.get_cached_content_response(entry)
 
-        if response.status_code == 200:
-            shared_data = deepcopy(response.data)
-            cache.set(
-                key,
-                shared_data,
-                timeout=self.cache_timeouts[action],
-            )
-            response.data = self.enrich_response_data(
-                deepcopy(shared_data)
+            return self.refresh_cached_response(
+                key, action, callback, lock_token
             )
 
-        return response
+        lock_token = self.acquire_cache_lock(key)
+        if lock_token is None:
+            entry = self.wait_for_cache(key)
+            if entry is not None:
+                return self.get_cached_content_response(entry)
+
+        return self.refresh_cached_response(key, action, callback, lock_token)
 
     def list(self, request, *args, **kwargs):
         return self.get_cached_response(
@@ -1,4 +1,5 @@
 from django.contrib.auth import authenticate, get_user_model
+from django.core.files.storage import default_storage
 from rest_framework import serializers
 from rest_framework_simplejwt.exceptions import AuthenticationFailed
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
@@ -9,6 +10,39 @@ from store.models import (Cart, Category, Favorites, Order, Product,
 User = get_user_model()
 
 
+def get_image_url(name, request=None):
+    if not name:
+        return None
+    url = default_storage.url(name)
+    if request:
+        return request.build_absolute_uri(url)
+    return url
+
+
+def get_image_variants(items, request=None):
+    return [
+        {
+            'format': item['format'],
+            'width': item['width'],
+            'url': get_image_url(item['image'], request),
+        }
+        for item in items
+    ]
+
+
+class SparseFieldsetMixin:
+    '''
+    Оставляет только поля из context['fields'] (параметр ?fields=).
+    '''
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        fields = self.context.get('fields')
+        if fields is not None:
+            for field_name in set(self.fields) - set(fields):
+                self.fields.pop(field_name)
+
+
 class LowerSlugRelatedField(serializers.SlugRelatedField):
     def to_internal_value(self, data):
         if isinstance(data, str):
@@ -33,9 +67,17 @@ class SectionSerializer(serializers.ModelSerializer):
 
 
 class ProductImageSerializer(serializers.ModelSerializer):
+    variants = serializers.SerializerMethodField()
+
     class Meta:
         model = ProductImage
-        fields = ('image',)
+        fields = ('image', 'variants')
+
+    def get_variants(self, obj):
+        return get_image_variants(
+            obj.variants.get('items', ()),
+            self.context.get('request'),
+        )
 
 
 class PromocodeSerializer(serializers.ModelSerializer):
@@ -64,16 +106,15 @@ class ShortProductSerializer(serializers.ModelSerializer):
         fields = ('id', 'title', 'price', 'old_price', 'has_discount', 'image')
 
     def get_image(self, obj):
-        request = self.context.get('request')
-        first_image = obj.images.first()
-        if not first_image:
-            return None
-        if request:
-            return request.build_absolute_uri(first_image.image.url)
-        return first_image.image.url
+        # Главное изображение подтягивается JOIN-ом через
+        # select_related('product__primary_image'), без запроса на строку.
+        return get_image_url(
+            obj.primary_image.image.name if obj.primary_image_id else None,
+            self.context.get('request'),
+        )
 
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     is_fav = serializers.BooleanField(read_only=True, default=False)
     images = ProductImageSerializer(many=True)
     categories = CategorySerializer(many=True)
@@ -98,6 +139,63 @@ class ProductSerializer(serializers.ModelSerializer):
                   'categories', 'images', 'has_discount')
 
 
+class ProductSuggestionSerializer(serializers.ModelSerializer):
+    image = serializers.SerializerMethodField()
+    price = serializers.DecimalField(
+        max_digits=12,
+        decimal_places=2,
+        coerce_to_string=False,
+    )
+
+    class Meta:
+        model = Product
+        fields = ('id', 'title', 'price', 'image')
+
+    def get_image(self, obj):
+        return get_image_url(obj.first_image, self.context.get('request'))
+
+
+class ProductCardSerializer(SparseFieldsetMixin, serializers.Serializer):
+    '''
+    Товар в списке каталога: читает только денормализованную ProductCard.
+    '''
+    id = serializers.IntegerField(source='pk')
+    title = serializers.CharField(source='card.title')
+    price = serializers.DecimalField(
+        source='card.price',
+        max_digits=12,
+        decimal_places=2,
+        coerce_to_string=False,
+    )
+    old_price = serializers.DecimalField(
+        source='card.old_price',
+        max_digits=12,
+        decimal_places=2,
+        coerce_to_string=False,
+        allow_null=True,
+    )
+    pr_type = serializers.CharField(source='card.pr_type')
+    has_discount = serializers.BooleanField(source='card.has_discount')
+    is_new = serializers.BooleanField(source='card.is_new')
+    is_fav = serializers.BooleanField(read_only=True, default=False)
+    country = serializers.CharField(source='card.country', allow_null=True)
+    categories = serializers.ListField(
+        source='card.category_slugs',
+        child=serializers.CharField(),
+    )
+    image = serializers.SerializerMethodField()
+    image_variants = serializers.SerializerMethodField()
+
+    def get_image(self, obj):
+        return get_image_url(obj.card.image, self.context.get('request'))
+
+    def get_image_variants(self, obj):
+        return get_image_variants(
+            obj.card.image_variants,
+            self.context.get('request'),
+        )
+
+
 class FavCartSerializerMixin(serializers.Serializer):
     product = serializers.PrimaryKeyRelatedField(
         queryset=Product.objects.all(), write_only=True,
@@ -1,17 +1,35 @@
+import shutil
+import tempfile
+import time
 from decimal import Decimal
+from hashlib import md5
 from unittest.mock import patch
 from uuid import uuid4
 
 import jwt
 from cryptography.hazmat.primitives.asymmetric import rsa
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import FloatField, Value
 from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from jwt.algorithms import RSAAlgorithm
 from rest_framework import status
-from rest_framework.test import APITestCase
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory, APITestCase
+
+from django.core.files.uploadedfile import SimpleUploadedFile
 
 from api.exceptions import ExternalAPIError
-from store.models import Cart, Order, PaymentAttempt, Product
+from api.views import ProductViewSet
+from store.cart import (cache_cart_summary, get_cart_summary,
+                        get_cart_summary_cache_key)
+from store.constants import DELIVERY_FEE
+from store.models import (Cart, Category, Favorites, Order, PaymentAttempt,
+                          Product, ProductCard, ProductImage, ProductOrder)
+from store.pagination import CatalogPagination
+from store.search import get_prefix_search_query
 from users.models import CustomUser
 
 
@@ -440,3 +458,887 @@ class PaymentWebhookTests(APITestCase):
 
         self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
         self.assertFalse(response.data['matched'])
+
+
+class PublicCacheInvalidationTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(title='Помады')
+        self.product = Product.objects.create(
+            title='Кэшируемый товар',
+            description='Описание',
+            pr_type='Тип',
+            price=Decimal('1000.00'),
+        )
+        self.product.categories.set((self.category,))
+        self.url = reverse('products-detail', args=(self.product.pk,))
+
+    def test_repeated_request_is_served_from_cache(self):
+        self.client.get(self.url)
+
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['price'], 1000)
+
+    def test_anonymous_cache_hit_returns_rendered_bytes_with_etag(self):
+        first_response = self.client.get(self.url)
+        second_response = self.client.get(self.url)
+
+        self.assertEqual(first_response.content, second_response.content)
+        self.assertTrue(second_response['ETag'])
+        self.assertEqual(first_response['ETag'], second_response['ETag'])
+        self.assertFalse(second_response.json()['is_fav'])
+
+    def test_authenticated_cache_hit_is_enriched(self):
+        user = CustomUser.objects.create_user(
+            email='cache-fav@example.com',
+            password='strong-test-password',
+        )
+        Favorites.objects.create(user=user, product=self.product)
+        anonymous_response = self.client.get(self.url)
+        self.client.force_authenticate(user)
+
+        response = self.client.get(self.url)
+
+        self.assertTrue(response.json()['is_fav'])
+        self.assertNotEqual(response['ETag'], anonymous_response['ETag'])
+
+    def test_product_save_invalidates_cached_response(self):
+        self.client.get(self.url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.price = Decimal('900.00')
+            self.product.save()
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.json()['price'], 900)
+
+    def test_category_change_invalidates_product_response(self):
+        self.client.get(self.url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.category.title = 'Блески'
+            self.category.save()
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.json()['categories'][0]['title'], 'Блески')
+
+    def test_categories_m2m_change_invalidates_product_response(self):
+        self.client.get(self.url)
+        other_category = Category.objects.create(title='Тени')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.categories.set((other_category,))
+        response = self.client.get(self.url)
+
+        self.assertEqual(
+            [item['slug'] for item in response.json()['categories']],
+            [other_category.slug],
+        )
+
+
+class PublicCacheStampedeTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.product = Product.objects.create(
+            title='Популярный товар',
+            description='Описание',
+            pr_type='Тип',
+            price=Decimal('1000.00'),
+        )
+        self.url = reverse('products-detail', args=(self.product.pk,))
+
+    def expire_cache(self):
+        return patch(
+            'api.mixins.time.time',
+            return_value=time.time() + ProductViewSet.cache_timeouts[
+                'retrieve'
+            ] + 1,
+        )
+
+    def test_expired_entry_is_served_stale_while_locked(self):
+        self.client.get(self.url)
+        Product.objects.filter(pk=self.product.pk).update(
+            price=Decimal('900.00'),
+        )
+
+        with (
+            self.expire_cache(),
+            patch.object(
+                ProductViewSet,
+                'acquire_cache_lock',
+                return_value=None,
+            ),
+            self.assertNumQueries(0),
+        ):
+            response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['price'], 1000)
+
+    def test_expired_entry_is_recomputed_by_lock_owner(self):
+        self.client.get(self.url)
+        Product.objects.filter(pk=self.product.pk).update(
+            price=Decimal('900.00'),
+        )
+
+        with self.expire_cache():
+            response = self.client.get(self.url)
+
+        self.assertEqual(response.json()['price'], 900)
+
+    def test_miss_without_active_lock_holder_is_computed(self):
+        with patch.object(
+            ProductViewSet,
+            'acquire_cache_lock',
+            return_value=None,
+        ):
+            response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['id'], self.product.pk)
+
+
+class FavoriteOverlayTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create_user(
+            email='overlay@example.com',
+            password='strong-test-password',
+        )
+        self.products = [
+            Product.objects.create(
+                title=f'Товар {index}',
+                description='Описание',
+                pr_type='Тип',
+                price=Decimal('100.00') * (index + 1),
+            )
+            for index in range(3)
+        ]
+        self.url = reverse('products-list')
+        self.client.force_authenticate(self.user)
+
+    def get_favorite_flags(self, response):
+        return {
+            product['id']: product['is_fav']
+            for product in response.json()['results']
+        }
+
+    def test_cached_page_is_patched_without_queries(self):
+        favorite = self.products[1]
+        Favorites.objects.create(user=self.user, product=favorite)
+        self.client.get(self.url)
+
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+
+        self.assertEqual(
+            self.get_favorite_flags(response),
+            {
+                product.pk: product.pk == favorite.pk
+                for product in self.products
+            },
+        )
+
+    def test_favorites_changes_refresh_overlay(self):
+        self.client.get(self.url)
+        product = self.products[0]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                reverse('faborites-list'),
+                {'product': product.pk},
+                format='json',
+            )
+        response = self.client.get(self.url)
+        self.assertTrue(self.get_favorite_flags(response)[product.pk])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(
+                reverse('faborites-delete'),
+                QUERY_STRING=f'product={product.pk}',
+            )
+        response = self.client.get(self.url)
+        self.assertFalse(self.get_favorite_flags(response)[product.pk])
+
+
+class ConditionalResponseTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create_user(
+            email='conditional@example.com',
+            password='strong-test-password',
+        )
+        self.product = Product.objects.create(
+            title='Товар с валидатором',
+            description='Описание',
+            pr_type='Тип',
+            price=Decimal('1000.00'),
+            country='Франция',
+        )
+
+    def assert_not_modified(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response['ETag'])
+
+        not_modified = self.client.get(
+            url,
+            HTTP_IF_NONE_MATCH=response['ETag'],
+        )
+        self.assertEqual(
+            not_modified.status_code,
+            status.HTTP_304_NOT_MODIFIED,
+        )
+        self.assertEqual(not_modified.content, b'')
+        return response
+
+    def test_catalog_endpoints_return_not_modified(self):
+        for url in (
+            reverse('products-list'),
+            reverse('products-detail', args=(self.product.pk,)),
+            reverse('category-list'),
+            reverse('sections-list'),
+            reverse('country-list'),
+        ):
+            with self.subTest(url=url):
+                self.assert_not_modified(url)
+
+    def test_anonymous_response_is_not_marked_private(self):
+        response = self.client.get(reverse('products-list'))
+
+        self.assertIn('no-cache', response['Cache-Control'])
+        self.assertNotIn('private', response['Cache-Control'])
+
+    def test_cached_and_enriched_responses_share_validators(self):
+        url = reverse('products-list')
+        anonymous = self.assert_not_modified(url)
+        self.client.force_authenticate(self.user)
+        authenticated = self.assert_not_modified(url)
+
+        for response in (anonymous, authenticated):
+            self.assertFalse(response.has_header('Last-Modified'))
+
+    def test_etag_changes_after_product_update(self):
+        url = reverse('products-list')
+        response = self.client.get(url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.price = Decimal('900.00')
+            self.product.save()
+        updated = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+
+        self.assertEqual(updated.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(updated['ETag'], response['ETag'])
+
+    def test_cart_list_returns_not_modified_until_cart_changes(self):
+        self.client.force_authenticate(self.user)
+        cart_item = Cart.objects.create(
+            user=self.user,
+            product=self.product,
+            quantity=1,
+        )
+        url = reverse('cart-list')
+
+        response = self.assert_not_modified(url)
+        self.assertIn('private', response['Cache-Control'])
+
+        cart_item.quantity = 2
+        cart_item.save()
+        updated = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+
+        self.assertEqual(updated.status_code, status.HTTP_200_OK)
+        self.assertEqual(updated.data['items'][0]['quantity'], 2)
+
+
+class ProductSearchTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.lipstick = Product.objects.create(
+            title='Матовая помада',
+            description='Стойкий цвет и бархатный финиш',
+            pr_type='Помада',
+            price=Decimal('900.00'),
+        )
+        self.cream = Product.objects.create(
+            title='Крем для лица',
+            description='Сияющий финиш и увлажнение',
+            pr_type='Крем',
+            price=Decimal('1200.00'),
+        )
+        self.url = reverse('products-list')
+
+    def get_ids(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [product['id'] for product in response.json()['results']]
+
+    def test_search_matches_title_and_description(self):
+        self.assertEqual(self.get_ids(search='лица'), [self.cream.pk])
+        self.assertEqual(self.get_ids(search='увлажнение'), [self.cream.pk])
+
+    def test_search_requires_every_word(self):
+        self.assertEqual(
+            self.get_ids(search='помада цвет'),
+            [self.lipstick.pk],
+        )
+        self.assertEqual(self.get_ids(search='помада увлажнение'), [])
+
+    def test_search_matches_prefix_of_last_word(self):
+        self.assertEqual(self.get_ids(search='пом'), [self.lipstick.pk])
+        self.assertEqual(
+            get_prefix_search_query('матовая пом'),
+            'матовая & пом:*',
+        )
+        self.assertEqual(
+            get_prefix_search_query('крем & "лица" | !'),
+            'крем & лица:*',
+        )
+        self.assertIsNone(get_prefix_search_query('&|!'))
+
+    def test_search_keeps_explicit_ordering(self):
+        self.assertEqual(
+            self.get_ids(search='финиш', ordering='-price'),
+            [self.cream.pk, self.lipstick.pk],
+        )
+
+
+class ProductSuggestTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        self.media_override = override_settings(MEDIA_ROOT=media_root)
+        self.media_override.enable()
+        self.addCleanup(self.media_override.disable)
+        self.url = reverse('products-suggest')
+        self.products = [
+            Product.objects.create(
+                title=f'Тушь для ресниц {index}',
+                description='Длинное описание товара',
+                pr_type='Тушь',
+                collection='revolution',
+                price=Decimal('500.00') + index,
+            )
+            for index in range(3)
+        ]
+
+    def test_suggest_returns_compact_items(self):
+        product = self.products[0]
+        ProductImage.objects.create(
+            product=product,
+            image=SimpleUploadedFile('suggest.jpg', b'image-bytes'),
+        )
+
+        response = self.client.get(self.url, {'q': 'revolution', 'limit': 2})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        items = response.json()
+        self.assertEqual(len(items), 2)
+        self.assertEqual(
+            set(items[0]),
+            {'id', 'title', 'price', 'image'},
+        )
+        self.assertEqual(items[0]['id'], product.pk)
+        self.assertTrue(items[0]['image'].startswith('http://testserver/'))
+        self.assertIsNone(items[1]['image'])
+
+    def test_short_term_returns_empty_list(self):
+        response = self.client.get(self.url, {'q': 'r'})
+
+        self.assertEqual(response.json(), [])
+
+
+class ProductKeysetPaginationTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.url = reverse('products-list')
+        prices = ('300.00', '100.00', '200.00', '100.00', '300.00')
+        old_prices = ('400.00', None, '250.00', None, '350.00')
+        self.products = [
+            Product.objects.create(
+                title=f'Товар {index}',
+                price=Decimal(price),
+                old_price=None if old_price is None else Decimal(old_price),
+            )
+            for index, (price, old_price) in enumerate(zip(prices, old_prices))
+        ]
+
+    def collect_ids(self, **params):
+        ids = []
+        response = self.client.get(
+            self.url,
+            {'cursor': '', 'page_size': 2, **params},
+        )
+        while True:
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            data = response.json()
+            self.assertNotIn('count', data)
+            ids.extend(product['id'] for product in data['results'])
+            if data['next'] is None:
+                return ids
+            response = self.client.get(data['next'])
+
+    def test_cursor_walks_price_ordering_with_id_tiebreak(self):
+        expected = [
+            product.pk
+            for product in sorted(
+                self.products,
+                key=lambda product: (-product.price, product.pk),
+            )
+        ]
+
+        self.assertEqual(self.collect_ids(ordering='-price'), expected)
+
+    def test_cursor_keeps_null_old_price_last(self):
+        ids = self.collect_ids(ordering='old_price')
+
+        self.assertEqual(ids, [
+            self.products[2].pk,
+            self.products[4].pk,
+            self.products[0].pk,
+            self.products[1].pk,
+            self.products[3].pk,
+        ])
+
+    def test_page_number_mode_stays_default(self):
+        response = self.client.get(self.url, {'page_size': 2})
+
+        self.assertEqual(response.json()['count'], len(self.products))
+
+    def test_invalid_cursor_returns_not_found(self):
+        response = self.client.get(self.url, {'cursor': 'broken'})
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_rank_ordered_search_keeps_page_number_mode(self):
+        request = Request(APIRequestFactory().get(
+            self.url,
+            {'cursor': '', 'page_size': 2},
+        ))
+        queryset = Product.objects.annotate(
+            search_rank=Value(1.0, output_field=FloatField()),
+        ).order_by('-search_rank', '-title', 'pk')
+        paginator = CatalogPagination()
+
+        page = paginator.paginate_queryset(queryset, request)
+
+        self.assertIsNone(paginator.keyset)
+        self.assertEqual(
+            [product.pk for product in page],
+            [self.products[4].pk, self.products[3].pk],
+        )
+
+
+class ProductCountCacheTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.url = reverse('products-list')
+        for index in range(3):
+            Product.objects.create(
+                title=f'Товар {index}',
+                price=Decimal('100.00') + index,
+                is_new=True,
+            )
+
+    def get_count_queries(self, **params):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        count_queries = [
+            query['sql']
+            for query in context.captured_queries
+            if 'COUNT(' in query['sql'].upper()
+        ]
+        return response.json()['count'], len(count_queries)
+
+    def test_count_is_shared_between_pages_and_orderings(self):
+        self.assertEqual(
+            self.get_count_queries(is_new=True, page_size=2),
+            (3, 1),
+        )
+        self.assertEqual(
+            self.get_count_queries(is_new=True, page_size=2, page=2),
+            (3, 0),
+        )
+        self.assertEqual(
+            self.get_count_queries(is_new=True, ordering='-price'),
+            (3, 0),
+        )
+
+    def test_count_is_invalidated_with_catalog_generation(self):
+        self.get_count_queries(is_new=True)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.create(
+                title='Новый товар',
+                price=Decimal('100.00'),
+                is_new=True,
+            )
+
+        self.assertEqual(self.get_count_queries(is_new=True), (4, 1))
+
+
+class ProductFacetsTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.url = reverse('products-facets')
+        self.lipstick = Category.objects.create(
+            slug='lipstick',
+            title='Помады',
+        )
+        self.mascara = Category.objects.create(slug='mascara', title='Туши')
+        first = Product.objects.create(
+            title='Помада',
+            price=Decimal('100.00'),
+            old_price=Decimal('150.00'),
+            country='Франция',
+            is_new=True,
+        )
+        first.categories.set((self.lipstick, self.mascara))
+        second = Product.objects.create(
+            title='Тушь',
+            price=Decimal('300.00'),
+            country='Италия',
+            is_new=False,
+        )
+        second.categories.set((self.mascara,))
+        Product.objects.create(
+            title='Крем',
+            price=Decimal('600.00'),
+            country='Франция',
+        )
+
+    def test_facets_count_current_filter(self):
+        response = self.client.get(
+            self.url,
+            {'categories': 'lipstick,mascara'},
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.json()
+        self.assertEqual(data['count'], 2)
+        self.assertEqual(data['categories'], [
+            {'slug': 'lipstick', 'count': 1},
+            {'slug': 'mascara', 'count': 2},
+        ])
+        self.assertEqual(data['countries'], [
+            {'country': 'Италия', 'count': 1},
+            {'country': 'Франция', 'count': 1},
+        ])
+        self.assertEqual(data['is_new'], 1)
+        self.assertEqual(data['has_discount'], 1)
+
+    def test_price_histogram_covers_range(self):
+        data = self.client.get(self.url).json()
+
+        self.assertEqual(data['price']['min'], 100)
+        self.assertEqual(data['price']['max'], 600)
+        buckets = data['price']['buckets']
+        self.assertEqual(buckets[0]['min'], 100)
+        self.assertGreaterEqual(buckets[-1]['max'], 600)
+        self.assertEqual(sum(bucket['count'] for bucket in buckets), 3)
+
+    def test_facets_are_invalidated_with_catalog_generation(self):
+        self.assertEqual(self.client.get(self.url).json()['count'], 3)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.create(title='Тоник', price=Decimal('200.00'))
+
+        self.assertEqual(self.client.get(self.url).json()['count'], 4)
+
+
+class ProductCardListTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.url = reverse('products-list')
+        category = Category.objects.create(slug='lipstick', title='Помады')
+        for index in range(5):
+            product = Product.objects.create(
+                title=f'Товар {index}',
+                description='Длинное описание товара',
+                pr_type='Помада',
+                price=Decimal('100.00') + index,
+            )
+            product.categories.add(category)
+
+    def test_list_reads_cards_in_single_query(self):
+        # COUNT(*) для пагинации и одна выборка товаров вместе с карточками.
+        with self.assertNumQueries(2):
+            response = self.client.get(self.url)
+
+        product = response.json()['results'][0]
+        self.assertEqual(product['categories'], ['lipstick'])
+        self.assertEqual(product['pr_type'], 'Помада')
+        self.assertIsNone(product['image'])
+        self.assertNotIn('description', product)
+
+    def test_products_without_card_are_skipped(self):
+        product = Product.objects.order_by('pk').first()
+        ProductCard.objects.filter(product=product).delete()
+
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['count'], 4)
+        self.assertNotIn(
+            product.pk,
+            [item['id'] for item in response.json()['results']],
+        )
+
+
+class ProductSparseFieldsTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        category = Category.objects.create(slug='lipstick', title='Помады')
+        self.product = Product.objects.create(
+            title='Помада',
+            description='Длинное описание товара',
+            ingredients='Состав',
+            price=Decimal('100.00'),
+            old_price=Decimal('150.00'),
+        )
+        self.product.categories.add(category)
+
+    def test_list_returns_only_requested_fields(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(
+                reverse('products-list'),
+                {'fields': 'title,price,unknown'},
+            )
+
+        self.assertEqual(
+            response.json()['results'],
+            [{'id': self.product.pk, 'title': 'Помада', 'price': 100.0}],
+        )
+        product_query = context.captured_queries[-1]['sql']
+        self.assertNotIn('category_slugs', product_query)
+        self.assertNotIn('"image"', product_query)
+
+    def test_detail_skips_unrequested_prefetches(self):
+        url = reverse('products-detail', args=(self.product.pk,))
+
+        with self.assertNumQueries(1):
+            response = self.client.get(url, {'fields': 'title,has_discount'})
+
+        self.assertEqual(response.json(), {
+            'id': self.product.pk,
+            'title': 'Помада',
+            'has_discount': True,
+        })
+
+    def test_favorite_overlay_respects_fields(self):
+        user = CustomUser.objects.create_user(
+            email='sparse@example.com',
+            password='password',
+        )
+        Favorites.objects.create(user=user, product=self.product)
+        self.client.force_authenticate(user)
+
+        response = self.client.get(
+            reverse('products-list'),
+            {'fields': 'is_fav'},
+        )
+        self.assertEqual(
+            response.json()['results'],
+            [{'id': self.product.pk, 'is_fav': True}],
+        )
+
+        response = self.client.get(
+            reverse('products-list'),
+            {'fields': 'title'},
+        )
+        self.assertNotIn('is_fav', response.json()['results'][0])
+
+
+class ShortProductImageQueryTests(APITestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        self.media_override = override_settings(MEDIA_ROOT=media_root)
+        self.media_override.enable()
+        self.addCleanup(self.media_override.disable)
+        self.user = CustomUser.objects.create_user(
+            email='images@example.com',
+            password='password',
+        )
+        self.order = Order.objects.create(
+            client=self.user,
+            total_price=Decimal('0.00'),
+            shipping_address='Москва, тестовый адрес',
+        )
+        self.client.force_authenticate(self.user)
+        self.urls = (
+            reverse('cart-list'),
+            reverse('faborites-list'),
+            reverse('orders-list'),
+        )
+
+    def add_products(self, count):
+        for _ in range(count):
+            product = Product.objects.create(
+                title=f'Товар {uuid4().hex}',
+                price=Decimal('100.00'),
+            )
+            for name in ('first.jpg', 'second.jpg'):
+                ProductImage.objects.create(
+                    product=product,
+                    image=SimpleUploadedFile(name, name.encode()),
+                )
+            Cart.objects.create(user=self.user, product=product, quantity=1)
+            Favorites.objects.create(user=self.user, product=product)
+            ProductOrder.objects.create(
+                order=self.order,
+                product=product,
+                product_title=product.title,
+                unit_price=product.price,
+                quantity=1,
+            )
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return len(context.captured_queries)
+
+    def test_query_count_does_not_depend_on_item_count(self):
+        self.add_products(1)
+        single = [self.count_queries(url) for url in self.urls]
+
+        self.add_products(4)
+        several = [self.count_queries(url) for url in self.urls]
+
+        self.assertEqual(several, single)
+
+    def test_first_uploaded_image_is_used(self):
+        self.add_products(1)
+
+        response = self.client.get(reverse('cart-list'))
+
+        image = response.data['items'][0]['product_data']['image']
+        first_image = ProductImage.objects.get(
+            file_hash=md5(b'first.jpg').hexdigest(),
+        )
+        self.assertTrue(image.endswith(first_image.image.name))
+
+
+class CartSummaryTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create_user(
+            email='cart-summary@example.com',
+            password='strong-test-password',
+        )
+        self.lipstick = Product.objects.create(
+            title='Помада для корзины',
+            price=Decimal('1500.00'),
+        )
+        self.mascara = Product.objects.create(
+            title='Тушь для корзины',
+            price=Decimal('700.00'),
+        )
+        self.cart_item = Cart.objects.create(
+            user=self.user,
+            product=self.lipstick,
+            quantity=2,
+        )
+        Cart.objects.create(user=self.user, product=self.mascara, quantity=1)
+
+    def test_cart_list_totals_are_computed_from_items(self):
+        self.client.force_authenticate(self.user)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('cart-list'))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['cart_total'], Decimal('3700.00'))
+        self.assertEqual(response.data['delivery_fee'], DELIVERY_FEE)
+        self.assertEqual(
+            response.data['total_price'],
+            Decimal('3700.00') + DELIVERY_FEE,
+        )
+        self.assertEqual(len(response.data['items']), 2)
+        self.assertFalse(any(
+            'SUM(' in query['sql'].upper()
+            for query in queries.captured_queries
+        ))
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                get_cart_summary(self.user.pk)['cart_total'],
+                Decimal('3700.00'),
+            )
+
+    def test_summary_is_cached_until_cart_changes(self):
+        summary = get_cart_summary(self.user.pk)
+        self.assertEqual(
+            (summary['items_count'], summary['quantity']),
+            (2, 3),
+        )
+        with self.assertNumQueries(0):
+            get_cart_summary(self.user.pk)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.cart_item.quantity = 7
+            self.cart_item.save()
+
+        summary = get_cart_summary(self.user.pk)
+        self.assertEqual(summary['quantity'], 8)
+        self.assertEqual(summary['cart_total'], Decimal('11200.00'))
+        self.assertEqual(summary['delivery_fee'], 0)
+
+    def test_snapshot_computed_before_cart_write_is_not_served(self):
+        # Список прочитал корзину, затем параллельный запрос её изменил,
+        # и только потом список записал свой (уже устаревший) снимок.
+        key = get_cart_summary_cache_key(self.user.pk)
+        stale = get_cart_summary(self.user.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.cart_item.quantity = 7
+            self.cart_item.save()
+        cache_cart_summary(key, stale)
+
+        self.assertEqual(get_cart_summary(self.user.pk)['quantity'], 8)
+
+    def test_summary_follows_product_price_changes(self):
+        get_cart_summary(self.user.pk)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.mascara.price = Decimal('800.00')
+            self.mascara.save()
+
+        self.assertEqual(
+            get_cart_summary(self.user.pk)['cart_total'],
+            Decimal('3800.00'),
+        )
+
+    def test_summary_endpoint_returns_totals_without_items(self):
+        url = reverse('cart-summary')
+        self.assertEqual(
+            self.client.get(url).status_code,
+            status.HTTP_401_UNAUTHORIZED,
+        )
+        self.client.force_authenticate(self.user)
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {
+            'items_count': 2,
+            'quantity': 3,
+            'cart_total': Decimal('3700.00'),
+            'delivery_fee': DELIVERY_FEE,
+            'total_price': Decimal('3700.00') + DELIVERY_FEE,
+        })
+
+        with self.assertNumQueries(0):
+            cached = self.client.get(url)
+        self.assertEqual(cached.data, response.data)
+
+        not_modified = self.client.get(
+            url,
+            HTTP_IF_NONE_MATCH=response['ETag'],
+        )
+        self.assertEqual(
+            not_modified.status_code,
+            status.HTTP_304_NOT_MODIFIED,
+        )
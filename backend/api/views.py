@@ -1,5 +1,7 @@
 import logging
 import json
+import re
+from functools import cached_property
 from uuid import UUID
 
 import jwt
@@ -7,35 +9,41 @@ from decimal import Decimal, InvalidOperation
 
 from django.conf import settings
 from django.db import IntegrityError, transaction
-from django.db.models import F, Sum
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
 from django_filters.rest_framework import DjangoFilterBackend
-from django.utils.decorators import method_decorator
-from django.views.decorators.cache import cache_page
 from rest_framework import decorators, filters, mixins, status, views, viewsets
 from rest_framework.exceptions import MethodNotAllowed, ValidationError
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 
 from api.exceptions import ExternalAPIError
-from api.filters import ProductFilter
-from api.mixins import PublicCacheViewSetMixin
+from api.filters import ProductFilter, ProductSearchFilter
+from api.mixins import ConditionalResponseMixin, PublicCacheViewSetMixin
 from api.serializers import (CartSerializer, CategorySerializer,
                              FavoritesSerializer, OrdersSerializer,
-                             ProductSerializer, PromocodeSerializer,
+                             ProductCardSerializer, ProductSerializer,
+                             ProductSuggestionSerializer, PromocodeSerializer,
                              SectionSerializer)
-from store.constants import DELIVERY_FEE, FREE_DELIVERY_TRESHOLD
+from store.cache import get_favorite_product_ids
+from store.cart import (cache_cart_summary, get_cart_summary,
+                        get_cart_summary_cache_key, summarize_cart_items)
+from store.facets import get_product_facets
 from store.models import (Cart, Category, Favorites, Order, PaymentAttempt,
                           Product, ProductOrder, Promocode, Section)
 from store.notifications import enqueue_payment_alert_notification
+from store.pagination import CatalogPagination
+from store.search import suggest_products
 from store.services import (apply_payment_status_by_operation, create_link,
                             prepare_payment)
 
 logger = logging.getLogger(__name__)
 
+IS_FAV_FALSE_PATTERN = re.compile(rb'"is_fav":false')
 
-class CategoryViewSet(PublicCacheViewSetMixin,
+
+class CategoryViewSet(ConditionalResponseMixin,
+                      PublicCacheViewSetMixin,
                       mixins.RetrieveModelMixin,
                       mixins.ListModelMixin,
                       viewsets.GenericViewSet):
@@ -43,9 +51,11 @@ class CategoryViewSet(PublicCacheViewSetMixin,
     serializer_class = CategorySerializer
     lookup_field = 'slug'
     pagination_class = None
+    cache_dependencies = ('category',)
 
 
-class SectionViewSet(PublicCacheViewSetMixin,
+class SectionViewSet(ConditionalResponseMixin,
+                     PublicCacheViewSetMixin,
                      mixins.RetrieveModelMixin,
                      mixins.ListModelMixin,
                      viewsets.GenericViewSet):
@@ -53,75 +63,252 @@ class SectionViewSet(PublicCacheViewSetMixin,
     serializer_class = SectionSerializer
     lookup_field = 'slug'
     pagination_class = None
+    cache_dependencies = ('section', 'category')
 
 
-class ProductViewSet(PublicCacheViewSetMixin,
+class ProductViewSet(ConditionalResponseMixin,
+                     PublicCacheViewSetMixin,
                      mixins.RetrieveModelMixin,
                      mixins.ListModelMixin,
                      viewsets.GenericViewSet):
     queryset = Product.objects.prefetch_related('images', 'categories').all()
     serializer_class = ProductSerializer
     filter_backends = (
-        DjangoFilterBackend, filters.OrderingFilter, filters.SearchFilter
+        DjangoFilterBackend, filters.OrderingFilter, ProductSearchFilter
     )
     filterset_class = ProductFilter
+    pagination_class = CatalogPagination
     search_fields = ('title', 'description', 'pr_type')
     ordering_fields = ('price', 'old_price', 'title')
+    cache_dependencies = ('product', 'productimage', 'category')
+    cache_timeouts = {
+        **PublicCacheViewSetMixin.cache_timeouts,
+        'suggest': 60,
+        'facets': 60 * 60,
+    }
+    suggest_min_length = 2
+    suggest_limit = 8
+    suggest_max_limit = 20
+    fields_query_param = 'fields'
+    # Колонки, которые нужны каждому полю карточки в списке.
+    list_field_columns = {
+        'title': ('card__title',),
+        'price': ('card__price',),
+        'old_price': ('card__old_price',),
+        'pr_type': ('card__pr_type',),
+        'has_discount': ('card__has_discount',),
+        'is_new': ('card__is_new',),
+        'country': ('card__country',),
+        'categories': ('card__category_slugs',),
+        'image': ('card__image',),
+        'image_variants': ('card__image_variants',),
+    }
+    # Поля детального ответа, которые не совпадают с колонкой товара.
+    detail_field_columns = {
+        'has_discount': ('price', 'old_price'),
+        'is_fav': (),
+        'images': (),
+        'categories': (),
+    }
+    detail_prefetch_fields = ('images', 'categories')
+
+    @cached_property
+    def sparse_fields(self):
+        '''
+        Поля из ?fields=; None, если параметр не передан или пуст.
+        '''
+        requested = {
+            field_name.strip()
+            for field_name in self.request.query_params.get(
+                self.fields_query_param, ''
+            ).split(',')
+        }
+        available = tuple(self.get_serializer_class()().fields)
+        # id нужен всегда: по нему подмешивается is_fav.
+        fields = tuple(
+            field_name
+            for field_name in available
+            if field_name in requested or field_name == 'id'
+        )
+        if len(fields) <= 1 and 'id' not in requested:
+            return None
+        return fields
 
-    def enrich_response_data(self, data):
-        if self.action == 'retrieve':
-            products = [data]
-        elif isinstance(data, dict) and 'results' in data:
-            products = data['results']
-        else:
-            products = data
-
-        product_ids = {product['id'] for product in products}
-        favorite_ids = set()
-
-        if self.request.user.is_authenticated and product_ids:
-            favorite_ids = set(
-                Favorites.objects.filter(
-                    user=self.request.user,
-                    product_id__in=product_ids,
-                ).values_list('product_id', flat=True)
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        if self.action in ('list', 'retrieve'):
+            context['fields'] = self.sparse_fields
+        return context
+
+    def get_queryset(self):
+        if self.action == 'list':
+            return self.get_list_queryset()
+        if self.action == 'retrieve' and self.sparse_fields is not None:
+            return self.get_sparse_detail_queryset()
+        return super().get_queryset()
+
+    def get_list_queryset(self):
+        columns = [
+            column
+            for field_name in self.sparse_fields or self.list_field_columns
+            for column in self.list_field_columns.get(field_name, ())
+        ]
+        # Поля товара нужны только для сортировки и курсора пагинации.
+        # Товар без карточки (ещё не пересчитана) в список не попадает.
+        queryset = Product.objects.filter(card__isnull=False).only(
+            *self.ordering_fields,
+            *columns,
+        )
+        if columns:
+            queryset = queryset.select_related('card')
+        return queryset
+
+    def get_sparse_detail_queryset(self):
+        columns = [
+            column
+            for field_name in self.sparse_fields
+            for column in self.detail_field_columns.get(
+                field_name,
+                (field_name,),
             )
+        ]
+        return Product.objects.prefetch_related(*(
+            field_name
+            for field_name in self.detail_prefetch_fields
+            if field_name in self.sparse_fields
+        )).only(*columns)
+
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return ProductCardSerializer
+        return super().get_serializer_class()
+
+    def needs_response_enrichment(self):
+        return (
+            self.action in ('list', 'retrieve')
+            and self.request.user.is_authenticated
+        )
+
+    @decorators.action(detail=False, methods=('get',))
+    def facets(self, request):
+        return self.get_cached_response('facets', self.get_facets)
+
+    def get_facets(self):
+        queryset = self.filter_queryset(Product.objects.all())
+        return Response(get_product_facets(queryset))
+
+    @decorators.action(detail=False, methods=('get',))
+    def suggest(self, request):
+        return self.get_cached_response('suggest', self.get_suggestions)
+
+    def get_suggestions(self):
+        term = self.request.query_params.get('q', '').strip()
+        if len(term) < self.suggest_min_length:
+            return Response([])
+
+        try:
+            limit = int(self.request.query_params.get(
+                'limit',
+                self.suggest_limit,
+            ))
+        except ValueError:
+            limit = self.suggest_limit
+        limit = max(1, min(limit, self.suggest_max_limit))
+
+        serializer = ProductSuggestionSerializer(
+            suggest_products(term, limit),
+            many=True,
+            context=self.get_serializer_context(),
+        )
+        return Response(serializer.data)
+
+    def get_response_products(self, data):
+        if self.action == 'retrieve':
+            return [data]
+        if isinstance(data, dict) and 'results' in data:
+            return data['results']
+        return data
+
+    def build_cache_entry(self, data, timeout):
+        entry = super().build_cache_entry(data, timeout)
+        products = self.get_response_products(data)
+        # `"is_fav":false` не может встретиться внутри JSON-строки (кавычки
+        # в ней экранируются), поэтому вхождения идут строго по товарам.
+        offsets = [
+            match.end() - len(b'false')
+            for match in IS_FAV_FALSE_PATTERN.finditer(entry['content'])
+        ]
+        if len(offsets) == len(products):
+            entry['is_fav_offsets'] = {
+                product['id']: offset
+                for product, offset in zip(products, offsets)
+            }
+        return entry
+
+    def patch_cached_content(self, entry):
+        offsets = entry.get('is_fav_offsets')
+        if offsets is None:
+            return None
+
+        favorite_ids = get_favorite_product_ids(self.request.user.pk)
+        matched_ids = favorite_ids.intersection(offsets)
+        if not matched_ids:
+            return entry['content']
+
+        content = bytearray(entry['content'])
+        for product_id in matched_ids:
+            offset = offsets[product_id]
+            # `true ` той же длины, что и `false`: смещения не сдвигаются.
+            content[offset:offset + 5] = b'true '
+        return bytes(content)
+
+    def enrich_response_data(self, data):
+        products = self.get_response_products(data)
+        favorite_ids = frozenset()
+
+        if not self.needs_response_enrichment():
+            return data
+
+        if products:
+            favorite_ids = get_favorite_product_ids(self.request.user.pk)
 
         for product in products:
-            product['is_fav'] = product['id'] in favorite_ids
+            if 'is_fav' in product:
+                product['is_fav'] = product['id'] in favorite_ids
 
         return data
 
 
-class CartViewSet(viewsets.ModelViewSet):
+class CartViewSet(ConditionalResponseMixin, viewsets.ModelViewSet):
     serializer_class = CartSerializer
     permission_classes = (IsAuthenticated,)
     pagination_class = None
 
     def get_queryset(self):
         return self.request.user.cart_items.select_related(
-            'product').prefetch_related('product__images')
+            'product__primary_image')
 
     def list(self, request, *args, **kwargs):
-        response = super().list(request, *args, **kwargs)
-
-        cart_total = self.get_queryset().aggregate(
-            total=Sum(F('product__price') * F('quantity'))
-        )['total'] or Decimal('0.00')
-
-        if cart_total >= FREE_DELIVERY_TRESHOLD:
-            delivery_fee = 0
-        else:
-            delivery_fee = DELIVERY_FEE
-
-        response.data = {
-            'cart_total': cart_total,
-            'delivery_fee': delivery_fee,
-            'total_price': cart_total + delivery_fee,
-            'items': response.data
-        }
-
-        return response
+        # Ключ берётся до чтения корзины: если её изменят параллельно,
+        # снимок ляжет под устаревшую версию и не будет прочитан.
+        summary_key = get_cart_summary_cache_key(request.user.pk)
+        cart_items = list(self.filter_queryset(self.get_queryset()))
+        # Итоги считаются по уже загруженным позициям и заодно
+        # обновляют кэшированный снимок корзины.
+        summary = summarize_cart_items(cart_items)
+        cache_cart_summary(summary_key, summary)
+
+        return Response({
+            'cart_total': summary['cart_total'],
+            'delivery_fee': summary['delivery_fee'],
+            'total_price': summary['total_price'],
+            'items': self.get_serializer(cart_items, many=True).data,
+        })
+
+    @decorators.action(detail=False, methods=('get',))
+    def summary(self, request):
+        # Для счётчика в шапке: без позиций, из кэша или одним агрегатом.
+        return Response(get_cart_summary(request.user.pk))
 
     def perform_create(self, serializer):
         cart_item, created = Cart.objects.get_or_create(
@@ -151,7 +338,7 @@ class FavoritesViewSet(mixins.RetrieveModelMixin,
 
     def get_queryset(self):
         return self.request.user.favorite_products.select_related(
-            'product').prefetch_related('product__images')
+            'product__primary_image')
 
     def perform_create(self, serializer):
         favorite_item, created = Favorites.objects.get_or_create(
@@ -178,12 +365,19 @@ class FavoritesViewSet(mixins.RetrieveModelMixin,
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
-class CountryListView(views.APIView):
+class CountryListView(ConditionalResponseMixin,
+                      PublicCacheViewSetMixin,
+                      views.APIView):
     '''
     Возвращает список всех стран, указанных в продуктах.
     '''
-    @method_decorator(cache_page(60 * 10))
+    action = 'list'
+    cache_dependencies = ('product',)
+
     def get(self, request):
+        return self.get_cached_response('list', self.get_countries)
+
+    def get_countries(self):
         countries = (
             Product.objects
             .exclude(country__isnull=True)
@@ -201,6 +395,7 @@ class PromoViewSet(PublicCacheViewSetMixin,
     queryset = Promocode.objects.filter(active=True)
     serializer_class = PromocodeSerializer
     lookup_field = 'code'
+    cache_dependencies = ('promocode',)
 
     def get_object(self):
         code = self.kwargs.get(self.lookup_field)
@@ -350,7 +545,7 @@ class OrderViewSet(mixins.ListModelMixin,
         return self.request.user.orders.select_related(
             'promo'
         ).prefetch_related(
-            'productorder_set__product'
+            'productorder_set__product__primary_image'
         ).order_by('-pk')
 
     def create(self, request, *args, **kwargs):
@@ -2,18 +2,34 @@ import logging
 
 from django import forms
 from django.contrib import admin, messages
+from django.core.exceptions import PermissionDenied
 from django.db import transaction
 from django.http import HttpResponseRedirect
+from django.shortcuts import get_object_or_404
 from django.template.response import TemplateResponse
-
-from store.importers.products_excel import import_products_from_excel
-from store.models import (Category, Order, PaymentAttempt, Product,
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.html import format_html, format_html_join
+
+from store.cards import update_primary_images
+from store.constants import PRODUCT_IMAGE_MAX_SIZE
+from store.importers.products_excel import ProductImportResult
+from store.models import (Category, ImportJob, Order, PaymentAttempt, Product,
                           ProductImage, ProductOrder, Promocode, Section)
-from store.tasks import sync_pending_order_statuses
+from store.tasks import import_products_job, sync_pending_order_statuses
 
 logger = logging.getLogger(__name__)
 
-PRODUCT_IMAGE_MAX_SIZE = 20 * 1024 * 1024
+PRODUCT_COPY_EXCLUDED_FIELDS = (
+    'title',
+    'primary_image',
+    'import_hash',
+    'search_vector',
+)
+IMPORT_CHANGE_LABELS = {
+    'new': 'новый товар',
+    'changed': 'изменён',
+}
 
 
 class ProductImageAdminForm(forms.ModelForm):
@@ -94,7 +110,14 @@ class SectionAdmin(admin.ModelAdmin):
 
 
 class ExcelImportForm(forms.Form):
-    file = forms.FileField(label='Выберите Excel-файл (.xlsx или .xls)')
+    file = forms.FileField(
+        label='Выберите файл (.xlsx, .xls или .csv)',
+    )
+    dry_run = forms.BooleanField(
+        label='Только предпросмотр изменений',
+        required=False,
+        initial=True,
+    )
 
 
 @admin.register(Product)
@@ -119,16 +142,20 @@ class ProductAdmin(admin.ModelAdmin):
 
     @admin.action(description='Дублировать выбранные товары')
     def duplicate_products(self, request, queryset):
-        created_count = 0
+        copy_ids = []
 
         with transaction.atomic():
             for product in queryset.prefetch_related('categories', 'images'):
                 categories = list(product.categories.all())
                 images = list(product.images.all())
+                # Хэш импорта не копируется, иначе следующий импорт сочтёт
+                # копию неизменённой. search_vector пересчитывает
+                # Product.save по новому названию.
                 values = {
                     field.name: getattr(product, field.name)
                     for field in Product._meta.concrete_fields
-                    if not field.primary_key and field.name != 'title'
+                    if not field.primary_key
+                    and field.name not in PRODUCT_COPY_EXCLUDED_FIELDS
                 }
                 product_copy = Product.objects.create(
                     title=self._get_copy_title(product.title),
@@ -140,14 +167,19 @@ class ProductAdmin(admin.ModelAdmin):
                         product=product_copy,
                         image=image.image.name,
                         file_hash=image.file_hash,
+                        position=image.position,
+                        variants=image.variants,
                     )
                     for image in images
                 ])
-                created_count += 1
+                copy_ids.append(product_copy.pk)
+            # bulk_create не вызывает сигналов, главное изображение
+            # проставляется одним запросом для всех копий.
+            update_primary_images(copy_ids)
 
         self.message_user(
             request,
-            f'Создано копий товаров: {created_count}.',
+            f'Создано копий товаров: {len(copy_ids)}.',
             level=messages.SUCCESS,
         )
 
@@ -180,20 +212,20 @@ class ProductAdmin(admin.ModelAdmin):
         return custom_urls + urls
 
     def import_excel(self, request):
+        if not has_import_permission(request):
+            raise PermissionDenied
         if request.method == 'POST':
             form = ExcelImportForm(request.POST, request.FILES)
             if form.is_valid():
-                result = import_products_from_excel(form.cleaned_data['file'])
-                self.message_user(
-                    request,
-                    ' '.join(result.to_messages()),
-                    level=(
-                        messages.WARNING
-                        if result.has_warnings
-                        else messages.SUCCESS
-                    ),
+                job = ImportJob.objects.create(
+                    file=form.cleaned_data['file'],
+                    dry_run=form.cleaned_data['dry_run'],
+                    created_by=request.user,
+                )
+                enqueue_import_job(self, request, job)
+                return HttpResponseRedirect(
+                    reverse('admin:store_importjob_change', args=(job.pk,))
                 )
-                return HttpResponseRedirect('../')
         else:
             form = ExcelImportForm()
 
@@ -205,6 +237,173 @@ class ProductAdmin(admin.ModelAdmin):
         return TemplateResponse(request, 'admin/import_form.html', context)
 
 
+def has_import_permission(request):
+    '''
+    Импорт создаёт и меняет товары, поэтому нужны оба права на Product.
+    '''
+    return request.user.has_perms(
+        ('store.add_product', 'store.change_product'),
+    )
+
+
+def enqueue_import_job(model_admin, request, job):
+    try:
+        task = import_products_job.delay(job.pk)
+    except Exception as exc:
+        logger.exception(
+            'Could not enqueue product import: job_id=%s',
+            job.pk,
+        )
+        ImportJob.objects.filter(pk=job.pk).update(
+            status=ImportJob.Status.FAILED,
+            error_message=f'Не удалось поставить задачу: {exc}',
+            finished_at=timezone.now(),
+        )
+        model_admin.message_user(
+            request,
+            f'Не удалось поставить задачу импорта: {exc}',
+            level=messages.ERROR,
+        )
+        return
+
+    ImportJob.objects.filter(pk=job.pk).update(task_id=task.id)
+    model_admin.message_user(
+        request,
+        'Файл загружен, импорт выполняется в фоне.',
+        level=messages.SUCCESS,
+    )
+
+
+@admin.register(ImportJob)
+class ImportJobAdmin(admin.ModelAdmin):
+    list_display = (
+        'id',
+        'status',
+        'dry_run',
+        'progress_display',
+        'imported',
+        'created_by',
+        'created_at',
+        'finished_at',
+    )
+    list_filter = ('status', 'dry_run')
+    readonly_fields = (
+        'file',
+        'dry_run',
+        'status',
+        'progress_display',
+        'result_summary',
+        'changes_preview',
+        'error_message',
+        'task_id',
+        'created_by',
+        'created_at',
+        'started_at',
+        'finished_at',
+    )
+    fields = readonly_fields
+    change_form_template = 'admin/import_job_change_form.html'
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def render_change_form(self, request, context, *args, **kwargs):
+        context['has_import_permission'] = has_import_permission(request)
+        return super().render_change_form(request, context, *args, **kwargs)
+
+    @admin.display(description='Прогресс')
+    def progress_display(self, obj):
+        return format_html(
+            '<progress max="100" value="{}"></progress> {} / {}',
+            obj.progress,
+            obj.processed_rows,
+            obj.total_rows,
+        )
+
+    @admin.display(description='Импортировано')
+    def imported(self, obj):
+        return obj.result.get('imported', 0)
+
+    @admin.display(description='Результат')
+    def result_summary(self, obj):
+        if not obj.result:
+            return '—'
+        return ' '.join(ProductImportResult(**obj.result).to_messages())
+
+    @admin.display(description='Изменения')
+    def changes_preview(self, obj):
+        changes = obj.result.get('changes', ())
+        removed_titles = obj.result.get('removed_titles', ())
+        if not changes and not removed_titles:
+            return '—'
+        return format_html(
+            '<ul>{}{}</ul>',
+            format_html_join(
+                '',
+                '<li>Строка {}: {} — {} {}</li>',
+                (
+                    (
+                        change['row'],
+                        change['title'],
+                        IMPORT_CHANGE_LABELS[change['status']],
+                        ', '.join(change['fields']),
+                    )
+                    for change in changes
+                ),
+            ),
+            format_html_join(
+                '',
+                '<li>{} — нет в файле</li>',
+                ((title,) for title in removed_titles),
+            ),
+        )
+
+    def get_urls(self):
+        from django.urls import path
+
+        urls = super().get_urls()
+        custom_urls = [
+            path(
+                '<int:object_id>/apply/',
+                self.admin_site.admin_view(self.apply_dry_run),
+                name='store_importjob_apply',
+            ),
+        ]
+        return custom_urls + urls
+
+    def apply_dry_run(self, request, object_id):
+        '''
+        Запускает настоящий импорт файла после просмотра изменений.
+        '''
+        preview = get_object_or_404(
+            ImportJob,
+            pk=object_id,
+            dry_run=True,
+            status=ImportJob.Status.SUCCEEDED,
+        )
+        if not has_import_permission(request):
+            raise PermissionDenied
+        if request.method != 'POST' or not self.has_view_permission(
+            request,
+            preview,
+        ):
+            return HttpResponseRedirect(
+                reverse('admin:store_importjob_change', args=(preview.pk,))
+            )
+
+        job = ImportJob.objects.create(
+            file=preview.file.name,
+            created_by=request.user,
+        )
+        enqueue_import_job(self, request, job)
+        return HttpResponseRedirect(
+            reverse('admin:store_importjob_change', args=(job.pk,))
+        )
+
+
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
     list_display = (
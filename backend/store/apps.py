@@ -5,3 +5,6 @@ class StoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'store'
     verbose_name = 'Магазин'
+
+    def ready(self):
+        import store.signals  # noqa: F401
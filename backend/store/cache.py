@@ -0,0 +1,163 @@
+import hashlib
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from django.core.cache import cache
+from django.db import transaction
+
+from store.models import Favorites
+
+logger = logging.getLogger(__name__)
+
+CATALOG_CACHE_MODELS = (
+    'product',
+    'productimage',
+    'category',
+    'section',
+    'promocode',
+)
+
+# Модели, от которых зависят счётчики по фильтрам каталога.
+CATALOG_FILTER_CACHE_MODELS = ('product', 'category')
+# Параметры запроса, не влияющие на набор отфильтрованных товаров.
+CATALOG_FILTER_IGNORED_PARAMS = frozenset(
+    ('page', 'page_size', 'ordering', 'cursor', 'fields', 'format')
+)
+
+FAVORITE_IDS_CACHE_TIMEOUT = 60 * 60 * 24
+
+_deferred = threading.local()
+
+
+def get_cache_generation_key(model_name):
+    return f'catalog:generation:{model_name}'
+
+
+def _initial_generation():
+    # Начальное значение зависит от времени, чтобы после вытеснения ключа
+    # из Redis поколение не совпало со старым и не открыло устаревший кэш.
+    return time.time_ns() // 1000
+
+
+def get_cache_generations(model_names):
+    '''
+    Возвращает текущие поколения кэша для перечисленных моделей.
+    '''
+    keys = {
+        model_name: get_cache_generation_key(model_name)
+        for model_name in model_names
+    }
+    stored = cache.get_many(keys.values())
+
+    generations = {}
+    for model_name, key in keys.items():
+        generation = stored.get(key)
+        if generation is None:
+            cache.add(key, _initial_generation(), timeout=None)
+            generation = cache.get(key)
+        generations[model_name] = generation
+    return generations
+
+
+def _bump(model_names):
+    for model_name in model_names:
+        key = get_cache_generation_key(model_name)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, _initial_generation(), timeout=None)
+        except Exception:
+            logger.exception(
+                'Could not bump catalog cache generation: model=%s',
+                model_name,
+            )
+
+
+def bump_cache_generation(*model_names):
+    '''
+    Инвалидирует публичный кэш моделей после коммита транзакции.
+    '''
+    pending = getattr(_deferred, 'model_names', None)
+    if pending is not None:
+        pending.update(model_names)
+        return
+
+    transaction.on_commit(lambda: _bump(model_names))
+
+
+@contextmanager
+def defer_cache_invalidation():
+    '''
+    Собирает инвалидации внутри блока и выполняет их один раз на выходе.
+
+    Используется массовыми операциями (импорт), чтобы не сбрасывать
+    поколение кэша на каждой сохранённой строке.
+    '''
+    if getattr(_deferred, 'model_names', None) is not None:
+        yield
+        return
+
+    _deferred.model_names = set()
+    try:
+        yield
+    finally:
+        model_names = _deferred.model_names
+        _deferred.model_names = None
+        if model_names:
+            transaction.on_commit(lambda: _bump(model_names))
+
+
+def get_catalog_filter_cache_key(prefix, query_params):
+    '''
+    Ключ кэша для набора фильтров каталога.
+
+    Не зависит от страницы, сортировки и порядка параметров и сбрасывается
+    вместе с поколением товаров и категорий.
+    '''
+    params = sorted(
+        (name, sorted(
+            value.strip()
+            for value in query_params.getlist(name)
+            if value.strip()
+        ))
+        for name in query_params
+        if name not in CATALOG_FILTER_IGNORED_PARAMS
+    )
+    digest = hashlib.sha256(
+        json.dumps([param for param in params if param[1]]).encode()
+    ).hexdigest()
+    generations = get_cache_generations(CATALOG_FILTER_CACHE_MODELS)
+    version = '.'.join(
+        str(generations[model_name])
+        for model_name in CATALOG_FILTER_CACHE_MODELS
+    )
+    return f'catalog:{prefix}:{version}:{digest}'
+
+
+def get_favorite_ids_cache_key(user_id):
+    return f'favorites:ids:{user_id}'
+
+
+def get_favorite_product_ids(user_id):
+    '''
+    Возвращает множество id избранных товаров пользователя из кэша.
+    '''
+    key = get_favorite_ids_cache_key(user_id)
+    product_ids = cache.get(key)
+    if product_ids is None:
+        product_ids = frozenset(
+            Favorites.objects.filter(
+                user_id=user_id,
+            ).values_list('product_id', flat=True)
+        )
+        cache.set(key, product_ids, timeout=FAVORITE_IDS_CACHE_TIMEOUT)
+    return product_ids
+
+
+def invalidate_favorite_product_ids(user_id):
+    transaction.on_commit(
+        lambda: cache.delete(get_favorite_ids_cache_key(user_id))
+    )
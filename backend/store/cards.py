@@ -0,0 +1,135 @@
+import threading
+from contextlib import contextmanager
+
+from django.db.models import OuterRef, Subquery
+
+from store.models import Product, ProductCard, ProductImage
+
+PRODUCT_CARD_FIELDS = (
+    'title',
+    'price',
+    'old_price',
+    'pr_type',
+    'has_discount',
+    'is_new',
+    'country',
+    'image',
+    'image_variants',
+    'category_slugs',
+    'updated_at',
+)
+PRODUCT_CARD_BATCH_SIZE = 500
+
+_deferred = threading.local()
+
+
+def build_product_card(product):
+    '''
+    Собирает карточку из товара с загруженными primary_image и categories.
+    '''
+    return ProductCard(
+        product=product,
+        title=product.title,
+        price=product.price,
+        old_price=product.old_price,
+        pr_type=product.pr_type,
+        has_discount=product.has_discount,
+        is_new=product.is_new,
+        country=product.country,
+        image=(
+            product.primary_image.image.name
+            if product.primary_image_id
+            else ''
+        ),
+        image_variants=(
+            product.primary_image.variants.get('items', [])
+            if product.primary_image_id
+            else []
+        ),
+        category_slugs=sorted(
+            category.slug for category in product.categories.all()
+        ),
+    )
+
+
+def _refresh(product_ids):
+    product_ids = sorted(set(product_ids))
+    for start in range(0, len(product_ids), PRODUCT_CARD_BATCH_SIZE):
+        products = Product.objects.filter(
+            pk__in=product_ids[start:start + PRODUCT_CARD_BATCH_SIZE],
+        ).select_related('primary_image').prefetch_related('categories')
+        ProductCard.objects.bulk_create(
+            [build_product_card(product) for product in products],
+            update_conflicts=True,
+            unique_fields=('product',),
+            update_fields=PRODUCT_CARD_FIELDS,
+        )
+
+
+def refresh_product_cards(product_ids):
+    '''
+    Пересчитывает карточки перечисленных товаров.
+    '''
+    pending = getattr(_deferred, 'product_ids', None)
+    if pending is not None:
+        pending.update(product_ids)
+        return
+
+    _refresh(product_ids)
+
+
+def update_primary_images(product_ids):
+    '''
+    Проставляет товарам главное изображение (наименьший position) одним
+    UPDATE и обновляет их карточки.
+    '''
+    product_ids = list(product_ids)
+    Product.objects.filter(pk__in=product_ids).update(
+        primary_image=Subquery(
+            ProductImage.objects
+            .filter(product=OuterRef('pk'))
+            .order_by('position', 'pk')
+            .values('pk')[:1]
+        ),
+    )
+    refresh_product_cards(product_ids)
+
+
+def refresh_all_product_cards():
+    _refresh(Product.objects.values_list('pk', flat=True))
+
+
+def flush_product_card_refresh():
+    '''
+    Выполняет накопленные в defer_product_card_refresh() обновления,
+    не выходя из блока. Импорт вызывает её после каждой сохранённой пачки,
+    чтобы новые товары получали карточки сразу, а не в конце файла.
+    '''
+    pending = getattr(_deferred, 'product_ids', None)
+    if not pending:
+        return
+
+    product_ids = set(pending)
+    pending.clear()
+    _refresh(product_ids)
+
+
+@contextmanager
+def defer_product_card_refresh():
+    '''
+    Собирает обновления карточек внутри блока и выполняет их один раз
+    на выходе, как defer_cache_invalidation для кэша. Карточки
+    пересчитываются и при исключении: изменения, уже записанные в БД
+    до ошибки, не должны остаться без карточек.
+    '''
+    if getattr(_deferred, 'product_ids', None) is not None:
+        yield
+        return
+
+    product_ids = _deferred.product_ids = set()
+    try:
+        yield
+    finally:
+        _deferred.product_ids = None
+        if product_ids:
+            _refresh(product_ids)
@@ -0,0 +1,113 @@
+import time
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, F, Sum
+
+from store.cache import get_cache_generations
+from store.constants import DELIVERY_FEE, FREE_DELIVERY_TRESHOLD
+from store.models import Cart
+
+CART_SUMMARY_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def build_cart_summary(items_count, quantity, cart_total):
+    if cart_total >= FREE_DELIVERY_TRESHOLD:
+        delivery_fee = 0
+    else:
+        delivery_fee = DELIVERY_FEE
+
+    return {
+        'items_count': items_count,
+        'quantity': quantity,
+        'cart_total': cart_total,
+        'delivery_fee': delivery_fee,
+        'total_price': cart_total + delivery_fee,
+    }
+
+
+def summarize_cart_items(cart_items):
+    '''
+    Итоги корзины по уже загруженным позициям, без отдельного запроса.
+    '''
+    quantity = 0
+    cart_total = Decimal('0.00')
+    for cart_item in cart_items:
+        quantity += cart_item.quantity
+        cart_total += cart_item.product.price * cart_item.quantity
+    return build_cart_summary(len(cart_items), quantity, cart_total)
+
+
+def get_cart_version_key(user_id):
+    return f'cart:version:{user_id}'
+
+
+def get_cart_version(user_id):
+    key = get_cart_version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        # Начальное значение от времени, как у поколений кэша каталога:
+        # после вытеснения ключа версия не совпадёт со старой.
+        cache.add(
+            key,
+            time.time_ns() // 1000,
+            timeout=CART_SUMMARY_CACHE_TIMEOUT,
+        )
+        version = cache.get(key)
+    return version
+
+
+def get_cart_summary_cache_key(user_id):
+    '''
+    Ключ снимка корзины. Его нужно получить до чтения корзины из БД.
+
+    В ключе версия корзины, которую увеличивает каждая запись в корзину,
+    и поколение товаров: изменение цены (в том числе импортом) делает
+    снимки всех корзин неактуальными без их перебора. Снимок, посчитанный
+    до параллельной записи, ляжет под старый ключ и не будет прочитан.
+    '''
+    generation = get_cache_generations(('product',))['product']
+    version = get_cart_version(user_id)
+    return f'cart:summary:{user_id}:{version}:{generation}'
+
+
+def get_cart_summary(user_id):
+    '''
+    Возвращает итоги корзины пользователя из кэша или одним агрегатом.
+    '''
+    key = get_cart_summary_cache_key(user_id)
+    summary = cache.get(key)
+    if summary is None:
+        totals = Cart.objects.filter(user_id=user_id).aggregate(
+            items_count=Count('pk'),
+            quantity_sum=Sum('quantity'),
+            cart_total=Sum(F('product__price') * F('quantity')),
+        )
+        summary = build_cart_summary(
+            totals['items_count'],
+            totals['quantity_sum'] or 0,
+            totals['cart_total'] or Decimal('0.00'),
+        )
+        cache.set(key, summary, timeout=CART_SUMMARY_CACHE_TIMEOUT)
+    return summary
+
+
+def cache_cart_summary(key, summary):
+    cache.set(key, summary, timeout=CART_SUMMARY_CACHE_TIMEOUT)
+
+
+def _bump_cart_version(user_id):
+    key = get_cart_version_key(user_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(
+            key,
+            time.time_ns() // 1000,
+            timeout=CART_SUMMARY_CACHE_TIMEOUT,
+        )
+
+
+def invalidate_cart_summary(user_id):
+    transaction.on_commit(lambda: _bump_cart_version(user_id))
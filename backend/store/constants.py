@@ -48,3 +48,34 @@ EXCEL_IMPORT_TRUE_VALUES = {'да', 'true', '1', 'yes', 'y'}
 EXCEL_IMPORT_FALSE_VALUES = {'нет', 'false', '0', 'no', 'n'}
 EXCEL_IMPORT_FULL_WEIGHT_COLUMN = 'Вес полный'
 EXCEL_IMPORT_PACKAGED_WEIGHT_KG_COLUMN = 'Вес с упаковкой (кг)'
+
+PRODUCT_IMAGE_VARIANT_WIDTHS = (320, 640, 1280)  # Ширины превью, px
+PRODUCT_IMAGE_VARIANT_FORMATS = ('avif', 'webp')  # Форматы превью
+PRODUCT_IMAGE_VARIANT_QUALITY = 80  # Качество сжатия превью
+# Расширения файлов изображений по формату Pillow, остальные — по имени
+# формата в нижнем регистре
+PRODUCT_IMAGE_FORMAT_EXTENSIONS = {'JPEG': '.jpg', 'MPO': '.jpg'}
+# Синонимы расширений в именах файлов, если формат не распознан
+PRODUCT_IMAGE_EXTENSION_ALIASES = {
+    '.jpeg': '.jpg',
+    '.jpe': '.jpg',
+    '.jfif': '.jpg',
+    '.tif': '.tiff',
+}
+# Файлы моложе этого срока не удаляются как неиспользуемые, сек
+PRODUCT_IMAGE_ORPHAN_GRACE_PERIOD = 60 * 60
+
+PRODUCT_IMAGE_MAX_SIZE = 20 * 1024 * 1024  # Максимальный размер фото, байт
+EXCEL_IMPORT_IMAGE_WORKERS = 8  # Параллельных загрузок фото при импорте
+EXCEL_IMPORT_IMAGE_PER_HOST = 4  # Одновременных загрузок с одного хоста
+EXCEL_IMPORT_IMAGE_RETRIES = 2  # Повторов загрузки фото после ошибки
+EXCEL_IMPORT_IMAGE_TIMEOUT = (5, 20)  # Таймауты соединения и чтения, сек
+EXCEL_IMPORT_IMAGE_LOOKAHEAD_ROWS = 20  # На сколько строк вперёд качать фото
+EXCEL_IMPORT_PROGRESS_EVERY_ROWS = 50  # Как часто сохранять прогресс импорта
+EXCEL_IMPORT_BATCH_SIZE = 500  # Товаров в одном bulk-запросе импорта
+EXCEL_IMPORT_TIME_LIMIT = 4 * 60 * 60  # Лимит фоновой задачи импорта, сек
+EXCEL_IMPORT_DIFF_SAMPLE_SIZE = 50  # Изменений в отчёте предпросмотра
+EXCEL_IMPORT_READ_CHUNK_ROWS = 2000  # Строк файла в одной пачке чтения
+# Кодировки CSV по порядку проверки: Excel с русской локалью сохраняет
+# CSV в Windows-1251
+EXCEL_IMPORT_CSV_ENCODINGS = ('utf-8-sig', 'cp1251')
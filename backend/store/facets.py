@@ -0,0 +1,101 @@
+import math
+
+from django.db.models import Count, Max, Min, Q
+
+from store.models import Product
+
+PRICE_HISTOGRAM_BUCKETS = 5
+
+
+def get_price_histogram(queryset, min_price, max_price,
+                        buckets=PRICE_HISTOGRAM_BUCKETS):
+    '''
+    Делит диапазон цен на равные целочисленные интервалы и считает товары
+    в каждом из них одним запросом.
+    '''
+    if min_price is None or max_price is None:
+        return []
+
+    lower = math.floor(min_price)
+    upper = math.ceil(max_price)
+    width = max(1, math.ceil((upper - lower) / buckets))
+    edges = [
+        (lower + width * index, lower + width * (index + 1))
+        for index in range(buckets)
+        if lower + width * index <= upper
+    ]
+
+    counts = queryset.aggregate(**{
+        f'bucket_{index}': Count('pk', filter=(
+            Q(price__gte=bucket_min, price__lt=bucket_max)
+            if index < len(edges) - 1
+            else Q(price__gte=bucket_min)
+        ))
+        for index, (bucket_min, bucket_max) in enumerate(edges)
+    })
+    return [
+        {
+            'min': bucket_min,
+            'max': bucket_max,
+            'count': counts[f'bucket_{index}'],
+        }
+        for index, (bucket_min, bucket_max) in enumerate(edges)
+    ]
+
+
+def get_product_facets(queryset, buckets=PRICE_HISTOGRAM_BUCKETS):
+    '''
+    Считает фасеты каталога для уже отфильтрованного queryset товаров.
+    '''
+    # Фильтр по категориям даёт JOIN с дублями строк, поэтому считаем
+    # по множеству id, а не по исходному queryset.
+    products = Product.objects.filter(
+        pk__in=queryset.order_by().values('pk'),
+    ).order_by()
+
+    totals = products.aggregate(
+        count=Count('pk'),
+        is_new=Count('pk', filter=Q(is_new=True)),
+        has_discount=Count('pk', filter=Q(old_price__isnull=False)),
+        min_price=Min('price'),
+        max_price=Max('price'),
+    )
+    categories = (
+        products
+        .filter(categories__isnull=False)
+        .values('categories__slug')
+        .annotate(count=Count('pk', distinct=True))
+        .order_by('categories__slug')
+    )
+    countries = (
+        products
+        .exclude(country__isnull=True)
+        .exclude(country__exact='')
+        .values('country')
+        .annotate(count=Count('pk'))
+        .order_by('country')
+    )
+
+    return {
+        'count': totals['count'],
+        'categories': [
+            {'slug': row['categories__slug'], 'count': row['count']}
+            for row in categories
+        ],
+        'countries': [
+            {'country': row['country'], 'count': row['count']}
+            for row in countries
+        ],
+        'is_new': totals['is_new'],
+        'has_discount': totals['has_discount'],
+        'price': {
+            'min': totals['min_price'],
+            'max': totals['max_price'],
+            'buckets': get_price_histogram(
+                products,
+                totals['min_price'],
+                totals['max_price'],
+                buckets,
+            ),
+        },
+    }
@@ -0,0 +1,256 @@
+import json
+import logging
+import os
+from datetime import timedelta
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Q, TextField
+from django.db.models.functions import Cast
+from django.utils import timezone
+from PIL import Image, ImageOps, features
+
+from store.cache import bump_cache_generation
+from store.cards import refresh_product_cards
+from store.constants import (PRODUCT_IMAGE_ORPHAN_GRACE_PERIOD,
+                             PRODUCT_IMAGE_VARIANT_FORMATS,
+                             PRODUCT_IMAGE_VARIANT_QUALITY,
+                             PRODUCT_IMAGE_VARIANT_WIDTHS)
+from store.models import ProductImage
+
+logger = logging.getLogger(__name__)
+
+
+def get_variant_formats():
+    # AVIF доступен не во всех сборках Pillow, без него остаётся WebP.
+    return tuple(
+        image_format
+        for image_format in PRODUCT_IMAGE_VARIANT_FORMATS
+        if features.check(image_format)
+    )
+
+
+def get_variant_name(source, width, image_format):
+    '''
+    Имя превью: products/ab/variants/<имя>-<расширение>-<ширина>w.<формат>.
+
+    Расширение исходника входит в имя, чтобы у файлов 1.jpg и 1.png
+    были разные превью.
+    '''
+    directory, filename = os.path.split(source)
+    stem, extension = os.path.splitext(filename)
+    parts = (stem, extension.lstrip('.').lower(), f'{width}w')
+    return os.path.join(
+        directory,
+        'variants',
+        f'{"-".join(part for part in parts if part)}.{image_format}',
+    )
+
+
+def is_content_addressed(product_image):
+    name = os.path.basename(product_image.image.name)
+    return bool(product_image.file_hash) and (
+        os.path.splitext(name)[0] == product_image.file_hash
+    )
+
+
+def has_current_variants(product_image):
+    return product_image.variants.get('source') == product_image.image.name
+
+
+def get_referenced_variant_names(names):
+    '''
+    Какие из превью names ещё указаны в variants хотя бы одной записи.
+
+    Одно превью может быть у записей с разными исходниками, поэтому
+    ссылки ищутся по всем записям, а не по имени исходника.
+    '''
+    query = Q()
+    for name in names:
+        # В тексте JSON имя может быть экранировано по-разному.
+        for needle in {
+            name,
+            json.dumps(name)[1:-1],
+            json.dumps(name, ensure_ascii=False)[1:-1],
+        }:
+            query |= Q(variants_text__contains=needle)
+    if not query:
+        return set()
+
+    referenced = set()
+    for variants in ProductImage.objects.annotate(
+        variants_text=Cast('variants', TextField()),
+    ).filter(query).values_list('variants', flat=True):
+        referenced.update(item['image'] for item in variants.get('items', ()))
+    return referenced & set(names)
+
+
+def delete_variant_files(variants):
+    '''
+    Удаляет файлы превью, на которые больше не ссылается ни одна запись.
+    '''
+    names = [item['image'] for item in variants.get('items', ())]
+    referenced = get_referenced_variant_names(names)
+    for name in names:
+        if name in referenced:
+            continue
+        try:
+            default_storage.delete(name)
+        except Exception:
+            logger.warning(
+                'Could not delete image variant: %s',
+                name,
+                exc_info=True,
+            )
+
+
+def is_recently_modified(name, storage=default_storage):
+    '''
+    Изменялся ли файл в пределах PRODUCT_IMAGE_ORPHAN_GRACE_PERIOD.
+
+    На такой файл может ссылаться ещё не закоммиченная запись: его только
+    что загрузили или переиспользовали при дедупликации.
+    '''
+    try:
+        modified = storage.get_modified_time(name)
+    except (NotImplementedError, OSError):
+        return False
+    grace_period = timedelta(seconds=PRODUCT_IMAGE_ORPHAN_GRACE_PERIOD)
+    return timezone.now() - modified < grace_period
+
+
+def delete_orphaned_image_files(name, variants=None):
+    '''
+    Удаляет файл изображения и его превью, если на него больше не ссылается
+    ни одна запись ProductImage (подсчёт ссылок по имени файла).
+
+    Недавно изменённые файлы остаются: их удалит команда
+    cleanup_orphan_images, когда пройдёт PRODUCT_IMAGE_ORPHAN_GRACE_PERIOD.
+    '''
+    if not name or ProductImage.objects.filter(image=name).exists():
+        return False
+    if is_recently_modified(name):
+        logger.info('Recently modified image kept: %s', name)
+        return False
+
+    try:
+        default_storage.delete(name)
+    except Exception:
+        logger.warning('Could not delete image: %s', name, exc_info=True)
+    delete_variant_files(variants or {})
+    logger.info('Orphaned image deleted: %s', name)
+    return True
+
+
+def schedule_orphaned_image_cleanup(name, variants=None):
+    transaction.on_commit(
+        lambda: delete_orphaned_image_files(name, variants)
+    )
+
+
+def render_variants(source, original, reuse_existing=False):
+    original = ImageOps.exif_transpose(original)
+    original = original.convert(
+        'RGBA' if original.has_transparency_data else 'RGB'
+    )
+    # Исходник не увеличиваем: если он уже меньше всех ширин, перекодируем
+    # его как есть.
+    widths = [
+        width
+        for width in PRODUCT_IMAGE_VARIANT_WIDTHS
+        if width < original.width
+    ] or [original.width]
+
+    items = []
+    for width in widths:
+        height = max(1, round(original.height * width / original.width))
+        resized = original.resize((width, height), Image.LANCZOS)
+        for image_format in get_variant_formats():
+            name = get_variant_name(source, width, image_format)
+            # Готовое превью берётся повторно, только если имя исходника —
+            # хэш содержимого. Иначе под тем же именем может лежать превью
+            # другого файла, и новое сохраняется под свободным именем.
+            if not (reuse_existing and default_storage.exists(name)):
+                buffer = BytesIO()
+                resized.save(
+                    buffer,
+                    format=image_format.upper(),
+                    quality=PRODUCT_IMAGE_VARIANT_QUALITY,
+                )
+                name = default_storage.save(
+                    name,
+                    ContentFile(buffer.getvalue()),
+                )
+            items.append({
+                'format': image_format,
+                'width': width,
+                'image': name,
+            })
+    return items
+
+
+def generate_image_variants(image_id):
+    '''
+    Генерирует WebP/AVIF-превью изображения товара нескольких ширин.
+
+    Превью сохраняются рядом с оригиналом в подкаталоге variants/,
+    а их список — в ProductImage.variants вместе с именем исходника.
+    '''
+    product_image = ProductImage.objects.filter(pk=image_id).first()
+    if product_image is None or not product_image.image:
+        return None
+    if has_current_variants(product_image):
+        return product_image.variants
+
+    source = product_image.image.name
+    variants = ProductImage.objects.filter(
+        image=source,
+        variants__source=source,
+    ).values_list('variants', flat=True).first()
+    if variants is None:
+        with product_image.image.open('rb') as file:
+            with Image.open(file) as original:
+                variants = {
+                    'source': source,
+                    'items': render_variants(
+                        source,
+                        original,
+                        reuse_existing=is_content_addressed(product_image),
+                    ),
+                }
+
+    # Превью общие для всех записей с этим файлом. Прежние превью записи
+    # удаляются вместе со старым файлом, когда на него не остаётся ссылок.
+    rows = {
+        pk: product_id
+        for pk, product_id, row_variants in ProductImage.objects.filter(
+            image=source,
+        ).values_list('pk', 'product_id', 'variants')
+        if row_variants.get('source') != source
+    }
+    if not ProductImage.objects.filter(
+        pk__in=rows,
+        image=source,
+    ).update(variants=variants):
+        return None
+
+    refresh_product_cards(set(rows.values()))
+    bump_cache_generation('productimage')
+    return variants
+
+
+def enqueue_image_variants(image_id):
+    def callback():
+        try:
+            from store.tasks import generate_product_image_variants
+
+            generate_product_image_variants.delay(image_id)
+        except Exception:
+            logger.exception(
+                'Could not enqueue image variants generation: image_id=%s',
+                image_id,
+            )
+
+    transaction.on_commit(callback)
@@ -0,0 +1,228 @@
+import logging
+import posixpath
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from hashlib import md5
+from urllib.parse import unquote, urlparse
+
+import requests
+from django.core.files import File
+from prometheus_client import Counter, Histogram
+from requests.adapters import HTTPAdapter
+
+from store.constants import (EXCEL_IMPORT_IMAGE_PER_HOST,
+                             EXCEL_IMPORT_IMAGE_RETRIES,
+                             EXCEL_IMPORT_IMAGE_TIMEOUT,
+                             EXCEL_IMPORT_IMAGE_WORKERS,
+                             PRODUCT_IMAGE_MAX_SIZE)
+
+logger = logging.getLogger(__name__)
+
+IMAGE_DOWNLOADS = Counter(
+    'revolline_import_image_downloads_total',
+    'Product image downloads made by the Excel importer.',
+    ('outcome',),
+)
+IMAGE_DOWNLOAD_BYTES = Counter(
+    'revolline_import_image_download_bytes_total',
+    'Bytes of product images downloaded by the Excel importer.',
+)
+IMAGE_DOWNLOAD_DURATION = Histogram(
+    'revolline_import_image_download_seconds',
+    'Time spent downloading one product image, including retries.',
+    buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 60),
+)
+
+RETRYABLE_STATUS_CODES = frozenset((429, 500, 502, 503, 504))
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+# Файлы до 1 МБ держим в памяти, крупнее — во временном файле на диске.
+SPOOL_MAX_SIZE = 1024 * 1024
+
+
+class ImageTooLarge(Exception):
+    pass
+
+
+@dataclass
+class DownloadedImage:
+    link: str
+    name: str
+    file: tempfile.SpooledTemporaryFile
+    file_hash: str
+    size: int
+
+    def as_file(self):
+        self.file.seek(0)
+        return File(self.file, name=self.name)
+
+    def close(self):
+        self.file.close()
+
+
+def get_image_name(link):
+    name = posixpath.basename(unquote(urlparse(link).path))
+    return name or 'image.jpg'
+
+
+class ImageDownloader:
+    '''
+    Параллельно скачивает фотографии товаров для импорта.
+
+    Пул потоков ограничен, с одного хоста качается не больше
+    per_host ссылок одновременно. Тело ответа пишется потоком во временный
+    файл с проверкой размера, временные ошибки повторяются с backoff.
+    '''
+
+    def __init__(
+        self,
+        workers=EXCEL_IMPORT_IMAGE_WORKERS,
+        per_host=EXCEL_IMPORT_IMAGE_PER_HOST,
+        max_size=PRODUCT_IMAGE_MAX_SIZE,
+        retries=EXCEL_IMPORT_IMAGE_RETRIES,
+        timeout=EXCEL_IMPORT_IMAGE_TIMEOUT,
+        backoff=0.5,
+    ):
+        self.per_host = per_host
+        self.max_size = max_size
+        self.retries = retries
+        self.timeout = timeout
+        self.backoff = backoff
+        self.executor = ThreadPoolExecutor(
+            max_workers=workers,
+            thread_name_prefix='image-download',
+        )
+        self.session = requests.Session()
+        self.session.headers['User-Agent'] = 'revolline-import/1.0'
+        adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.host_limits = {}
+        self.host_limits_lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        self.session.close()
+
+    def submit(self, link):
+        return self.executor.submit(self.download, link)
+
+    def get_host_limit(self, link):
+        host = urlparse(link).netloc.lower()
+        with self.host_limits_lock:
+            if host not in self.host_limits:
+                self.host_limits[host] = threading.BoundedSemaphore(
+                    self.per_host,
+                )
+            return self.host_limits[host]
+
+    def download(self, link):
+        '''
+        Возвращает DownloadedImage или None, если скачать не удалось.
+        '''
+        started = time.monotonic()
+        outcome = 'failed'
+        try:
+            with self.get_host_limit(link):
+                image = self.download_with_retries(link)
+            outcome = 'ok'
+            IMAGE_DOWNLOAD_BYTES.inc(image.size)
+            return image
+        except ImageTooLarge:
+            outcome = 'too_large'
+            logger.warning(
+                'Image is larger than %s bytes: %s',
+                self.max_size,
+                link,
+            )
+        except requests.RequestException as exc:
+            logger.warning('Image download failed for %s: %s', link, exc)
+        except Exception:
+            # Битый заголовок или неожиданный ответ не должен прерывать
+            # весь импорт: фото считается нескачанным.
+            logger.warning(
+                'Image download failed for %s',
+                link,
+                exc_info=True,
+            )
+        finally:
+            IMAGE_DOWNLOADS.labels(outcome=outcome).inc()
+            IMAGE_DOWNLOAD_DURATION.observe(time.monotonic() - started)
+        return None
+
+    def download_with_retries(self, link):
+        '''
+        Первая попытка и до self.retries повторов временных ошибок.
+        '''
+        for attempt in range(self.retries + 1):
+            try:
+                return self.fetch(link)
+            except (
+                requests.ConnectionError,
+                requests.Timeout,
+                requests.exceptions.ChunkedEncodingError,
+            ):
+                if attempt == self.retries:
+                    raise
+            except requests.HTTPError as exc:
+                status_code = exc.response.status_code
+                if (
+                    status_code not in RETRYABLE_STATUS_CODES
+                    or attempt == self.retries
+                ):
+                    raise
+            time.sleep(self.backoff * 2 ** attempt)
+
+    def fetch(self, link):
+        with self.session.get(
+            link,
+            timeout=self.timeout,
+            stream=True,
+        ) as response:
+            response.raise_for_status()
+            content_length = response.headers.get('Content-Length')
+            if content_length and int(content_length) > self.max_size:
+                raise ImageTooLarge(link)
+
+            file = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+            hasher = md5()
+            size = 0
+            try:
+                for chunk in response.iter_content(DOWNLOAD_CHUNK_SIZE):
+                    size += len(chunk)
+                    if size > self.max_size:
+                        raise ImageTooLarge(link)
+                    hasher.update(chunk)
+                    file.write(chunk)
+            except BaseException:
+                file.close()
+                raise
+
+        return DownloadedImage(
+            link=link,
+            name=get_image_name(link),
+            file=file,
+            file_hash=hasher.hexdigest(),
+            size=size,
+        )
+
+
+def discard_downloads(downloads):
+    '''
+    Отменяет ещё не начатые загрузки и закрывает временные файлы готовых.
+    '''
+    def close_result(future):
+        if not future.cancelled() and future.result() is not None:
+            future.result().close()
+
+    for _, future in downloads:
+        if not future.cancel():
+            future.add_done_callback(close_result)
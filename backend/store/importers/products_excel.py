@@ -1,22 +1,26 @@
+import json
 import logging
-import re
-from dataclasses import dataclass, field
-from hashlib import md5
+from dataclasses import asdict, dataclass, field
+from hashlib import sha256
+from types import SimpleNamespace
 
-import pandas as pd
+from django.db import transaction
 
 from store.constants import (
-    EXCEL_IMPORT_FALSE_VALUES,
-    EXCEL_IMPORT_FIELD_ALIASES,
-    EXCEL_IMPORT_FULL_WEIGHT_COLUMN,
-    EXCEL_IMPORT_HEADER_HINTS,
-    EXCEL_IMPORT_PACKAGED_WEIGHT_KG_COLUMN,
-    EXCEL_IMPORT_SERVICE_ROW_MARKERS,
-    EXCEL_IMPORT_TRUE_VALUES,
+    EXCEL_IMPORT_BATCH_SIZE,
+    EXCEL_IMPORT_DIFF_SAMPLE_SIZE,
+    EXCEL_IMPORT_IMAGE_LOOKAHEAD_ROWS,
+    EXCEL_IMPORT_PROGRESS_EVERY_ROWS,
     MIN_VALUE,
 )
+from store.cache import bump_cache_generation, defer_cache_invalidation
+from store.cards import (defer_product_card_refresh,
+                         flush_product_card_refresh, refresh_product_cards)
+from store.importers.image_downloads import ImageDownloader, discard_downloads
+from store.importers.readers import ProductFileReader
+from store.importers.records import normalize_products_dataframe
 from store.models import Category, Product, ProductImage
-from store.services import clean_value, image_download
+from store.search import update_product_search_vectors
 
 logger = logging.getLogger(__name__)
 
@@ -24,11 +28,27 @@ logger = logging.getLogger(__name__)
 @dataclass
 class ProductImportResult:
     imported: int = 0
+    created: int = 0
+    updated: int = 0
+    unchanged: int = 0
+    removed: int = 0
+    dry_run: bool = False
     placeholder_price_rows: int = 0
     skipped_rows: int = 0
     failed_images: int = 0
     failed_rows: int = 0
     trimmed_fields: dict[str, int] = field(default_factory=dict)
+    changes: list[dict] = field(default_factory=list)
+    removed_titles: list[str] = field(default_factory=list)
+
+    def add_change(self, record, status, fields):
+        if len(self.changes) < EXCEL_IMPORT_DIFF_SAMPLE_SIZE:
+            self.changes.append({
+                'row': record.excel_row_number,
+                'title': record.title,
+                'status': status,
+                'fields': fields,
+            })
 
     @property
     def has_warnings(self):
@@ -41,8 +61,16 @@ class ProductImportResult:
 
     def to_messages(self):
         summary = [
-            f'Импортировано {self.imported} записей из Excel.'
+            'Предпросмотр импорта из Excel, изменения не сохранены.'
+            if self.dry_run
+            else f'Импортировано {self.imported} записей из Excel.',
+            f'Новых товаров: {self.created}, изменённых: {self.updated}, '
+            f'без изменений: {self.unchanged}.',
         ]
+        if self.removed:
+            summary.append(
+                f'Товаров нет в файле: {self.removed} (они не удаляются).'
+            )
         if self.placeholder_price_rows:
             summary.append(
                 f'Для {self.placeholder_price_rows} новых товаров не была '
@@ -73,294 +101,354 @@ class ProductImportResult:
         return summary
 
 
-def normalize_header(value):
-    if pd.isna(value):
-        return ''
-    return str(value).strip()
+# Значения для новых товаров, если ячейка в файле пустая.
+PRODUCT_IMPORT_DEFAULTS = {
+    'description': '',
+    'pr_type': '',
+    'is_new': True,
+}
+PRODUCT_IMPORT_FIELDS = (
+    'description',
+    'pr_type',
+    'is_new',
+    'ingredients',
+    'country',
+    'size',
+    'effect',
+    'color',
+    'collection',
+    'full_weight',
+    'product_weight',
+    'volume',
+    'old_price',
+)
 
 
-def find_header_row(raw_df):
-    for index in range(min(len(raw_df.index), 10)):
-        normalized_values = {
-            normalize_header(value).lower()
-            for value in raw_df.iloc[index].tolist()
-            if normalize_header(value)
-        }
-        if (
-            normalized_values & EXCEL_IMPORT_HEADER_HINTS['title']
-            and normalized_values & EXCEL_IMPORT_HEADER_HINTS['photos']
-        ):
-            return index
-    return 0
+def get_existing_value(existing_product, field_name, default=None):
+    if existing_product is None:
+        return default
+    return getattr(existing_product, field_name)
 
 
-def is_service_row(row):
-    values = [
-        normalize_header(value).lower()
-        for value in row.tolist()
-        if normalize_header(value)
+def submit_product_images(downloader, record):
+    '''
+    Ставит фотографии строки в очередь загрузки, не дожидаясь результата.
+    '''
+    return [
+        (link, downloader.submit(link))
+        for link in record.photo_links
     ]
-    return any(
-        marker in value
-        for marker in EXCEL_IMPORT_SERVICE_ROW_MARKERS
-        for value in values
-    )
 
 
-def load_products_dataframe(file):
-    raw_df = pd.read_excel(file, header=None)
-    header_row = find_header_row(raw_df)
-    data_start_row = header_row + 1
+class ProductImageQueue:
+    '''
+    Скачивает фотографии строк с упреждением: пока сохраняются текущие строки,
+    загружаются фото следующих EXCEL_IMPORT_IMAGE_LOOKAHEAD_ROWS строк.
+    '''
 
-    if (
-        data_start_row < len(raw_df.index)
-        and is_service_row(raw_df.iloc[data_start_row])
-    ):
-        data_start_row += 1
+    def __init__(self, downloader, records):
+        self.downloader = downloader
+        self.records = records
+        self.indexes = {
+            record.position: index
+            for index, record in enumerate(records)
+        }
+        self.pending = {}
+
+    def prefetch(self, position):
+        start = self.indexes[position]
+        end = start + EXCEL_IMPORT_IMAGE_LOOKAHEAD_ROWS
+        for record in self.records[start:end]:
+            if record.position not in self.pending:
+                self.pending[record.position] = submit_product_images(
+                    self.downloader,
+                    record,
+                )
+
+    def pop(self, position):
+        self.prefetch(position)
+        return self.pending.pop(position)
+
+
+def iter_product_batches(records):
+    '''
+    Делит записи на пачки по EXCEL_IMPORT_BATCH_SIZE.
+
+    Повтор названия закрывает пачку досрочно, чтобы последующая строка
+    обновляла товар, уже сохранённый предыдущей, как при построчном импорте.
+    '''
+    batch = []
+    titles = set()
+    for record in records:
+        if record.title in titles or len(batch) >= EXCEL_IMPORT_BATCH_SIZE:
+            yield batch
+            batch = []
+            titles = set()
+
+        titles.add(record.title)
+        batch.append(record)
+
+    if batch:
+        yield batch
+
+
+def build_product_values(record, existing_product, result):
+    values = {
+        field_name: (
+            getattr(record, field_name)
+            if getattr(record, field_name) is not None
+            else get_existing_value(
+                existing_product,
+                field_name,
+                PRODUCT_IMPORT_DEFAULTS.get(field_name),
+            )
+        )
+        for field_name in PRODUCT_IMPORT_FIELDS
+    }
 
-    headers = [
-        normalize_header(value)
-        for value in raw_df.iloc[header_row].tolist()
+    price = record.price
+    if price is None:
+        if existing_product:
+            price = existing_product.price
+        else:
+            price = MIN_VALUE
+            result.placeholder_price_rows += 1
+    values['price'] = price
+    return values
+
+
+def get_record_hash(record):
+    content = asdict(record)
+    del content['position'], content['excel_row_number']
+    return sha256(json.dumps(
+        content,
+        ensure_ascii=False,
+        sort_keys=True,
+        default=str,
+    ).encode()).hexdigest()
+
+
+def get_changed_fields(values, existing_product):
+    return [
+        field_name
+        for field_name, value in values.items()
+        if field_name != 'import_hash'
+        and Product._meta.get_field(field_name).to_python(value)
+        != getattr(existing_product, field_name)
     ]
-    data_df = raw_df.iloc[data_start_row:].copy()
-    data_df.columns = headers
-    data_df = data_df.loc[:, [column for column in data_df.columns if column]]
-    data_df = data_df.dropna(how='all')
-    return data_df
-
-
-def get_row_value(row, aliases, default=None):
-    for alias in aliases:
-        if alias not in row.index:
-            continue
-        value = clean_value(row.get(alias))
-        if value not in (None, ''):
-            return value
-    return default
-
-
-def parse_bool(value, default=True):
-    if pd.isna(value):
-        return default
-    if isinstance(value, bool):
-        return value
-    if isinstance(value, (int, float)):
-        return value != 0
 
-    normalized = str(value).strip().lower()
-    if normalized in EXCEL_IMPORT_TRUE_VALUES:
-        return True
-    if normalized in EXCEL_IMPORT_FALSE_VALUES:
-        return False
-    return default
 
+def get_category_titles(product_ids):
+    through = Product.categories.through
+    category_titles = {product_id: set() for product_id in product_ids}
+    for product_id, title in through.objects.filter(
+        product_id__in=product_ids,
+    ).values_list('product_id', 'category__title'):
+        category_titles[product_id].add(title)
+    return category_titles
+
+
+def plan_product_records(records, result):
+    '''
+    Сравнивает записи с текущим состоянием БД и возвращает значения полей
+    только для новых и изменённых товаров: {position: values}.
+
+    Строка без изменений — совпадают поля, категории и хэш строки
+    (в нём учтены и ссылки на фото) — не пишется в БД, её фото
+    не скачиваются. Товары и категории читаются пачками.
+    '''
+    planned = {}
+    changed_values = {}
+    for start in range(0, len(records), EXCEL_IMPORT_BATCH_SIZE):
+        batch = records[start:start + EXCEL_IMPORT_BATCH_SIZE]
+        existing_products = Product.objects.in_bulk(
+            {record.title for record in batch},
+            field_name='title',
+        )
+        current_categories = get_category_titles(
+            [product.pk for product in existing_products.values()]
+        )
+        for record in batch:
+            # Повтор названия в файле сравниваем с предыдущей строкой.
+            if record.title in planned:
+                existing, categories = planned[record.title]
+            elif record.title in existing_products:
+                existing = existing_products[record.title]
+                categories = current_categories[existing.pk]
+            else:
+                existing, categories = None, set()
 
-def parse_weight_in_grams(row):
-    grams = get_row_value(row, (EXCEL_IMPORT_FULL_WEIGHT_COLUMN,))
-    if grams is not None:
-        return grams
-
-    kilograms = get_row_value(row, (EXCEL_IMPORT_PACKAGED_WEIGHT_KG_COLUMN,))
-    if kilograms is None:
-        return None
-    return round(float(kilograms) * 1000, 3)
+            values = build_product_values(record, existing, result)
+            values['import_hash'] = get_record_hash(record)
+            if record.category_titles:
+                new_categories = set(record.category_titles)
+            else:
+                new_categories = categories
+            planned[record.title] = (
+                SimpleNamespace(**values),
+                new_categories,
+            )
 
+            if existing is None:
+                result.created += 1
+                result.add_change(record, 'new', [])
+                changed_values[record.position] = values
+                continue
+
+            fields = get_changed_fields(values, existing)
+            if new_categories != categories:
+                fields.append('categories')
+            if (
+                not fields
+                and existing.import_hash
+                and existing.import_hash != values['import_hash']
+            ):
+                fields.append('photos')
+            if fields or existing.import_hash != values['import_hash']:
+                result.updated += 1
+                result.add_change(record, 'changed', fields)
+                changed_values[record.position] = values
+            else:
+                result.unchanged += 1
 
-def split_multi_value(value):
-    if value in (None, ''):
-        return []
-    return [
-        part.strip()
-        for part in re.split(r'[;,]', str(value))
-        if part and part.strip()
-    ]
+    return changed_values
 
 
-def split_photo_links(value):
-    if value in (None, ''):
-        return []
-    separator = ';' if ';' in str(value) else ','
-    return [
-        link.strip()
-        for link in str(value).split(separator)
-        if link and link.strip()
-    ]
+def find_removed_products(titles, result):
+    '''
+    Товары каталога, которых нет в файле. Импорт их не удаляет,
+    они только попадают в отчёт.
+    '''
+    removed_titles = sorted(
+        set(Product.objects.values_list('title', flat=True)) - titles
+    )
+    result.removed = len(removed_titles)
+    result.removed_titles = removed_titles[:EXCEL_IMPORT_DIFF_SAMPLE_SIZE]
 
 
-def fit_model_char_value(
-    model,
-    field_name,
-    value,
-    *,
-    row_index=None,
-    title=None,
-    trimmed_stats=None,
-):
-    if value in (None, ''):
-        return value
-
-    normalized = str(value).strip()
-    max_length = model._meta.get_field(field_name).max_length
-    if field_name in {'effect', 'color'} and ';' in normalized:
-        normalized = normalized.split(';', 1)[0].strip()
-
-    if max_length and len(normalized) > max_length:
-        if trimmed_stats is not None:
-            trimmed_stats[field_name] = trimmed_stats.get(field_name, 0) + 1
-        logger.debug(
-            'Trimmed field "%s" for product "%s" on Excel row %s: %s -> %s chars',
-            field_name,
-            title or '<unknown>',
-            row_index,
-            len(normalized),
-            max_length,
+def save_products_one_by_one(batch, values, result):
+    products = {}
+    for record in batch:
+        try:
+            products[record.position], _ = Product.objects.update_or_create(
+                title=record.title,
+                defaults=values[record.position],
+            )
+        except Exception:
+            result.failed_rows += 1
+            logger.exception(
+                'Could not import Excel row %s for product "%s"',
+                record.excel_row_number,
+                record.title,
+            )
+    return products
+
+
+def save_product_batch(batch, values, result):
+    '''
+    Сохраняет пачку товаров одним INSERT ... ON CONFLICT (title) DO UPDATE.
+
+    Если пачка не сохраняется целиком, строки сохраняются по одной, чтобы
+    ошибка одной строки не отменяла остальные.
+    '''
+    titles = [record.title for record in batch]
+    try:
+        with transaction.atomic():
+            Product.objects.bulk_create(
+                [
+                    Product(title=record.title, **values[record.position])
+                    for record in batch
+                ],
+                update_conflicts=True,
+                unique_fields=('title',),
+                update_fields=(*PRODUCT_IMPORT_FIELDS, 'price', 'import_hash'),
+            )
+    except Exception:
+        logger.warning(
+            'Bulk product upsert failed, saving %s rows one by one',
+            len(batch),
+            exc_info=True,
         )
-        return normalized[:max_length]
-    return normalized
+        return save_products_one_by_one(batch, values, result)
 
+    # bulk_create с update_conflicts не проставляет pk, перечитываем товары.
+    saved_products = Product.objects.in_bulk(titles, field_name='title')
+    return {
+        record.position: saved_products[record.title]
+        for record in batch
+    }
 
-def get_existing_value(existing_product, field_name, default=None):
-    if existing_product is None:
-        return default
-    return getattr(existing_product, field_name)
 
+def save_batch_categories(batch, products):
+    '''
+    Привязывает категории пачкой: существующие категории читаются одним
+    запросом, связи пишутся и удаляются напрямую в промежуточной таблице.
+    '''
+    records = [
+        record
+        for record in batch
+        if record.position in products and record.category_titles
+    ]
+    if not records:
+        return
 
-def build_product_defaults(row, existing_product, full_weight, row_index, title,
-                           trimmed_fields):
-    return {
-        'description': get_row_value(
-            row,
-            EXCEL_IMPORT_FIELD_ALIASES['description'],
-            default=get_existing_value(existing_product, 'description', ''),
-        ),
-        'pr_type': fit_model_char_value(
-            Product,
-            'pr_type',
-            get_row_value(
-                row,
-                EXCEL_IMPORT_FIELD_ALIASES['pr_type'],
-                default=get_existing_value(existing_product, 'pr_type', ''),
-            ),
-            row_index=row_index,
-            title=title,
-            trimmed_stats=trimmed_fields,
-        ),
-        'is_new': parse_bool(
-            get_row_value(row, EXCEL_IMPORT_FIELD_ALIASES['is_new']),
-            default=get_existing_value(existing_product, 'is_new', True),
-        ),
-        'ingredients': get_row_value(
-            row,
-            EXCEL_IMPORT_FIELD_ALIASES['ingredients'],
-            default=get_existing_value(existing_product, 'ingredients'),
-        ),
-        'country': fit_model_char_value(
-            Product,
-            'country',
-            get_row_value(
-                row,
-                EXCEL_IMPORT_FIELD_ALIASES['country'],
-                default=get_existing_value(existing_product, 'country'),
-            ),
-            row_index=row_index,
-            title=title,
-            trimmed_stats=trimmed_fields,
-        ),
-        'size': fit_model_char_value(
-            Product,
-            'size',
-            get_row_value(
-                row,
-                EXCEL_IMPORT_FIELD_ALIASES['size'],
-                default=get_existing_value(existing_product, 'size'),
-            ),
-            row_index=row_index,
-            title=title,
-            trimmed_stats=trimmed_fields,
-        ),
-        'effect': fit_model_char_value(
-            Product,
-            'effect',
-            get_row_value(
-                row,
-                EXCEL_IMPORT_FIELD_ALIASES['effect'],
-                default=get_existing_value(existing_product, 'effect'),
-            ),
-            row_index=row_index,
-            title=title,
-            trimmed_stats=trimmed_fields,
-        ),
-        'color': fit_model_char_value(
-            Product,
-            'color',
-            get_row_value(
-                row,
-                EXCEL_IMPORT_FIELD_ALIASES['color'],
-                default=get_existing_value(existing_product, 'color'),
-            ),
-            row_index=row_index,
-            title=title,
-            trimmed_stats=trimmed_fields,
-        ),
-        'collection': fit_model_char_value(
-            Product,
-            'collection',
-            get_row_value(
-                row,
-                EXCEL_IMPORT_FIELD_ALIASES['collection'],
-                default=get_existing_value(existing_product, 'collection'),
-            ),
-            row_index=row_index,
-            title=title,
-            trimmed_stats=trimmed_fields,
-        ),
-        'full_weight': (
-            full_weight
-            if full_weight is not None
-            else get_existing_value(existing_product, 'full_weight')
-        ),
-        'product_weight': get_row_value(
-            row,
-            EXCEL_IMPORT_FIELD_ALIASES['product_weight'],
-            default=get_existing_value(existing_product, 'product_weight'),
-        ),
-        'volume': get_row_value(
-            row,
-            EXCEL_IMPORT_FIELD_ALIASES['volume'],
-            default=get_existing_value(existing_product, 'volume'),
-        ),
+    category_titles = {
+        title
+        for record in records
+        for title in record.category_titles
     }
+    categories = Category.objects.in_bulk(category_titles, field_name='title')
+    for title in sorted(category_titles - categories.keys()):
+        categories[title], _ = Category.objects.get_or_create(title=title)
+    logger.debug('Imported product categories: %s', sorted(category_titles))
+
+    links = {
+        (products[record.position].pk, categories[title].pk)
+        for record in records
+        for title in record.category_titles
+    }
+    through = Product.categories.through
+    current_links = {
+        (product_id, category_id): pk
+        for pk, product_id, category_id in through.objects.filter(
+            product_id__in={product_id for product_id, _ in links},
+        ).values_list('pk', 'product_id', 'category_id')
+    }
+    stale_links = [
+        pk
+        for link, pk in current_links.items()
+        if link not in links
+    ]
+    if stale_links:
+        through.objects.filter(pk__in=stale_links).delete()
+    through.objects.bulk_create(
+        [
+            through(product_id=product_id, category_id=category_id)
+            for product_id, category_id in links - current_links.keys()
+        ],
+        ignore_conflicts=True,
+    )
 
 
-def import_categories(row, row_index, normalized_title, trimmed_fields):
-    category_titles = split_multi_value(
-        get_row_value(row, EXCEL_IMPORT_FIELD_ALIASES['categories'])
-    )
-    categories = [
-        Category.objects.get_or_create(
-            title=fit_model_char_value(
-                Category,
-                'title',
-                category_title,
-                row_index=row_index,
-                title=normalized_title,
-                trimmed_stats=trimmed_fields,
-            ),
-        )[0]
-        for category_title in category_titles
-    ]
-    logger.debug('Imported product categories: %s', categories)
-    return categories
+def get_product_images_state(product_ids):
+    '''
+    Хэши уже загруженных фото и следующий свободный position по товарам.
+    '''
+    state = {product_id: (set(), 0) for product_id in product_ids}
+    for product_id, file_hash, position in ProductImage.objects.filter(
+        product_id__in=product_ids,
+    ).values_list('product_id', 'file_hash', 'position'):
+        file_hashes, next_position = state[product_id]
+        file_hashes.add(file_hash)
+        state[product_id] = (file_hashes, max(next_position, position + 1))
+    return state
 
 
-def import_product_images(row, product):
+def import_product_images(product, downloads, file_hashes, next_position):
     failed_images = 0
-    photo_links = split_photo_links(
-        get_row_value(row, EXCEL_IMPORT_FIELD_ALIASES['photos'])
-    )
-    for link in photo_links:
-        image_file = image_download(link)
-        if image_file is None:
+    for link, download in downloads:
+        image = download.result()
+        if image is None:
             failed_images += 1
             logger.warning(
                 'Could not download image for product "%s": %s',
@@ -369,96 +457,175 @@ def import_product_images(row, product):
             )
             continue
 
-        file_hash = md5(image_file.read()).hexdigest()
-        image_file.seek(0)
-
-        if not product.images.filter(file_hash=file_hash).exists():
-            ProductImage.objects.create(
-                product=product,
-                image=image_file,
-                file_hash=file_hash,
-            )
+        try:
+            if image.file_hash not in file_hashes:
+                ProductImage.objects.create(
+                    product=product,
+                    image=image.as_file(),
+                    position=next_position,
+                )
+                file_hashes.add(image.file_hash)
+                next_position += 1
+        finally:
+            image.close()
 
     return failed_images
 
 
-def import_products_from_excel(file):
-    df = load_products_dataframe(file)
-    result = ProductImportResult()
+class ImportProgress:
+    '''
+    Передаёт прогресс в progress(processed_rows, total_rows, result)
+    не чаще раза в EXCEL_IMPORT_PROGRESS_EVERY_ROWS строк.
 
-    for row_index, row in df.iterrows():
-        excel_row_number = row_index + 1
-        title = get_row_value(row, EXCEL_IMPORT_FIELD_ALIASES['title'])
-        if not title:
-            result.skipped_rows += 1
-            logger.warning(
-                'Skipped Excel row %s: empty title after normalization',
-                excel_row_number,
-            )
-            continue
+    Общее число строк берётся у читателя файла, когда оно известно
+    (у CSV его нет до конца чтения).
+    '''
 
-        normalized_title = fit_model_char_value(
-            Product,
-            'title',
-            title,
-            row_index=excel_row_number,
-            title=title,
-            trimmed_stats=result.trimmed_fields,
-        )
-        existing_product = Product.objects.filter(
-            title=normalized_title,
-        ).first()
-
-        price = get_row_value(row, EXCEL_IMPORT_FIELD_ALIASES['price'])
-        if price is None:
-            if existing_product:
-                price = existing_product.price
-            else:
-                price = MIN_VALUE
-                result.placeholder_price_rows += 1
+    def __init__(self, callback, result, chunks):
+        self.callback = callback
+        self.result = result
+        self.chunks = chunks
+        self.reported_rows = 0
+
+    def get_total_rows(self, processed_rows):
+        total_rows = getattr(self.chunks, 'total_rows', None) or 0
+        return max(total_rows, processed_rows)
 
-        old_price = get_row_value(
-            row,
-            EXCEL_IMPORT_FIELD_ALIASES['old_price'],
-            default=get_existing_value(existing_product, 'old_price'),
+    def __call__(self, processed_rows, force=False):
+        if self.callback is None:
+            return
+        if (
+            not force
+            and processed_rows - self.reported_rows
+            < EXCEL_IMPORT_PROGRESS_EVERY_ROWS
+        ):
+            return
+        self.callback(
+            processed_rows,
+            self.get_total_rows(processed_rows),
+            self.result,
         )
-        full_weight = parse_weight_in_grams(row)
+        self.reported_rows = processed_rows
 
-        try:
-            product, _ = Product.objects.update_or_create(
-                title=normalized_title,
-                defaults={
-                    **build_product_defaults(
-                        row,
-                        existing_product,
-                        full_weight,
-                        excel_row_number,
-                        title,
-                        result.trimmed_fields,
-                    ),
-                    'price': price,
-                    'old_price': old_price,
-                },
+    def finish(self, processed_rows):
+        if self.callback is not None:
+            total_rows = self.get_total_rows(processed_rows)
+            self.callback(total_rows, total_rows, self.result)
+
+
+def import_products_from_excel(file, progress=None, dry_run=False):
+    '''
+    Импортирует товары из файла .xlsx, .xls или .csv.
+
+    Файл читается потоково пачками по EXCEL_IMPORT_READ_CHUNK_ROWS строк,
+    поэтому в памяти не держится весь лист. progress(processed_rows,
+    total_rows, result) вызывается в начале каждой пачки, каждые
+    EXCEL_IMPORT_PROGRESS_EVERY_ROWS строк и в конце импорта.
+    С dry_run=True только считает изменения, ничего не сохраняя.
+    '''
+    return import_product_chunks(ProductFileReader(file), progress, dry_run)
+
+
+def import_products_dataframe(df, progress=None, dry_run=False):
+    return import_product_chunks([df], progress, dry_run)
+
+
+def import_product_chunks(chunks, progress=None, dry_run=False):
+    '''
+    Импортирует пачки строк файла по очереди: каждая пачка нормализуется,
+    сравнивается с БД и сохраняется до чтения следующей. Повтор названия
+    в следующей пачке обновляет товар, уже сохранённый предыдущей.
+
+    Сброс кэша откладывается до конца импорта, карточки товаров
+    обновляются после каждой сохранённой пачки.
+    '''
+    with defer_cache_invalidation(), defer_product_card_refresh():
+        result = _import_product_chunks(chunks, progress, dry_run)
+        if result.imported:
+            bump_cache_generation('product', 'productimage', 'category')
+    return result
+
+
+def _import_product_chunks(chunks, progress, dry_run):
+    result = ProductImportResult(dry_run=dry_run)
+    report_progress = ImportProgress(progress, result, chunks)
+    titles = set()
+    processed_rows = 0
+    with ImageDownloader() as downloader:
+        for df in chunks:
+            report_progress(processed_rows, force=True)
+            records = normalize_products_dataframe(
+                df,
+                result,
+                start_position=processed_rows,
             )
-        except Exception:
-            result.failed_rows += 1
-            logger.exception(
-                'Could not import Excel row %s for product "%s"',
-                excel_row_number,
-                title,
+            processed_rows += len(df.index)
+            titles.update(record.title for record in records)
+            changed_values = plan_product_records(records, result)
+            if dry_run:
+                continue
+
+            import_product_records(
+                [
+                    record
+                    for record in records
+                    if record.position in changed_values
+                ],
+                changed_values,
+                downloader,
+                result,
+                report_progress,
             )
-            continue
 
-        categories = import_categories(
-            row,
-            excel_row_number,
-            normalized_title,
-            result.trimmed_fields,
-        )
-        if categories:
-            product.categories.set(categories)
+    find_removed_products(titles, result)
+    report_progress.finish(processed_rows)
+    return result
 
-        result.failed_images += import_product_images(row, product)
-        result.imported += 1
 
+def import_product_records(records, values, downloader, result,
+                           progress=None):
+    '''
+    Сохраняет новые и изменённые записи пачками: товары и связи
+    с категориями пишутся несколькими запросами на пачку, фотографии
+    скачиваются параллельно на несколько строк вперёд.
+    '''
+    images = ProductImageQueue(downloader, records)
+    for batch in iter_product_batches(records):
+        images.prefetch(batch[0].position)
+        products = save_product_batch(batch, values, result)
+        save_batch_categories(batch, products)
+
+        product_ids = [product.pk for product in products.values()]
+        # bulk_create и запись в промежуточную таблицу не вызывают save()
+        # и сигналы, поэтому поиск и карточки обновляются здесь.
+        update_product_search_vectors(product_ids)
+        refresh_product_cards(product_ids)
+        images_state = get_product_images_state(product_ids)
+
+        for record in batch:
+            downloads = images.pop(record.position)
+            product = products.get(record.position)
+            if product is None:
+                discard_downloads(downloads)
+                continue
+
+            file_hashes, next_position = images_state[product.pk]
+            failed_images = import_product_images(
+                product,
+                downloads,
+                file_hashes,
+                next_position,
+            )
+            if failed_images:
+                # Без хэша строка не сочтётся неизменной при следующем
+                # импорте, и недокачанные фото будут запрошены снова.
+                Product.objects.filter(pk=product.pk).update(import_hash='')
+                result.failed_images += failed_images
+            result.imported += 1
+            if progress is not None:
+                progress(record.position + 1)
+
+        # Пачка уже закоммичена: карточки её товаров (с главными фото)
+        # пересчитываются сейчас, а не в конце всего файла.
+        flush_product_card_refresh()
     return result
@@ -0,0 +1,169 @@
+import codecs
+import csv
+import posixpath
+from itertools import chain, islice
+
+import pandas as pd
+from openpyxl import load_workbook
+
+from store.constants import (EXCEL_IMPORT_CSV_ENCODINGS,
+                             EXCEL_IMPORT_HEADER_HINTS,
+                             EXCEL_IMPORT_READ_CHUNK_ROWS,
+                             EXCEL_IMPORT_SERVICE_ROW_MARKERS)
+
+HEADER_SEARCH_ROWS = 10
+CSV_ENCODING_SAMPLE_SIZE = 64 * 1024
+
+
+def normalize_header(value):
+    if value is None or pd.isna(value):
+        return ''
+    return str(value).strip()
+
+
+def find_header_row(rows):
+    for index, row in enumerate(rows[:HEADER_SEARCH_ROWS]):
+        normalized_values = {
+            normalize_header(value).lower()
+            for value in row
+            if normalize_header(value)
+        }
+        if (
+            normalized_values & EXCEL_IMPORT_HEADER_HINTS['title']
+            and normalized_values & EXCEL_IMPORT_HEADER_HINTS['photos']
+        ):
+            return index
+    return 0
+
+
+def is_service_row(row):
+    values = [
+        normalize_header(value).lower()
+        for value in row
+        if normalize_header(value)
+    ]
+    return any(
+        marker in value
+        for marker in EXCEL_IMPORT_SERVICE_ROW_MARKERS
+        for value in values
+    )
+
+
+def detect_csv_encoding(file):
+    '''
+    Первая из EXCEL_IMPORT_CSV_ENCODINGS, в которой читается начало файла.
+    '''
+    sample = file.read(CSV_ENCODING_SAMPLE_SIZE)
+    file.seek(0)
+    for encoding in EXCEL_IMPORT_CSV_ENCODINGS:
+        decoder = codecs.getincrementaldecoder(encoding)()
+        try:
+            # final=False: выборка может оборваться посреди символа.
+            decoder.decode(sample, final=False)
+        except UnicodeDecodeError:
+            continue
+        return encoding
+    return EXCEL_IMPORT_CSV_ENCODINGS[0]
+
+
+def get_file_extension(file):
+    return posixpath.splitext(getattr(file, 'name', '') or '')[1].lower()
+
+
+class ProductFileReader:
+    '''
+    Потоково читает файл импорта товаров и отдаёт строки пачками DataFrame.
+
+    .xlsx читается через openpyxl в режиме read-only, .csv — модулем csv,
+    старый .xls — целиком через pandas (потокового чтения для него нет).
+    Индекс пачки — номер строки листа с нуля, как у pd.read_excel.
+    '''
+
+    def __init__(self, file, chunk_rows=EXCEL_IMPORT_READ_CHUNK_ROWS):
+        self.file = file
+        self.chunk_rows = chunk_rows
+        self.extension = get_file_extension(file)
+        self.total_rows = None
+
+    def iter_raw_rows(self):
+        if self.extension == '.csv':
+            return self.iter_csv_rows()
+        if self.extension == '.xls':
+            return self.iter_xls_rows()
+        return self.iter_xlsx_rows()
+
+    def iter_xlsx_rows(self):
+        workbook = load_workbook(self.file, read_only=True, data_only=True)
+        try:
+            worksheet = workbook.active
+            self.total_rows = worksheet.max_row
+            yield from worksheet.iter_rows(values_only=True)
+        finally:
+            workbook.close()
+
+    def iter_xls_rows(self):
+        raw_df = pd.read_excel(self.file, header=None)
+        self.total_rows = len(raw_df.index)
+        for row in raw_df.itertuples(index=False, name=None):
+            yield row
+
+    def iter_csv_rows(self):
+        encoding = detect_csv_encoding(self.file)
+        lines = codecs.iterdecode(self.file, encoding)
+        try:
+            first_line = next(lines, '')
+            try:
+                dialect = csv.Sniffer().sniff(first_line, delimiters=';,\t')
+            except csv.Error:
+                dialect = csv.excel
+            yield from csv.reader(chain((first_line,), lines), dialect)
+        except UnicodeDecodeError as exc:
+            raise ValueError(
+                'Не удалось прочитать CSV: сохраните файл в кодировке '
+                'UTF-8 или Windows-1251.'
+            ) from exc
+
+    def __iter__(self):
+        rows = self.iter_raw_rows()
+        head = list(islice(rows, HEADER_SEARCH_ROWS))
+        if not head:
+            return
+
+        header_row = find_header_row(head)
+        data_start_row = header_row + 1
+        if (
+            data_start_row < len(head)
+            and is_service_row(head[data_start_row])
+        ):
+            data_start_row += 1
+
+        headers = [normalize_header(value) for value in head[header_row]]
+        if self.total_rows is not None:
+            self.total_rows = max(0, self.total_rows - data_start_row)
+
+        data_rows = chain(
+            enumerate(head[data_start_row:], start=data_start_row),
+            enumerate(rows, start=len(head)),
+        )
+        while True:
+            chunk = list(islice(data_rows, self.chunk_rows))
+            if not chunk:
+                return
+            df = self.build_dataframe(headers, chunk)
+            if not df.empty:
+                yield df
+
+    @staticmethod
+    def build_dataframe(headers, chunk):
+        width = len(headers)
+        df = pd.DataFrame(
+            [
+                (tuple(row) + (None,) * width)[:width]
+                for _, row in chunk
+            ],
+            columns=headers,
+            index=[row_index for row_index, _ in chunk],
+            dtype=object,
+        )
+        df = df.loc[:, [bool(column) for column in df.columns]]
+        return df.where(df.ne('')).dropna(how='all')
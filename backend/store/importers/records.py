@@ -0,0 +1,280 @@
+import logging
+import re
+from dataclasses import dataclass, field, fields
+
+import pandas as pd
+
+from store.constants import (
+    EXCEL_IMPORT_FALSE_VALUES,
+    EXCEL_IMPORT_FIELD_ALIASES,
+    EXCEL_IMPORT_FULL_WEIGHT_COLUMN,
+    EXCEL_IMPORT_PACKAGED_WEIGHT_KG_COLUMN,
+    EXCEL_IMPORT_TRUE_VALUES,
+)
+from store.models import Category, Product
+
+logger = logging.getLogger(__name__)
+
+PRODUCT_CHAR_FIELDS = (
+    'pr_type',
+    'country',
+    'size',
+    'effect',
+    'color',
+    'collection',
+)
+PRODUCT_TEXT_FIELDS = ('description', 'ingredients')
+PRODUCT_NUMBER_FIELDS = ('price', 'old_price', 'product_weight', 'volume')
+
+
+@dataclass
+class ProductRecord:
+    '''
+    Нормализованная строка файла импорта.
+
+    None означает пустую ячейку: при обновлении товара такое поле берётся
+    из существующей записи.
+    '''
+    position: int
+    excel_row_number: int
+    title: str
+    description: str | None = None
+    pr_type: str | None = None
+    is_new: bool | None = None
+    ingredients: str | None = None
+    country: str | None = None
+    size: str | None = None
+    effect: str | None = None
+    color: str | None = None
+    collection: str | None = None
+    full_weight: float | None = None
+    product_weight: float | None = None
+    volume: float | None = None
+    price: float | None = None
+    old_price: float | None = None
+    category_titles: list[str] = field(default_factory=list)
+    photo_links: list[str] = field(default_factory=list)
+
+
+PRODUCT_RECORD_FIELDS = tuple(
+    record_field.name for record_field in fields(ProductRecord)
+)
+
+
+def split_multi_value(value):
+    if value in (None, ''):
+        return []
+    return [
+        part.strip()
+        for part in re.split(r'[;,]', str(value))
+        if part and part.strip()
+    ]
+
+
+def split_photo_links(value):
+    if value in (None, ''):
+        return []
+    separator = ';' if ';' in str(value) else ','
+    return [
+        link.strip()
+        for link in str(value).split(separator)
+        if link and link.strip()
+    ]
+
+
+def clean_column(column):
+    '''
+    Обрезает пробелы у строк, пустые строки и NaN превращает в None.
+    '''
+    column = column.astype(object)
+    is_text = column.map(type).eq(str)
+    if is_text.any():
+        column = column.mask(is_text, column[is_text].str.strip())
+    return column.mask(column.isna() | column.eq(''), None)
+
+
+def get_column(df, aliases):
+    '''
+    Первое непустое значение среди колонок-синонимов для каждой строки.
+    '''
+    result = pd.Series(None, index=df.index, dtype=object)
+    for alias in aliases:
+        if alias in df.columns:
+            column = clean_column(df[alias])
+            result = result.mask(result.isna(), column)
+    return result
+
+
+def fit_char_column(column, model, field_name, trimmed_fields):
+    present = column.notna()
+    if not present.any():
+        return column
+
+    text = column[present].astype(str).str.strip()
+    if field_name in {'effect', 'color'}:
+        text = text.str.split(';', n=1).str[0].str.strip()
+
+    max_length = model._meta.get_field(field_name).max_length
+    too_long = text.str.len() > max_length
+    if too_long.any():
+        trimmed_fields[field_name] = (
+            trimmed_fields.get(field_name, 0) + int(too_long.sum())
+        )
+        logger.debug(
+            'Trimmed %s values of field "%s" to %s chars',
+            int(too_long.sum()),
+            field_name,
+            max_length,
+        )
+        text = text.str.slice(0, max_length)
+    return column.mask(present, text)
+
+
+def parse_bool_column(column):
+    text = column.map(
+        lambda value: value.lower() if isinstance(value, str) else None
+    )
+    is_bool = column.map(type).eq(bool)
+    numbers = pd.to_numeric(
+        column.mask(is_bool | text.notna(), None),
+        errors='coerce',
+    )
+
+    result = pd.Series(None, index=column.index, dtype=object)
+    result = result.mask(text.isin(EXCEL_IMPORT_TRUE_VALUES), True)
+    result = result.mask(text.isin(EXCEL_IMPORT_FALSE_VALUES), False)
+    result = result.mask(numbers.notna(), numbers.ne(0))
+    return result.mask(is_bool, column)
+
+
+def to_numeric(column):
+    '''
+    Числа из ячеек; в текстовых значениях (CSV) допускаются пробелы
+    между разрядами и десятичная запятая.
+    '''
+    is_text = column.map(type).eq(str)
+    if is_text.any():
+        column = column.mask(
+            is_text,
+            column[is_text]
+            .str.replace(r'\s', '', regex=True)
+            .str.replace(',', '.', regex=False),
+        )
+    return pd.to_numeric(column, errors='coerce')
+
+
+def parse_number_column(column):
+    return to_numeric(column).astype(object)
+
+
+def parse_weight_column(df):
+    grams = parse_number_column(
+        get_column(df, (EXCEL_IMPORT_FULL_WEIGHT_COLUMN,))
+    )
+    kilograms = to_numeric(
+        get_column(df, (EXCEL_IMPORT_PACKAGED_WEIGHT_KG_COLUMN,))
+    )
+    return grams.mask(grams.isna(), (kilograms * 1000).round(3))
+
+
+def normalize_products_dataframe(df, result, start_position=0):
+    '''
+    Приводит строки файла к списку ProductRecord.
+
+    Синонимы колонок, обрезка под max_length, булевы значения, числа и вес
+    в граммах считаются по столбцам один раз на пачку строк. Строки без
+    названия пропускаются и учитываются в result.skipped_rows, строки
+    с нечисловым значением в числовой колонке — в result.failed_rows.
+    start_position — порядковый номер первой строки пачки в файле.
+    '''
+    df = df.loc[:, ~df.columns.duplicated()]
+    positions = pd.Series(
+        range(start_position, start_position + len(df.index)),
+        index=df.index,
+    )
+    titles = get_column(df, EXCEL_IMPORT_FIELD_ALIASES['title'])
+
+    for row_index in df.index[titles.isna()]:
+        result.skipped_rows += 1
+        logger.warning(
+            'Skipped Excel row %s: empty title after normalization',
+            row_index + 1,
+        )
+    df = df.loc[titles.notna()]
+
+    numbers = {}
+    invalid = pd.Series(False, index=df.index)
+    for field_name in PRODUCT_NUMBER_FIELDS:
+        column = get_column(df, EXCEL_IMPORT_FIELD_ALIASES[field_name])
+        numbers[field_name] = parse_number_column(column)
+        invalid |= column.notna() & numbers[field_name].isna()
+    for row_index in df.index[invalid]:
+        result.failed_rows += 1
+        logger.warning(
+            'Failed Excel row %s: non-numeric value in a number column',
+            row_index + 1,
+        )
+    df = df.loc[~invalid]
+    if df.empty:
+        return []
+
+    trimmed_fields = result.trimmed_fields
+    columns = {
+        'position': positions[df.index],
+        'excel_row_number': pd.Series(df.index + 1, index=df.index),
+        'title': fit_char_column(
+            titles[df.index],
+            Product,
+            'title',
+            trimmed_fields,
+        ),
+        'is_new': parse_bool_column(
+            get_column(df, EXCEL_IMPORT_FIELD_ALIASES['is_new'])
+        ),
+        'full_weight': parse_weight_column(df),
+        'photo_links': get_column(
+            df,
+            EXCEL_IMPORT_FIELD_ALIASES['photos'],
+        ).map(split_photo_links),
+    }
+    for field_name in PRODUCT_TEXT_FIELDS:
+        columns[field_name] = get_column(
+            df,
+            EXCEL_IMPORT_FIELD_ALIASES[field_name],
+        )
+    for field_name in PRODUCT_CHAR_FIELDS:
+        columns[field_name] = fit_char_column(
+            get_column(df, EXCEL_IMPORT_FIELD_ALIASES[field_name]),
+            Product,
+            field_name,
+            trimmed_fields,
+        )
+    for field_name in PRODUCT_NUMBER_FIELDS:
+        columns[field_name] = numbers[field_name][df.index]
+
+    category_titles = get_column(
+        df,
+        EXCEL_IMPORT_FIELD_ALIASES['categories'],
+    ).map(split_multi_value)
+    category_max_length = Category._meta.get_field('title').max_length
+    trimmed_categories = int(category_titles.map(
+        lambda values: sum(
+            len(value) > category_max_length for value in values
+        )
+    ).sum())
+    if trimmed_categories:
+        trimmed_fields['title'] = (
+            trimmed_fields.get('title', 0) + trimmed_categories
+        )
+    columns['category_titles'] = category_titles.map(
+        lambda values: [value[:category_max_length] for value in values]
+    )
+
+    normalized = pd.DataFrame(columns).astype(object)
+    normalized = normalized.where(normalized.notna(), None)
+    return [
+        ProductRecord(**values)
+        for values in normalized[list(PRODUCT_RECORD_FIELDS)].to_dict(
+            'records'
+        )
+    ]
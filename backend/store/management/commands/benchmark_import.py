@@ -0,0 +1,291 @@
+import csv
+import resource
+import shutil
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import override_settings
+from openpyxl import Workbook
+from PIL import Image
+
+from store import cards
+from store.constants import EXCEL_IMPORT_FIELD_ALIASES
+from store.importers import products_excel
+
+BENCHMARK_FORMATS = ('xlsx', 'csv')
+BENCHMARK_PHASES = ('parse', 'normalize', 'db', 'images')
+# Функции импорта и фаза, в которую засчитывается время их работы.
+# Карточки при импорте строятся отложенно, поэтому замеряется cards._refresh,
+# который вызывают и сброс после пачки, и выход из отложенного блока.
+PHASE_FUNCTIONS = (
+    (products_excel, 'normalize_products_dataframe', 'normalize'),
+    (products_excel, 'plan_product_records', 'db'),
+    (products_excel, 'find_removed_products', 'db'),
+    (products_excel, 'save_product_batch', 'db'),
+    (products_excel, 'save_batch_categories', 'db'),
+    (products_excel, 'update_product_search_vectors', 'db'),
+    (cards, '_refresh', 'db'),
+    (products_excel, 'get_product_images_state', 'db'),
+    (products_excel, 'import_product_images', 'images'),
+)
+
+
+def get_benchmark_columns():
+    '''
+    По одной колонке на поле импорта — первый синоним из
+    EXCEL_IMPORT_FIELD_ALIASES.
+    '''
+    return {
+        field_name: aliases[0]
+        for field_name, aliases in EXCEL_IMPORT_FIELD_ALIASES.items()
+    }
+
+
+def build_benchmark_row(index, photo_links):
+    return {
+        'title': f'Тестовый товар {index}',
+        'description': f'Описание тестового товара {index}',
+        'pr_type': 'Помада',
+        'price': 100 + index % 900,
+        'old_price': 1000 + index % 900,
+        'is_new': 'да' if index % 2 else 'нет',
+        'ingredients': 'Вода, глицерин, отдушка',
+        'country': 'Россия',
+        'size': '10 мл',
+        'effect': 'Увлажнение',
+        'color': f'Оттенок {index % 50}',
+        'collection': f'Коллекция {index % 10}',
+        'full_weight': 50 + index % 500,
+        'product_weight': 40 + index % 500,
+        'volume': 10 + index % 90,
+        'categories': f'Категория {index % 20}; Категория {index % 7 + 20}',
+        'photos': '; '.join(photo_links),
+    }
+
+
+def iter_benchmark_rows(rows, photos_per_row, image_url):
+    '''
+    Строки синтетического файла: заголовок, служебная строка
+    и rows строк товаров.
+    '''
+    columns = get_benchmark_columns()
+    yield list(columns.values())
+    yield ['Это номер или название товара'] + [''] * (len(columns) - 1)
+    for index in range(rows):
+        photo_links = [
+            f'{image_url}/{index}/{number}.jpg'
+            for number in range(photos_per_row)
+        ]
+        values = build_benchmark_row(index, photo_links)
+        yield [values[field_name] for field_name in columns]
+
+
+def write_benchmark_file(path, file_format, rows):
+    if file_format == 'csv':
+        with open(path, 'w', encoding='utf-8-sig', newline='') as file:
+            csv.writer(file, delimiter=';').writerows(rows)
+        return
+
+    workbook = Workbook(write_only=True)
+    worksheet = workbook.create_sheet()
+    for row in rows:
+        worksheet.append(row)
+    workbook.save(path)
+
+
+def build_benchmark_image():
+    buffer = BytesIO()
+    Image.new('RGB', (64, 64), (200, 80, 120)).save(buffer, 'JPEG')
+    return buffer.getvalue()
+
+
+@contextmanager
+def serve_benchmark_images():
+    '''
+    Локальный HTTP-сервер, который отдаёт JPEG по любому пути.
+
+    К картинке дописывается путь запроса, чтобы у разных ссылок
+    различались хэши и импорт не отбрасывал их как дубликаты.
+    '''
+    image = build_benchmark_image()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = image + self.path.encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'image/jpeg')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        yield f'http://127.0.0.1:{server.server_port}'
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+@contextmanager
+def measure_phases(timings):
+    '''
+    На время импорта подменяет функции из PHASE_FUNCTIONS обёртками,
+    которые суммируют время их работы в timings по фазам.
+    '''
+    def timed(function, phase):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                timings[phase] += time.perf_counter() - started
+        return wrapper
+
+    class TimedFileReader(products_excel.ProductFileReader):
+        def __iter__(self):
+            chunks = super().__iter__()
+            while True:
+                started = time.perf_counter()
+                try:
+                    df = next(chunks)
+                except StopIteration:
+                    return
+                finally:
+                    timings['parse'] += time.perf_counter() - started
+                yield df
+
+    originals = {
+        (module, name): getattr(module, name)
+        for module, name, _ in PHASE_FUNCTIONS
+    }
+    originals[products_excel, 'ProductFileReader'] = (
+        products_excel.ProductFileReader
+    )
+    for module, name, phase in PHASE_FUNCTIONS:
+        setattr(module, name, timed(originals[module, name], phase))
+    products_excel.ProductFileReader = TimedFileReader
+    try:
+        yield
+    finally:
+        for (module, name), function in originals.items():
+            setattr(module, name, function)
+
+
+def get_peak_rss_mb():
+    # На Linux ru_maxrss — в килобайтах. Это максимум за всё время жизни
+    # процесса, а не за один импорт.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет скорость импорта товаров на синтетических файлах .xlsx '
+        'и .csv с локальным сервером фотографий. Импорт идёт в одной '
+        'транзакции в БД default и откатывается, поэтому пакеты не '
+        'коммитятся по отдельности, а таблицы товаров заблокированы до '
+        'конца замера: не запускайте на рабочей БД. Фотографии пишутся '
+        'во временный MEDIA_ROOT. Пиковый RSS накопительный: для '
+        'отдельного замера запускайте один размер и формат.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rows',
+            type=int,
+            nargs='+',
+            default=[1000, 10000, 100000],
+            help='Размеры файлов в строках.',
+        )
+        parser.add_argument(
+            '--formats',
+            nargs='+',
+            choices=BENCHMARK_FORMATS,
+            default=list(BENCHMARK_FORMATS),
+            help='Форматы файлов.',
+        )
+        parser.add_argument(
+            '--photos-per-row',
+            type=int,
+            default=1,
+            help='Ссылок на фото в каждой строке.',
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f'БД: {connection.vendor} {connection.settings_dict["NAME"]}, '
+            'изменения откатываются.'
+        )
+        directory = tempfile.mkdtemp(prefix='import-benchmark-')
+        try:
+            with serve_benchmark_images() as image_url, override_settings(
+                MEDIA_ROOT=str(Path(directory) / 'media'),
+            ):
+                # По возрастанию: пиковый RSS процесса только растёт.
+                for rows in sorted(options['rows']):
+                    for file_format in options['formats']:
+                        path = Path(directory) / f'{rows}.{file_format}'
+                        write_benchmark_file(
+                            path,
+                            file_format,
+                            iter_benchmark_rows(
+                                rows,
+                                options['photos_per_row'],
+                                image_url,
+                            ),
+                        )
+                        self.report(file_format, rows, *self.run_import(path))
+                        path.unlink()
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    def run_import(self, path):
+        timings = defaultdict(float)
+        queries = 0
+
+        def count_queries(execute, sql, params, many, context):
+            nonlocal queries
+            queries += 1
+            return execute(sql, params, many, context)
+
+        with transaction.atomic():
+            with open(path, 'rb') as file, measure_phases(timings), \
+                    connection.execute_wrapper(count_queries):
+                started = time.perf_counter()
+                result = products_excel.import_products_from_excel(file)
+                timings['total'] = time.perf_counter() - started
+            # Фоновые задачи on_commit не запускаются вместе с откатом.
+            transaction.set_rollback(True)
+
+        return timings, queries, result
+
+    def report(self, file_format, rows, timings, queries, result):
+        total = timings['total']
+        other = total - sum(timings[phase] for phase in BENCHMARK_PHASES)
+        phases = ', '.join(
+            f'{phase} {timings[phase]:.2f}s'
+            for phase in BENCHMARK_PHASES
+        )
+        self.stdout.write(
+            f'{file_format} {rows} строк: {total:.2f}s, '
+            f'{rows / total if total else 0:.0f} строк/с, '
+            f'запросов {queries}, '
+            f'пиковый RSS процесса {get_peak_rss_mb():.0f} МБ\n'
+            f'  {phases}, прочее {other:.2f}s; '
+            f'импортировано {result.imported}, '
+            f'ошибок фото {result.failed_images}'
+        )
@@ -0,0 +1,62 @@
+import posixpath
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from store.images import is_recently_modified
+from store.models import ProductImage
+
+
+def walk_storage(directory):
+    directories, files = default_storage.listdir(directory)
+    for filename in files:
+        yield posixpath.join(directory, filename)
+    for subdirectory in directories:
+        yield from walk_storage(posixpath.join(directory, subdirectory))
+
+
+class Command(BaseCommand):
+    help = (
+        'Удаляет из хранилища изображения товаров и превью, на которые '
+        'не ссылается ни одна запись. Недавно изменённые файлы '
+        'пропускаются: на них могут ссылаться ещё не сохранённые записи.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать файлы, ничего не удаляя.',
+        )
+
+    def handle(self, *args, **options):
+        referenced = set()
+        for name, variants in ProductImage.objects.values_list(
+            'image',
+            'variants',
+        ).iterator():
+            referenced.add(name)
+            referenced.update(
+                item['image'] for item in variants.get('items', ())
+            )
+
+        upload_to = ProductImage._meta.get_field('image').upload_to
+        directory = upload_to.rstrip('/')
+        if not default_storage.exists(directory):
+            self.stdout.write('Каталог изображений пуст.')
+            return
+
+        orphaned = [
+            name
+            for name in walk_storage(directory)
+            if name not in referenced and not is_recently_modified(name)
+        ]
+        for name in orphaned:
+            self.stdout.write(name)
+            if not options['dry_run']:
+                default_storage.delete(name)
+
+        action = 'Найдено' if options['dry_run'] else 'Удалено'
+        self.stdout.write(self.style.SUCCESS(
+            f'{action} неиспользуемых файлов: {len(orphaned)}.'
+        ))
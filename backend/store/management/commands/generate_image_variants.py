@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from store.images import generate_image_variants, has_current_variants
+from store.models import ProductImage
+from store.tasks import generate_product_image_variants
+
+
+class Command(BaseCommand):
+    help = 'Генерирует WebP/AVIF-превью для изображений товаров без них.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sync',
+            action='store_true',
+            help='Генерировать в текущем процессе, а не через Celery.',
+        )
+
+    def handle(self, *args, **options):
+        pending = [
+            product_image.pk
+            for product_image in ProductImage.objects.only(
+                'pk', 'image', 'variants',
+            ).iterator()
+            if product_image.image and not has_current_variants(product_image)
+        ]
+
+        for image_id in pending:
+            if options['sync']:
+                generate_image_variants(image_id)
+            else:
+                generate_product_image_variants.delay(image_id)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Изображений без превью: {len(pending)}.'
+        ))
@@ -0,0 +1,52 @@
+import django.contrib.postgres.search
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+
+SEARCH_VECTOR_INDEX_NAME = 'store_product_search_vector_gin'
+
+
+def create_search_vector_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    Product = apps.get_model('store', 'Product')
+    schema_editor.execute(
+        f'CREATE INDEX IF NOT EXISTS {SEARCH_VECTOR_INDEX_NAME} '
+        f'ON {Product._meta.db_table} USING gin (search_vector)'
+    )
+    Product.objects.update(search_vector=(
+        SearchVector('title', weight='A', config='russian')
+        + SearchVector('pr_type', 'collection', weight='B', config='russian')
+        + SearchVector('description', weight='C', config='russian')
+        + SearchVector('ingredients', weight='D', config='russian')
+    ))
+
+
+def drop_search_vector_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    schema_editor.execute(f'DROP INDEX IF EXISTS {SEARCH_VECTOR_INDEX_NAME}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0020_product_how_to_use'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(
+                editable=False,
+                null=True,
+                verbose_name='Поисковый индекс',
+            ),
+        ),
+        migrations.RunPython(
+            create_search_vector_index,
+            drop_search_vector_index,
+        ),
+    ]
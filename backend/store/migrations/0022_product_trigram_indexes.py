@@ -0,0 +1,46 @@
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+TRIGRAM_INDEXED_FIELDS = ('title', 'collection', 'pr_type')
+
+
+def get_index_name(field_name):
+    return f'store_product_{field_name}_trgm'
+
+
+def create_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    Product = apps.get_model('store', 'Product')
+    for field_name in TRIGRAM_INDEXED_FIELDS:
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {get_index_name(field_name)} '
+            f'ON {Product._meta.db_table} '
+            f'USING gin ({field_name} gin_trgm_ops)'
+        )
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    for field_name in TRIGRAM_INDEXED_FIELDS:
+        schema_editor.execute(
+            f'DROP INDEX IF EXISTS {get_index_name(field_name)}'
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0021_product_search_vector'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.RunPython(
+            create_trigram_indexes,
+            drop_trigram_indexes,
+        ),
+    ]
@@ -0,0 +1,110 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+BATCH_SIZE = 500
+
+
+def fill_product_cards(apps, schema_editor):
+    Product = apps.get_model('store', 'Product')
+    ProductCard = apps.get_model('store', 'ProductCard')
+    ProductImage = apps.get_model('store', 'ProductImage')
+
+    products = Product.objects.prefetch_related(
+        models.Prefetch(
+            'images',
+            queryset=ProductImage.objects.order_by('pk'),
+        ),
+        'categories',
+    ).order_by('pk')
+
+    cards = []
+    for product in products.iterator(chunk_size=BATCH_SIZE):
+        images = list(product.images.all())
+        cards.append(ProductCard(
+            product=product,
+            title=product.title,
+            price=product.price,
+            old_price=product.old_price,
+            has_discount=(
+                product.old_price is not None
+                and product.old_price > product.price
+            ),
+            is_new=product.is_new,
+            country=product.country,
+            image=images[0].image.name if images else '',
+            category_slugs=sorted(
+                category.slug for category in product.categories.all()
+            ),
+        ))
+    ProductCard.objects.bulk_create(cards, batch_size=BATCH_SIZE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0022_product_trigram_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductCard',
+            fields=[
+                ('product', models.OneToOneField(
+                    on_delete=django.db.models.deletion.CASCADE,
+                    primary_key=True,
+                    related_name='card',
+                    serialize=False,
+                    to='store.product',
+                    verbose_name='Продукт',
+                )),
+                ('title', models.CharField(
+                    max_length=128,
+                    verbose_name='Название',
+                )),
+                ('price', models.DecimalField(
+                    decimal_places=2,
+                    max_digits=12,
+                    verbose_name='Цена',
+                )),
+                ('old_price', models.DecimalField(
+                    blank=True,
+                    decimal_places=2,
+                    max_digits=12,
+                    null=True,
+                    verbose_name='Цена без скидки',
+                )),
+                ('has_discount', models.BooleanField(
+                    default=False,
+                    verbose_name='Есть скидка',
+                )),
+                ('is_new', models.BooleanField(
+                    default=False,
+                    verbose_name='Новинка',
+                )),
+                ('country', models.CharField(
+                    blank=True,
+                    max_length=64,
+                    null=True,
+                    verbose_name='Страна производства',
+                )),
+                ('image', models.CharField(
+                    blank=True,
+                    max_length=128,
+                    verbose_name='Первое изображение',
+                )),
+                ('category_slugs', models.JSONField(
+                    default=list,
+                    verbose_name='Слаги категорий',
+                )),
+                ('updated_at', models.DateTimeField(
+                    auto_now=True,
+                    verbose_name='Обновлено',
+                )),
+            ],
+            options={
+                'verbose_name': 'карточка товара',
+                'verbose_name_plural': 'Карточки товаров',
+            },
+        ),
+        migrations.RunPython(fill_product_cards, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,55 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def fill_primary_images(apps, schema_editor):
+    Product = apps.get_model('store', 'Product')
+    ProductImage = apps.get_model('store', 'ProductImage')
+
+    Product.objects.update(primary_image=models.Subquery(
+        ProductImage.objects
+        .filter(product=models.OuterRef('pk'))
+        .order_by('position', 'pk')
+        .values('pk')[:1]
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0023_productcard'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='productimage',
+            options={
+                'ordering': ('position', 'pk'),
+                'verbose_name': 'изображение',
+                'verbose_name_plural': 'Изображения',
+            },
+        ),
+        migrations.AddField(
+            model_name='productimage',
+            name='position',
+            field=models.PositiveIntegerField(
+                default=0,
+                help_text='Изображение с наименьшим порядком считается главным',
+                verbose_name='Порядок',
+            ),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='primary_image',
+            field=models.ForeignKey(
+                blank=True,
+                editable=False,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name='+',
+                to='store.productimage',
+                verbose_name='Главное изображение',
+            ),
+        ),
+        migrations.RunPython(fill_primary_images, migrations.RunPython.noop),
+    ]
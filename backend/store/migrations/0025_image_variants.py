@@ -0,0 +1,29 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0024_productimage_position_product_primary_image'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productimage',
+            name='variants',
+            field=models.JSONField(
+                default=dict,
+                editable=False,
+                help_text='WebP/AVIF-превью, генерируются в фоне после загрузки',
+                verbose_name='Превью',
+            ),
+        ),
+        migrations.AddField(
+            model_name='productcard',
+            name='image_variants',
+            field=models.JSONField(
+                default=list,
+                verbose_name='Превью первого изображения',
+            ),
+        ),
+    ]
@@ -0,0 +1,29 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0025_image_variants'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='productimage',
+            name='file_hash',
+            field=models.CharField(
+                blank=True,
+                db_index=True,
+                max_length=32,
+                null=True,
+                verbose_name='Хэш',
+            ),
+        ),
+        migrations.AddIndex(
+            model_name='productimage',
+            index=models.Index(
+                fields=['image'],
+                name='store_productimage_image_idx',
+            ),
+        ),
+    ]
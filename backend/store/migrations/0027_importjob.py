@@ -0,0 +1,91 @@
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('store', '0026_productimage_hash_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportJob',
+            fields=[
+                ('id', models.BigAutoField(
+                    auto_created=True,
+                    primary_key=True,
+                    serialize=False,
+                    verbose_name='ID',
+                )),
+                ('file', models.FileField(
+                    upload_to='imports/',
+                    verbose_name='Файл',
+                )),
+                ('status', models.CharField(
+                    choices=[
+                        ('PENDING', 'В очереди'),
+                        ('RUNNING', 'Выполняется'),
+                        ('SUCCEEDED', 'Завершён'),
+                        ('FAILED', 'Ошибка'),
+                    ],
+                    db_index=True,
+                    default='PENDING',
+                    max_length=16,
+                    verbose_name='Статус',
+                )),
+                ('task_id', models.CharField(
+                    blank=True,
+                    max_length=64,
+                    verbose_name='ID задачи',
+                )),
+                ('total_rows', models.PositiveIntegerField(
+                    default=0,
+                    verbose_name='Всего строк',
+                )),
+                ('processed_rows', models.PositiveIntegerField(
+                    default=0,
+                    verbose_name='Обработано строк',
+                )),
+                ('result', models.JSONField(
+                    blank=True,
+                    default=dict,
+                    help_text='Поля ProductImportResult',
+                    verbose_name='Счётчики',
+                )),
+                ('error_message', models.TextField(
+                    blank=True,
+                    verbose_name='Ошибка',
+                )),
+                ('created_at', models.DateTimeField(
+                    auto_now_add=True,
+                    verbose_name='Дата создания',
+                )),
+                ('started_at', models.DateTimeField(
+                    blank=True,
+                    null=True,
+                    verbose_name='Начало обработки',
+                )),
+                ('finished_at', models.DateTimeField(
+                    blank=True,
+                    null=True,
+                    verbose_name='Окончание обработки',
+                )),
+                ('created_by', models.ForeignKey(
+                    blank=True,
+                    null=True,
+                    on_delete=django.db.models.deletion.SET_NULL,
+                    related_name='import_jobs',
+                    to=settings.AUTH_USER_MODEL,
+                    verbose_name='Автор',
+                )),
+            ],
+            options={
+                'verbose_name': 'Импорт товаров',
+                'verbose_name_plural': 'Импорты товаров',
+                'ordering': ('-pk',),
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0027_importjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='import_hash',
+            field=models.CharField(
+                blank=True,
+                editable=False,
+                help_text=(
+                    'sha256 нормализованной строки последнего импорта из Excel'
+                ),
+                max_length=64,
+                verbose_name='Хэш строки импорта',
+            ),
+        ),
+        migrations.AddField(
+            model_name='importjob',
+            name='dry_run',
+            field=models.BooleanField(
+                default=False,
+                help_text='Только посчитать изменения, ничего не сохраняя',
+                verbose_name='Предпросмотр',
+            ),
+        ),
+    ]
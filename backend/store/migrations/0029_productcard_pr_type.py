@@ -0,0 +1,35 @@
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def fill_card_pr_types(apps, schema_editor):
+    Product = apps.get_model('store', 'Product')
+    ProductCard = apps.get_model('store', 'ProductCard')
+    ProductCard.objects.update(
+        pr_type=Subquery(
+            Product.objects.filter(
+                pk=OuterRef('product_id'),
+            ).values('pr_type')[:1]
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0028_import_change_detection'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productcard',
+            name='pr_type',
+            field=models.CharField(
+                blank=True,
+                default='',
+                max_length=128,
+                verbose_name='Тип продукта',
+            ),
+        ),
+        migrations.RunPython(fill_card_pr_types, migrations.RunPython.noop),
+    ]
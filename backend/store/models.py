@@ -1,13 +1,22 @@
+import os
+import posixpath
+from hashlib import md5
 from uuid import uuid4
 
+from django.contrib.postgres.search import SearchVectorField
 from django.core.exceptions import ValidationError
 from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
 from django.db.models.functions import Lower
+from PIL import Image
 from slugify import slugify
 
 from store.constants import (LONG_CHAR_MAX_LENGTH, MIN_VALUE,
+                             PRODUCT_IMAGE_EXTENSION_ALIASES,
+                             PRODUCT_IMAGE_FORMAT_EXTENSIONS,
                              PRODUCT_MAX_QUANTITY, SHORT_CHAR_MAX_LENGTH)
+from store.search import (PRODUCT_SEARCH_TEXT_FIELDS,
+                          update_product_search_vectors)
 from users.models import CustomUser
 
 
@@ -176,6 +185,27 @@ class Product(AbstractModel):
         related_name='products',
         verbose_name='Категории'
     )
+    search_vector = SearchVectorField(
+        'Поисковый индекс',
+        editable=False,
+        null=True,
+    )
+    primary_image = models.ForeignKey(
+        'ProductImage',
+        on_delete=models.SET_NULL,
+        related_name='+',
+        verbose_name='Главное изображение',
+        editable=False,
+        blank=True,
+        null=True,
+    )
+    import_hash = models.CharField(
+        'Хэш строки импорта',
+        max_length=SHORT_CHAR_MAX_LENGTH,
+        blank=True,
+        editable=False,
+        help_text='sha256 нормализованной строки последнего импорта из Excel',
+    )
 
     def clean(self):
         super().clean()
@@ -186,6 +216,14 @@ class Product(AbstractModel):
                     'Цена без скидки должна быть больше актуальной цены.'
                 })
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or set(update_fields) & set(
+            PRODUCT_SEARCH_TEXT_FIELDS
+        ):
+            update_product_search_vectors((self.pk,))
+
     @property
     def has_discount(self):
         return self.old_price is not None and self.old_price > self.price
@@ -196,9 +234,57 @@ class Product(AbstractModel):
         ordering = ('title',)
 
 
+def get_image_extension(file, filename):
+    '''
+    Расширение файла изображения по формату его содержимого.
+
+    Одни и те же байты под именами .jpg и .jpeg получают одно имя
+    в хранилище. Если Pillow не распознал формат, берётся расширение
+    из имени файла.
+    '''
+    try:
+        file.seek(0)
+        with Image.open(file) as image:
+            image_format = image.format
+    except (OSError, ValueError, Image.DecompressionBombError):
+        image_format = None
+    finally:
+        file.seek(0)
+    if image_format:
+        return PRODUCT_IMAGE_FORMAT_EXTENSIONS.get(
+            image_format,
+            f'.{image_format.lower()}',
+        )
+    extension = posixpath.splitext(filename)[1].lower()
+    return PRODUCT_IMAGE_EXTENSION_ALIASES.get(extension, extension)
+
+
+def get_content_addressed_name(upload_to, file_hash, extension):
+    '''
+    Путь файла по хэшу содержимого: products/ab/abcdef….jpg.
+    '''
+    return posixpath.join(upload_to, file_hash[:2], f'{file_hash}{extension}')
+
+
+def touch_stored_file(storage, name):
+    '''
+    Обновляет время изменения файла в хранилище.
+
+    Возвращает False, если файла нет или хранилище не даёт путь к нему.
+    '''
+    try:
+        os.utime(storage.path(name))
+    except (NotImplementedError, OSError):
+        return False
+    return True
+
+
 class ProductImage(models.Model):
     '''
     Модель изображений продуктов.
+
+    Файлы хранятся по хэшу содержимого, поэтому одинаковые фотографии
+    разных товаров лежат в хранилище один раз.
     '''
     product = models.ForeignKey(
         Product,
@@ -213,12 +299,226 @@ class ProductImage(models.Model):
         'Хэш',
         max_length=32,
         blank=True,
-        null=True
+        null=True,
+        db_index=True,
+    )
+    position = models.PositiveIntegerField(
+        'Порядок',
+        help_text='Изображение с наименьшим порядком считается главным',
+        default=0,
+    )
+    variants = models.JSONField(
+        'Превью',
+        help_text='WebP/AVIF-превью, генерируются в фоне после загрузки',
+        default=dict,
+        editable=False,
     )
 
     class Meta:
         verbose_name = 'изображение'
         verbose_name_plural = 'Изображения'
+        ordering = ('position', 'pk')
+        indexes = (
+            models.Index(
+                fields=('image',),
+                name='store_productimage_image_idx',
+            ),
+        )
+
+    def save(self, *args, **kwargs):
+        if self.image and not self.image._committed:
+            self.store_content_addressed()
+        super().save(*args, **kwargs)
+
+    def store_content_addressed(self):
+        '''
+        Сохраняет новый файл под именем по md5 содержимого.
+
+        Если такой файл уже есть в хранилище, повторно он не записывается,
+        а готовые превью берутся у изображения с тем же файлом. Время
+        изменения файла обновляется: пока запись не сохранена, очистка
+        другого удаления не тронет свежий файл.
+        '''
+        hasher = md5()
+        for chunk in self.image.chunks():
+            hasher.update(chunk)
+        self.file_hash = hasher.hexdigest()
+
+        field = self._meta.get_field('image')
+        name = get_content_addressed_name(
+            field.upload_to,
+            self.file_hash,
+            get_image_extension(self.image, self.image.name),
+        )
+        storage = self.image.storage
+        if not touch_stored_file(storage, name) and not storage.exists(name):
+            name = storage.save(name, self.image.file)
+        self.image.name = name
+        self.image._committed = True
+
+        self.variants = ProductImage.objects.filter(
+            image=name,
+            variants__source=name,
+        ).values_list('variants', flat=True).first() or {}
+        for item in self.variants.get('items', ()):
+            touch_stored_file(storage, item['image'])
+
+
+class ProductCard(models.Model):
+    '''
+    Денормализованная карточка товара для списка каталога.
+
+    Обновляется сигналами при изменении товара, его изображений
+    и категорий (см. store.cards).
+    '''
+    product = models.OneToOneField(
+        Product,
+        primary_key=True,
+        related_name='card',
+        on_delete=models.CASCADE,
+        verbose_name='Продукт',
+    )
+    title = models.CharField(
+        'Название',
+        max_length=LONG_CHAR_MAX_LENGTH,
+    )
+    price = models.DecimalField(
+        'Цена',
+        max_digits=12,
+        decimal_places=2,
+    )
+    old_price = models.DecimalField(
+        'Цена без скидки',
+        max_digits=12,
+        decimal_places=2,
+        blank=True,
+        null=True,
+    )
+    pr_type = models.CharField(
+        'Тип продукта',
+        max_length=LONG_CHAR_MAX_LENGTH,
+        blank=True,
+        default='',
+    )
+    has_discount = models.BooleanField('Есть скидка', default=False)
+    is_new = models.BooleanField('Новинка', default=False)
+    country = models.CharField(
+        'Страна производства',
+        max_length=SHORT_CHAR_MAX_LENGTH,
+        blank=True,
+        null=True,
+    )
+    image = models.CharField(
+        'Первое изображение',
+        max_length=LONG_CHAR_MAX_LENGTH,
+        blank=True,
+    )
+    image_variants = models.JSONField(
+        'Превью первого изображения',
+        default=list,
+    )
+    category_slugs = models.JSONField('Слаги категорий', default=list)
+    updated_at = models.DateTimeField('Обновлено', auto_now=True)
+
+    class Meta:
+        verbose_name = 'карточка товара'
+        verbose_name_plural = 'Карточки товаров'
+
+
+class ImportJob(models.Model):
+    '''
+    Фоновый импорт товаров из Excel-файла.
+
+    Файл сохраняется при загрузке в админке и обрабатывается задачей
+    Celery, которая по ходу работы обновляет прогресс и счётчики.
+    '''
+    class Status(models.TextChoices):
+        PENDING = 'PENDING', 'В очереди'
+        RUNNING = 'RUNNING', 'Выполняется'
+        SUCCEEDED = 'SUCCEEDED', 'Завершён'
+        FAILED = 'FAILED', 'Ошибка'
+
+    ACTIVE_STATUSES = (Status.PENDING, Status.RUNNING)
+
+    file = models.FileField(
+        'Файл',
+        upload_to='imports/',
+    )
+    dry_run = models.BooleanField(
+        'Предпросмотр',
+        default=False,
+        help_text='Только посчитать изменения, ничего не сохраняя',
+    )
+    status = models.CharField(
+        'Статус',
+        choices=Status.choices,
+        db_index=True,
+        default=Status.PENDING,
+        max_length=16,
+    )
+    task_id = models.CharField(
+        'ID задачи',
+        blank=True,
+        max_length=SHORT_CHAR_MAX_LENGTH,
+    )
+    total_rows = models.PositiveIntegerField(
+        'Всего строк',
+        default=0,
+    )
+    processed_rows = models.PositiveIntegerField(
+        'Обработано строк',
+        default=0,
+    )
+    result = models.JSONField(
+        'Счётчики',
+        blank=True,
+        default=dict,
+        help_text='Поля ProductImportResult',
+    )
+    error_message = models.TextField(
+        'Ошибка',
+        blank=True,
+    )
+    created_by = models.ForeignKey(
+        CustomUser,
+        on_delete=models.SET_NULL,
+        related_name='import_jobs',
+        blank=True,
+        null=True,
+        verbose_name='Автор',
+    )
+    created_at = models.DateTimeField(
+        'Дата создания',
+        auto_now_add=True,
+    )
+    started_at = models.DateTimeField(
+        'Начало обработки',
+        blank=True,
+        null=True,
+    )
+    finished_at = models.DateTimeField(
+        'Окончание обработки',
+        blank=True,
+        null=True,
+    )
+
+    @property
+    def is_active(self):
+        return self.status in self.ACTIVE_STATUSES
+
+    @property
+    def progress(self):
+        if not self.total_rows:
+            return 0
+        return min(100, self.processed_rows * 100 // self.total_rows)
+
+    def __str__(self):
+        return f'Импорт #{self.id} — {self.get_status_display()}'
+
+    class Meta:
+        verbose_name = 'Импорт товаров'
+        verbose_name_plural = 'Импорты товаров'
+        ordering = ('-pk',)
 
 
 class Cart(models.Model):
@@ -1,7 +1,200 @@
-from rest_framework.pagination import PageNumberPagination
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as BinasciiError
+from functools import partial
+
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db.models import F, Q
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+from store.cache import get_catalog_filter_cache_key
 
 
 class CustomPageNumberPagination(PageNumberPagination):
     page_size = 20
     page_size_query_param = 'page_size'
     max_page_size = 50
+
+
+class CachedCountPaginator(Paginator):
+    '''
+    Paginator, который берёт общее количество объектов из кэша.
+    '''
+
+    def __init__(self, object_list, per_page, count_cache_key=None,
+                 count_cache_timeout=None, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.count_cache_key = count_cache_key
+        self.count_cache_timeout = count_cache_timeout
+
+    @cached_property
+    def count(self):
+        if self.count_cache_key is None:
+            return super().count
+
+        count = cache.get(self.count_cache_key)
+        if count is None:
+            count = super().count
+            cache.set(
+                self.count_cache_key,
+                count,
+                timeout=self.count_cache_timeout,
+            )
+        return count
+
+
+class KeysetPagination(BasePagination):
+    '''
+    Keyset-пагинация по активной сортировке с id в качестве тай-брейка.
+
+    Не выполняет COUNT(*) и OFFSET: следующая страница выбирается условием
+    «после последней записи предыдущей».
+    '''
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Неверный курсор.'
+    page_size = CustomPageNumberPagination.page_size
+    page_size_query_param = CustomPageNumberPagination.page_size_query_param
+    max_page_size = CustomPageNumberPagination.max_page_size
+    ordering_fields = ('price', 'old_price', 'title')
+    default_ordering = 'title'
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def get_ordering(self, request):
+        ordering = request.query_params.get(api_settings.ORDERING_PARAM, '')
+        first_term = ordering.split(',')[0].strip()
+        field_name = first_term.lstrip('-')
+        if field_name in self.ordering_fields:
+            return field_name, first_term.startswith('-')
+        return self.default_ordering, False
+
+    def decode_cursor(self, request, ordering):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+
+        try:
+            cursor = json.loads(urlsafe_b64decode(encoded.encode()))
+            value, pk, cursor_ordering = cursor['v'], cursor['id'], cursor['o']
+        except (BinasciiError, TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+
+        if cursor_ordering != list(ordering) or not isinstance(pk, int):
+            raise NotFound(self.invalid_cursor_message)
+        return value, pk
+
+    def encode_cursor(self, instance, ordering):
+        field_name, _ = ordering
+        value = getattr(instance, field_name)
+        cursor = {
+            'v': None if value is None else str(value),
+            'id': instance.pk,
+            'o': list(ordering),
+        }
+        return urlsafe_b64encode(json.dumps(cursor).encode()).decode()
+
+    def get_cursor_filter(self, ordering, value, pk):
+        field_name, descending = ordering
+        # NULL-значения всегда идут в конце выдачи (nulls_last).
+        if value is None:
+            return Q(**{f'{field_name}__isnull': True, 'pk__gt': pk})
+
+        lookup = 'lt' if descending else 'gt'
+        return (
+            Q(**{f'{field_name}__{lookup}': value})
+            | Q(**{field_name: value, 'pk__gt': pk})
+            | Q(**{f'{field_name}__isnull': True})
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+        ordering = self.get_ordering(request)
+        field_name, descending = ordering
+
+        order_expression = (
+            F(field_name).desc(nulls_last=True)
+            if descending
+            else F(field_name).asc(nulls_last=True)
+        )
+        queryset = queryset.order_by(order_expression, 'pk')
+
+        cursor = self.decode_cursor(request, ordering)
+        if cursor is not None:
+            queryset = queryset.filter(
+                self.get_cursor_filter(ordering, *cursor)
+            )
+
+        results = list(queryset[:page_size + 1])
+        self.next_cursor = None
+        if len(results) > page_size:
+            results = results[:page_size]
+            self.next_cursor = self.encode_cursor(results[-1], ordering)
+        return results
+
+    def get_next_link(self):
+        if self.next_cursor is None:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param,
+            self.next_cursor,
+        )
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+
+class CatalogPagination(CustomPageNumberPagination):
+    '''
+    Постраничная пагинация каталога с опциональным keyset-режимом.
+
+    Keyset включается параметром `cursor` (для первой страницы — пустым).
+    Выдача поиска, отсортированная по релевантности, всегда листается
+    постранично: ранг нельзя использовать как ключ курсора.
+    Общее количество в постраничном режиме кэшируется по набору фильтров,
+    поэтому при листании одной выборки COUNT(*) выполняется один раз.
+    '''
+    keyset_pagination_class = KeysetPagination
+    count_cache_timeout = 60 * 60
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = None
+        if (
+            self.keyset_pagination_class.cursor_query_param
+            in request.query_params
+            and 'search_rank' not in queryset.query.annotations
+        ):
+            self.keyset = self.keyset_pagination_class()
+            return self.keyset.paginate_queryset(queryset, request, view)
+
+        self.django_paginator_class = partial(
+            CachedCountPaginator,
+            count_cache_key=get_catalog_filter_cache_key(
+                'count',
+                request.query_params,
+            ),
+            count_cache_timeout=self.count_cache_timeout,
+        )
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
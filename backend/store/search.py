@@ -0,0 +1,127 @@
+import re
+from functools import reduce
+from operator import or_
+
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            SearchVector,
+                                            TrigramWordSimilarity)
+from django.db import connection
+from django.db.models import F, Q
+from django.db.models.functions import Greatest
+
+PRODUCT_SEARCH_CONFIG = 'russian'
+PRODUCT_SEARCH_TEXT_FIELDS = (
+    'title',
+    'pr_type',
+    'collection',
+    'description',
+    'ingredients',
+)
+PRODUCT_SEARCH_FALLBACK_FIELDS = ('title', 'description', 'pr_type')
+PRODUCT_SUGGEST_FIELDS = ('title', 'collection', 'pr_type')
+
+
+def is_full_text_search_available():
+    return connection.vendor == 'postgresql'
+
+
+def get_prefix_search_query(term):
+    '''
+    Запрос to_tsquery, где все слова обязательны, а последнее ищется
+    по префиксу: поиск по мере ввода («пом» находит «Помада»).
+    '''
+    words = re.findall(r'\w+', term)
+    if not words:
+        return None
+    return ' & '.join((*words[:-1], f'{words[-1]}:*'))
+
+
+def get_product_search_vector():
+    return (
+        SearchVector('title', weight='A', config=PRODUCT_SEARCH_CONFIG)
+        + SearchVector(
+            'pr_type',
+            'collection',
+            weight='B',
+            config=PRODUCT_SEARCH_CONFIG,
+        )
+        + SearchVector('description', weight='C', config=PRODUCT_SEARCH_CONFIG)
+        + SearchVector('ingredients', weight='D', config=PRODUCT_SEARCH_CONFIG)
+    )
+
+
+def update_product_search_vectors(product_ids=None):
+    '''
+    Пересчитывает сохранённый tsvector товаров (только PostgreSQL).
+    '''
+    from store.models import Product
+
+    if not is_full_text_search_available():
+        return 0
+
+    queryset = Product.objects.all()
+    if product_ids is not None:
+        queryset = queryset.filter(pk__in=product_ids)
+    return queryset.update(search_vector=get_product_search_vector())
+
+
+def search_products(queryset, term, rank=True):
+    '''
+    Полнотекстовый поиск товаров.
+
+    На PostgreSQL использует GIN-индекс по search_vector и ранжирует
+    результаты, на остальных СУБД откатывается к icontains.
+    '''
+    if not is_full_text_search_available():
+        for word in term.split():
+            queryset = queryset.filter(reduce(or_, (
+                Q(**{f'{field_name}__icontains': word})
+                for field_name in PRODUCT_SEARCH_FALLBACK_FIELDS
+            )))
+        return queryset
+
+    raw_query = get_prefix_search_query(term)
+    if raw_query is None:
+        return queryset.none()
+
+    query = SearchQuery(
+        raw_query,
+        search_type='raw',
+        config=PRODUCT_SEARCH_CONFIG,
+    )
+    queryset = queryset.filter(search_vector=query)
+    if rank:
+        queryset = queryset.annotate(
+            search_rank=SearchRank(F('search_vector'), query),
+        ).order_by('-search_rank', 'title', 'pk')
+    return queryset
+
+
+def suggest_products(term, limit):
+    '''
+    Подсказки по названию, коллекции и типу товара с учётом опечаток.
+
+    На PostgreSQL использует pg_trgm (word similarity) и GIN-индексы
+    с gin_trgm_ops, на остальных СУБД — icontains.
+    '''
+    from store.models import Product
+
+    queryset = Product.objects.annotate(first_image=F('primary_image__image'))
+
+    if not is_full_text_search_available():
+        queryset = queryset.filter(reduce(or_, (
+            Q(**{f'{field_name}__icontains': term})
+            for field_name in PRODUCT_SUGGEST_FIELDS
+        ))).order_by('title', 'pk')
+    else:
+        queryset = queryset.filter(reduce(or_, (
+            Q(**{f'{field_name}__trigram_word_similar': term})
+            for field_name in PRODUCT_SUGGEST_FIELDS
+        ))).annotate(
+            similarity=Greatest(*(
+                TrigramWordSimilarity(term, field_name)
+                for field_name in PRODUCT_SUGGEST_FIELDS
+            )),
+        ).order_by('-similarity', 'title', 'pk')
+
+    return queryset.only('pk', 'title', 'price')[:limit]
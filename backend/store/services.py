@@ -2,10 +2,8 @@ import logging
 from decimal import ROUND_HALF_UP, Decimal
 from urllib.parse import urlparse
 
-import pandas as pd
 import requests
 from django.conf import settings
-from django.core.files.base import ContentFile
 from django.db import transaction
 
 from api.exceptions import ExternalAPIError
@@ -501,32 +499,3 @@ def status_update(payment_attempts):
             )
 
     return result
-
-
-def image_download(link, name=None):
-    '''
-    Скачивает изображение по URL.
-    '''
-    try:
-        response = requests.get(
-            link,
-            timeout=20,
-            headers={'User-Agent': 'revolline-import/1.0'},
-        )
-        response.raise_for_status()
-    except requests.RequestException as exc:
-        logger.warning('Image download failed for %s: %s', link, exc)
-        return None
-
-    if not name:
-        name = link.split('/')[-1]
-
-    return ContentFile(response.content, name=name)
-
-
-def clean_value(value, default=None):
-    if pd.isna(value):
-        return default
-    if isinstance(value, str):
-        return value.strip()
-    return value
@@ -0,0 +1,133 @@
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete, pre_save)
+from django.dispatch import receiver
+
+from store.cache import (bump_cache_generation,
+                         invalidate_favorite_product_ids)
+from store.cards import refresh_product_cards, update_primary_images
+from store.cart import invalidate_cart_summary
+from store.images import (enqueue_image_variants, has_current_variants,
+                          schedule_orphaned_image_cleanup)
+from store.models import (Cart, Category, Favorites, Product, ProductImage,
+                          Promocode, Section)
+
+CATALOG_CACHE_SENDERS = (Product, ProductImage, Category, Section, Promocode)
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def invalidate_catalog_cache(sender, **kwargs):
+    if sender in CATALOG_CACHE_SENDERS:
+        bump_cache_generation(sender._meta.model_name)
+
+
+@receiver(m2m_changed, sender=Product.categories.through)
+def invalidate_product_categories_cache(sender, action, **kwargs):
+    if action.startswith('post_'):
+        bump_cache_generation('product')
+
+
+@receiver(m2m_changed, sender=Section.categories.through)
+def invalidate_section_categories_cache(sender, action, **kwargs):
+    if action.startswith('post_'):
+        bump_cache_generation('section')
+
+
+@receiver(post_save, sender=Favorites)
+@receiver(post_delete, sender=Favorites)
+def invalidate_favorites_cache(sender, instance, **kwargs):
+    invalidate_favorite_product_ids(instance.user_id)
+
+
+@receiver(post_save, sender=Cart)
+@receiver(post_delete, sender=Cart)
+def invalidate_cart_summary_cache(sender, instance, **kwargs):
+    invalidate_cart_summary(instance.user_id)
+
+
+@receiver(post_save, sender=Product)
+def refresh_product_card(sender, instance, raw=False, **kwargs):
+    if not raw:
+        refresh_product_cards((instance.pk,))
+
+
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+def refresh_product_primary_image(sender, instance, raw=False, **kwargs):
+    if not raw:
+        update_primary_images((instance.product_id,))
+
+
+@receiver(post_save, sender=ProductImage)
+def generate_product_image_variants(sender, instance, raw=False, **kwargs):
+    if not raw and instance.image and not has_current_variants(instance):
+        enqueue_image_variants(instance.pk)
+
+
+@receiver(pre_save, sender=ProductImage)
+def remember_replaced_image(sender, instance, raw=False, **kwargs):
+    instance._replaced_image = None
+    if raw or instance._state.adding:
+        return
+
+    previous = sender.objects.filter(pk=instance.pk).values(
+        'image',
+        'variants',
+    ).first()
+    if previous and previous['image'] != instance.image.name:
+        instance._replaced_image = previous
+
+
+@receiver(post_save, sender=ProductImage)
+def cleanup_replaced_image(sender, instance, **kwargs):
+    previous = getattr(instance, '_replaced_image', None)
+    if previous:
+        schedule_orphaned_image_cleanup(
+            previous['image'],
+            previous['variants'],
+        )
+
+
+@receiver(post_delete, sender=ProductImage)
+def cleanup_deleted_image(sender, instance, **kwargs):
+    schedule_orphaned_image_cleanup(instance.image.name, instance.variants)
+
+
+@receiver(m2m_changed, sender=Product.categories.through)
+def refresh_product_categories_cards(sender, instance, action, reverse,
+                                     pk_set, **kwargs):
+    if not reverse:
+        if action.startswith('post_'):
+            refresh_product_cards((instance.pk,))
+        return
+
+    # Со стороны категории: до clear запоминаем товары, pk_set там пуст.
+    if action == 'pre_clear':
+        instance._card_product_ids = list(
+            instance.products.values_list('pk', flat=True)
+        )
+    elif action == 'post_clear':
+        refresh_product_cards(getattr(instance, '_card_product_ids', ()))
+    elif action.startswith('post_'):
+        refresh_product_cards(pk_set)
+
+
+@receiver(post_save, sender=Category)
+def refresh_category_cards(sender, instance, raw=False, created=False,
+                           **kwargs):
+    if not raw and not created:
+        refresh_product_cards(
+            instance.products.values_list('pk', flat=True)
+        )
+
+
+@receiver(pre_delete, sender=Category)
+def remember_category_products(sender, instance, **kwargs):
+    instance._card_product_ids = list(
+        instance.products.values_list('pk', flat=True)
+    )
+
+
+@receiver(post_delete, sender=Category)
+def refresh_deleted_category_cards(sender, instance, **kwargs):
+    refresh_product_cards(getattr(instance, '_card_product_ids', ()))
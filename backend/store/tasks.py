@@ -1,11 +1,16 @@
 import logging
+from dataclasses import asdict
 
 from celery import shared_task
 from django.conf import settings
 from django.core.mail import send_mail
 from django.utils import timezone
+from PIL import UnidentifiedImageError
 
-from store.models import Order, PaymentAttempt
+from store.constants import EXCEL_IMPORT_TIME_LIMIT
+from store.images import generate_image_variants
+from store.importers.products_excel import import_products_from_excel
+from store.models import ImportJob, Order, PaymentAttempt
 from store.notifications import (
     build_order_paid_email,
     build_payment_alert_email,
@@ -182,3 +187,89 @@ def send_payment_alert_notification(
             raise
         countdown = min(300, 2 ** self.request.retries * 30)
         raise self.retry(exc=exc, countdown=countdown)
+
+
+@shared_task(bind=True, max_retries=3, soft_time_limit=240, time_limit=300)
+def generate_product_image_variants(self, image_id):
+    try:
+        variants = generate_image_variants(image_id)
+    except UnidentifiedImageError:
+        logger.warning(
+            'Image variants skipped, file is not an image: image_id=%s',
+            image_id,
+        )
+        return {'generated': 0, 'reason': 'unidentified_image'}
+    except OSError as exc:
+        logger.warning(
+            'Image variants generation failed: image_id=%s retry=%s error=%s',
+            image_id,
+            self.request.retries,
+            exc,
+        )
+        raise self.retry(exc=exc, countdown=60)
+
+    if variants is None:
+        return {'generated': 0, 'reason': 'image_changed'}
+
+    logger.info(
+        'Image variants generated: image_id=%s count=%s',
+        image_id,
+        len(variants['items']),
+    )
+    return {'generated': len(variants['items'])}
+
+
+@shared_task(
+    bind=True,
+    soft_time_limit=EXCEL_IMPORT_TIME_LIMIT,
+    time_limit=EXCEL_IMPORT_TIME_LIMIT + 60,
+)
+def import_products_job(self, job_id):
+    jobs = ImportJob.objects.filter(pk=job_id)
+    # Задача может быть доставлена повторно, запускаем только ожидающий импорт.
+    if not jobs.filter(status=ImportJob.Status.PENDING).update(
+        status=ImportJob.Status.RUNNING,
+        started_at=timezone.now(),
+    ):
+        logger.warning(
+            'Import job is missing or already started: job_id=%s',
+            job_id,
+        )
+        return {'imported': 0, 'reason': 'not_pending'}
+
+    def progress(processed_rows, total_rows, result):
+        jobs.update(
+            processed_rows=processed_rows,
+            total_rows=total_rows,
+            result=asdict(result),
+        )
+
+    try:
+        job = jobs.get()
+        with job.file.open('rb') as file:
+            result = import_products_from_excel(
+                file,
+                progress,
+                dry_run=job.dry_run,
+            )
+    except Exception as exc:
+        logger.exception('Product import failed: job_id=%s', job_id)
+        jobs.update(
+            status=ImportJob.Status.FAILED,
+            error_message=str(exc) or exc.__class__.__name__,
+            finished_at=timezone.now(),
+        )
+        raise
+
+    jobs.update(
+        status=ImportJob.Status.SUCCEEDED,
+        result=asdict(result),
+        finished_at=timezone.now(),
+    )
+    logger.info(
+        'Product import completed: job_id=%s imported=%s failed_rows=%s',
+        job_id,
+        result.imported,
+        result.failed_rows,
+    )
+    return asdict(result)
@@ -1,14 +1,51 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import defaultdict
 from decimal import Decimal
+from hashlib import md5
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO, StringIO
 from types import SimpleNamespace
 from unittest.mock import Mock, patch
 from uuid import uuid4
 
+import pandas as pd
+from django.contrib.admin.sites import AdminSite
+from django.contrib.auth.models import Permission
+from django.core.files.base import ContentFile
 from django.core import mail
+from django.core.management import call_command
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
 from django.core.exceptions import ValidationError
+from django.db import connection
 from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from PIL import Image
 
 from api.exceptions import ExternalAPIError
-from store.models import Order, PaymentAttempt, Product, ProductOrder, Promocode
+from store import cards
+from store.admin import ProductAdmin
+from store.cards import (defer_product_card_refresh,
+                         flush_product_card_refresh, refresh_product_cards)
+from store.constants import PRODUCT_IMAGE_ORPHAN_GRACE_PERIOD
+from store.images import (generate_image_variants, get_variant_formats,
+                          get_variant_name)
+from store.importers.image_downloads import ImageDownloader
+from store.importers.products_excel import (ProductImportResult,
+                                            import_products_dataframe,
+                                            submit_product_images)
+from store.importers.readers import ProductFileReader
+from store.importers.records import (ProductRecord,
+                                     normalize_products_dataframe)
+from store.management.commands.benchmark_import import measure_phases
+from store.models import (Category, ImportJob, Order, PaymentAttempt,
+                          Product, ProductCard, ProductImage, ProductOrder,
+                          Promocode)
 from store.services import (
     PAYMENT_STATUS_APPROVED,
     PAYMENT_STATUS_EXPIRED,
@@ -19,6 +56,7 @@ from store.services import (
     status_update,
 )
 from store.tasks import (
+    import_products_job,
     send_order_paid_notification,
     send_payment_alert_notification,
 )
@@ -374,3 +412,978 @@ class PaymentNotificationTests(TestCase):
         self.assertIn('payment_creation_unknown', email.body)
         self.assertIn('ExternalAPIError', email.body)
         self.assertIn(f'Заказ: #{self.order.id}', email.body)
+
+
+class ProductCardTests(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(
+            slug='lipstick',
+            title='Помады',
+        )
+        self.product = Product.objects.create(
+            title='Помада',
+            description='Описание',
+            pr_type='Помада',
+            price=Decimal('100.00'),
+            old_price=Decimal('150.00'),
+        )
+
+    def get_card(self):
+        return ProductCard.objects.get(product=self.product)
+
+    def test_card_follows_product_changes(self):
+        self.assertTrue(self.get_card().has_discount)
+
+        self.product.price = Decimal('90.00')
+        self.product.old_price = None
+        self.product.pr_type = 'Блеск'
+        self.product.save()
+
+        card = self.get_card()
+        self.assertEqual(card.price, Decimal('90.00'))
+        self.assertFalse(card.has_discount)
+        self.assertEqual(card.pr_type, 'Блеск')
+
+    def test_card_follows_category_changes(self):
+        self.product.categories.add(self.category)
+        self.assertEqual(self.get_card().category_slugs, ['lipstick'])
+
+        self.category.slug = 'lips'
+        self.category.save()
+        self.assertEqual(self.get_card().category_slugs, ['lips'])
+
+        self.category.products.clear()
+        self.assertEqual(self.get_card().category_slugs, [])
+
+        self.product.categories.add(self.category)
+        self.category.delete()
+        self.assertEqual(self.get_card().category_slugs, [])
+
+    def test_deferred_refresh_runs_once_on_exit(self):
+        with defer_product_card_refresh():
+            self.product.title = 'Новая помада'
+            self.product.save()
+            self.assertEqual(self.get_card().title, 'Помада')
+
+        self.assertEqual(self.get_card().title, 'Новая помада')
+
+    def test_deferred_refresh_runs_after_exception(self):
+        with self.assertRaises(RuntimeError):
+            with defer_product_card_refresh():
+                product = Product.objects.create(
+                    title='Тушь',
+                    description='Описание',
+                    pr_type='Тушь',
+                    price=Decimal('100.00'),
+                )
+                raise RuntimeError('import failed')
+
+        self.assertTrue(ProductCard.objects.filter(product=product).exists())
+
+
+class ProductPrimaryImageTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        self.media_override = override_settings(MEDIA_ROOT=media_root)
+        self.media_override.enable()
+        self.addCleanup(self.media_override.disable)
+        self.product = Product.objects.create(
+            title='Тушь',
+            description='Описание',
+            pr_type='Тушь',
+            price=Decimal('100.00'),
+        )
+
+    def add_image(self, name, position=0):
+        return ProductImage.objects.create(
+            product=self.product,
+            image=SimpleUploadedFile(name, b'image-bytes'),
+            position=position,
+        )
+
+    def test_lowest_position_becomes_primary(self):
+        first = self.add_image('first.jpg', position=1)
+        second = self.add_image('second.jpg', position=2)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.primary_image, first)
+
+        second.position = 0
+        second.save()
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.primary_image, second)
+        self.assertEqual(self.product.card.image, second.image.name)
+
+        second.delete()
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.primary_image, first)
+
+    def test_duplicate_products_sets_primary_image(self):
+        image = self.add_image('first.jpg')
+        admin = ProductAdmin(Product, AdminSite())
+
+        with patch.object(admin, 'message_user'):
+            admin.duplicate_products(
+                None,
+                Product.objects.filter(pk=self.product.pk),
+            )
+
+        product_copy = Product.objects.get(title='Тушь (копия)')
+        self.assertEqual(
+            product_copy.primary_image.image.name,
+            image.image.name,
+        )
+        self.assertNotEqual(product_copy.primary_image, image)
+        self.assertEqual(product_copy.card.image, image.image.name)
+
+    def test_duplicate_products_resets_import_state(self):
+        Product.objects.filter(pk=self.product.pk).update(import_hash='abc')
+        admin = ProductAdmin(Product, AdminSite())
+
+        with patch.object(admin, 'message_user'), patch(
+            'store.models.update_product_search_vectors',
+        ) as update_vectors:
+            admin.duplicate_products(
+                None,
+                Product.objects.filter(pk=self.product.pk),
+            )
+
+        product_copy = Product.objects.get(title='Тушь (копия)')
+        self.assertEqual(product_copy.import_hash, '')
+        update_vectors.assert_called_once_with((product_copy.pk,))
+
+
+class ProductImageVariantsTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        self.media_override = override_settings(MEDIA_ROOT=media_root)
+        self.media_override.enable()
+        self.addCleanup(self.media_override.disable)
+        self.product = Product.objects.create(
+            title='Пудра',
+            description='Описание',
+            pr_type='Пудра',
+            price=Decimal('100.00'),
+        )
+
+    def create_image(self):
+        buffer = BytesIO()
+        Image.new('RGB', (800, 400), 'red').save(buffer, format='PNG')
+        return ProductImage.objects.create(
+            product=self.product,
+            image=SimpleUploadedFile('photo.png', buffer.getvalue()),
+        )
+
+    @patch('store.tasks.generate_product_image_variants.delay')
+    def test_new_image_enqueues_generation_once(self, delay):
+        with self.captureOnCommitCallbacks(execute=True):
+            product_image = self.create_image()
+        delay.assert_called_once_with(product_image.pk)
+
+        generate_image_variants(product_image.pk)
+        product_image.refresh_from_db()
+        delay.reset_mock()
+        with self.captureOnCommitCallbacks(execute=True):
+            product_image.position = 1
+            product_image.save()
+        delay.assert_not_called()
+
+    def test_variants_are_generated_without_upscaling(self):
+        product_image = self.create_image()
+
+        variants = generate_image_variants(product_image.pk)
+
+        self.assertEqual(variants['source'], product_image.image.name)
+        self.assertEqual(
+            [(item['width'], item['format']) for item in variants['items']],
+            [
+                (width, image_format)
+                for width in (320, 640)
+                for image_format in get_variant_formats()
+            ],
+        )
+        for item in variants['items']:
+            self.assertTrue(default_storage.exists(item['image']))
+            self.assertIn('/variants/', item['image'])
+        self.product.card.refresh_from_db()
+        self.assertEqual(self.product.card.image_variants, variants['items'])
+        self.assertEqual(generate_image_variants(product_image.pk), variants)
+
+
+class ContentAddressedImageTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        self.media_override = override_settings(MEDIA_ROOT=media_root)
+        self.media_override.enable()
+        self.addCleanup(self.media_override.disable)
+        delay_patcher = patch(
+            'store.tasks.generate_product_image_variants.delay',
+        )
+        delay_patcher.start()
+        self.addCleanup(delay_patcher.stop)
+        self.products = [
+            Product.objects.create(
+                title=f'Блеск {index}',
+                description='Описание',
+                pr_type='Блеск',
+                price=Decimal('100.00'),
+            )
+            for index in range(2)
+        ]
+
+    def add_image(self, product, content=b'same-photo', name='photo.JPG'):
+        return ProductImage.objects.create(
+            product=product,
+            image=SimpleUploadedFile(name, content),
+        )
+
+    def age_file(self, name):
+        modified = time.time() - 2 * PRODUCT_IMAGE_ORPHAN_GRACE_PERIOD
+        os.utime(default_storage.path(name), (modified, modified))
+
+    def test_identical_files_are_stored_once(self):
+        first = self.add_image(self.products[0])
+        second = self.add_image(self.products[1], name='other.jpg')
+
+        file_hash = md5(b'same-photo').hexdigest()
+        self.assertEqual(first.file_hash, file_hash)
+        self.assertEqual(
+            first.image.name,
+            f'products/{file_hash[:2]}/{file_hash}.jpg',
+        )
+        self.assertEqual(second.image.name, first.image.name)
+
+    def test_same_format_is_stored_under_one_extension(self):
+        buffer = BytesIO()
+        Image.new('RGB', (10, 10), 'red').save(buffer, format='JPEG')
+        first = self.add_image(
+            self.products[0],
+            content=buffer.getvalue(),
+            name='photo.jpeg',
+        )
+        second = self.add_image(
+            self.products[1],
+            content=buffer.getvalue(),
+            name='photo.png',
+        )
+
+        self.assertTrue(first.image.name.endswith('.jpg'))
+        self.assertEqual(second.image.name, first.image.name)
+
+    def test_shared_variant_is_kept_while_referenced(self):
+        self.assertNotEqual(
+            get_variant_name('products/1.jpg', 320, 'webp'),
+            get_variant_name('products/1.png', 320, 'webp'),
+        )
+        # Превью старых файлов с одинаковым именем без расширения.
+        variant = default_storage.save(
+            'products/variants/1-320w.webp',
+            ContentFile(b'variant'),
+        )
+        images = []
+        for product, name in zip(self.products, ('1.jpg', '1.png')):
+            name = default_storage.save(f'products/{name}', ContentFile(b'1'))
+            self.age_file(name)
+            images.append(ProductImage.objects.create(
+                product=product,
+                image=name,
+                variants={
+                    'source': name,
+                    'items': [
+                        {'format': 'webp', 'width': 320, 'image': variant},
+                    ],
+                },
+            ))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            images[0].delete()
+        self.assertTrue(default_storage.exists(variant))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            images[1].delete()
+        self.assertFalse(default_storage.exists(variant))
+
+    def test_file_is_deleted_with_last_reference(self):
+        first = self.add_image(self.products[0])
+        second = self.add_image(self.products[1])
+        name = first.image.name
+
+        self.age_file(name)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(default_storage.exists(name))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(default_storage.exists(name))
+
+    def test_replaced_file_is_deleted(self):
+        product_image = self.add_image(self.products[0])
+        old_name = product_image.image.name
+        self.age_file(old_name)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            product_image.image = SimpleUploadedFile('new.jpg', b'new-photo')
+            product_image.save()
+
+        self.assertFalse(default_storage.exists(old_name))
+        self.assertTrue(default_storage.exists(product_image.image.name))
+
+    def test_reused_file_is_kept_for_uncommitted_reference(self):
+        first = self.add_image(self.products[0])
+        name = first.image.name
+        self.age_file(name)
+
+        # Другая транзакция переиспользует файл, но ещё не закоммичена:
+        # запись-ссылку очистка не видит, файл защищает свежее время.
+        ProductImage(
+            product=self.products[1],
+            image=SimpleUploadedFile('photo.jpg', b'same-photo'),
+        ).store_content_addressed()
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+
+        self.assertTrue(default_storage.exists(name))
+
+    def test_cleanup_command_skips_recent_files(self):
+        old_name = self.add_image(self.products[0]).image.name
+        recent_name = self.add_image(
+            self.products[1],
+            content=b'recent-photo',
+        ).image.name
+        self.age_file(old_name)
+        ProductImage.objects.all().delete()
+
+        call_command('cleanup_orphan_images', stdout=StringIO())
+
+        self.assertFalse(default_storage.exists(old_name))
+        self.assertTrue(default_storage.exists(recent_name))
+
+
+class ImageDownloaderTests(SimpleTestCase):
+    def setUp(self):
+        self.requests = []
+        self.responses = {}
+        test_case = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                test_case.requests.append(self.path)
+                status, body = test_case.responses[self.path].pop(0)
+                self.send_response(status)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+    def get_link(self, path):
+        return f'http://127.0.0.1:{self.server.server_port}{path}'
+
+    def download(self, path, **kwargs):
+        with ImageDownloader(backoff=0, **kwargs) as downloader:
+            return downloader.submit(self.get_link(path)).result()
+
+    def test_image_is_streamed_with_hash(self):
+        self.responses['/photos/lipstick.jpg'] = [(200, b'photo-bytes')]
+
+        image = self.download('/photos/lipstick.jpg')
+        self.addCleanup(image.close)
+
+        self.assertEqual(image.name, 'lipstick.jpg')
+        self.assertEqual(image.size, len(b'photo-bytes'))
+        self.assertEqual(image.file_hash, md5(b'photo-bytes').hexdigest())
+        self.assertEqual(image.as_file().read(), b'photo-bytes')
+
+    def test_temporary_errors_are_retried(self):
+        self.responses['/photo.jpg'] = [
+            (503, b''),
+            (429, b''),
+            (200, b'photo-bytes'),
+        ]
+
+        image = self.download('/photo.jpg')
+        self.addCleanup(image.close)
+
+        self.assertEqual(len(self.requests), 3)
+        self.assertEqual(image.file_hash, md5(b'photo-bytes').hexdigest())
+
+    def test_single_attempt_is_made_without_retries(self):
+        self.responses['/photo.jpg'] = [(503, b''), (200, b'photo-bytes')]
+
+        self.assertIsNone(self.download('/photo.jpg', retries=0))
+        self.assertEqual(len(self.requests), 1)
+
+    def test_unexpected_error_fails_only_this_image(self):
+        self.responses['/photo.jpg'] = [(200, b'photo-bytes')]
+
+        with patch.object(
+            ImageDownloader,
+            'fetch',
+            side_effect=ValueError('invalid Content-Length'),
+        ):
+            self.assertIsNone(self.download('/photo.jpg'))
+
+    def test_client_errors_are_not_retried(self):
+        self.responses['/missing.jpg'] = [(404, b''), (200, b'photo-bytes')]
+
+        self.assertIsNone(self.download('/missing.jpg'))
+        self.assertEqual(len(self.requests), 1)
+
+    def test_too_large_image_is_rejected(self):
+        self.responses['/huge.jpg'] = [(200, b'x' * 100)]
+
+        self.assertIsNone(self.download('/huge.jpg', max_size=10))
+        self.assertEqual(len(self.requests), 1)
+
+    def test_record_photos_are_submitted_in_order(self):
+        contents = [f'photo-{index}'.encode() for index in range(3)]
+        for index, content in enumerate(contents):
+            self.responses[f'/{index}.jpg'] = [(200, content)]
+        links = [self.get_link(f'/{index}.jpg') for index in range(3)]
+        record = ProductRecord(
+            position=0,
+            excel_row_number=2,
+            title='Блеск',
+            photo_links=links,
+        )
+
+        with ImageDownloader(backoff=0) as downloader:
+            downloads = submit_product_images(downloader, record)
+            images = [future.result() for _, future in downloads]
+        for image in images:
+            self.addCleanup(image.close)
+
+        self.assertEqual(
+            [image.file_hash for image in images],
+            [md5(content).hexdigest() for content in contents],
+        )
+
+
+class ImportJobTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        self.media_override = override_settings(MEDIA_ROOT=media_root)
+        self.media_override.enable()
+        self.addCleanup(self.media_override.disable)
+
+    def build_excel(self, titles):
+        buffer = BytesIO()
+        pd.DataFrame({
+            'Название': titles,
+            'Описание': ['Описание'] * len(titles),
+            'Тип': ['Блеск'] * len(titles),
+            'Цена': [100] * len(titles),
+            'Фото': [None] * len(titles),
+        }).to_excel(buffer, index=False)
+        return buffer.getvalue()
+
+    def create_job(self, content, name='products.xlsx'):
+        return ImportJob.objects.create(
+            file=ContentFile(content, name=name),
+        )
+
+    def test_admin_upload_enqueues_job(self):
+        user = CustomUser.objects.create_superuser(
+            email='import-admin@example.com',
+            password='strong-test-password',
+        )
+        self.client.force_login(user)
+
+        with patch('store.admin.import_products_job.delay') as delay:
+            delay.return_value = SimpleNamespace(id='task-1')
+            response = self.client.post(
+                '/admin/store/product/import-excel/',
+                {'file': SimpleUploadedFile(
+                    'products.xlsx',
+                    self.build_excel(['Блеск']),
+                )},
+            )
+
+        job = ImportJob.objects.get()
+        delay.assert_called_once_with(job.pk)
+        self.assertRedirects(
+            response,
+            reverse('admin:store_importjob_change', args=(job.pk,)),
+        )
+        self.assertEqual(job.status, ImportJob.Status.PENDING)
+        self.assertEqual(job.task_id, 'task-1')
+        self.assertEqual(job.created_by, user)
+        self.assertFalse(Product.objects.exists())
+
+        response = self.client.get(response.url)
+        self.assertContains(response, 'http-equiv="refresh"')
+
+    def test_dry_run_job_can_be_applied(self):
+        user = CustomUser.objects.create_superuser(
+            email='import-preview@example.com',
+            password='strong-test-password',
+        )
+        self.client.force_login(user)
+        preview = self.create_job(self.build_excel(['Блеск']))
+        ImportJob.objects.filter(pk=preview.pk).update(dry_run=True)
+
+        import_products_job(preview.pk)
+        preview.refresh_from_db()
+        self.assertEqual(preview.status, ImportJob.Status.SUCCEEDED)
+        self.assertEqual(preview.result['created'], 1)
+        self.assertFalse(Product.objects.exists())
+
+        response = self.client.get(
+            reverse('admin:store_importjob_change', args=(preview.pk,))
+        )
+        self.assertContains(response, 'Применить изменения')
+        self.assertContains(response, 'новый товар')
+
+        with patch('store.admin.import_products_job.delay') as delay:
+            delay.return_value = SimpleNamespace(id='task-2')
+            self.client.post(
+                reverse('admin:store_importjob_apply', args=(preview.pk,))
+            )
+
+        job = ImportJob.objects.exclude(pk=preview.pk).get()
+        delay.assert_called_once_with(job.pk)
+        self.assertFalse(job.dry_run)
+        self.assertEqual(job.file.name, preview.file.name)
+
+    def test_apply_requires_product_permissions(self):
+        user = CustomUser.objects.create_user(
+            email='import-viewer@example.com',
+            password='strong-test-password',
+            is_active=True,
+            is_staff=True,
+        )
+        user.user_permissions.add(
+            Permission.objects.get(codename='view_importjob'),
+        )
+        self.client.force_login(user)
+        preview = self.create_job(self.build_excel(['Блеск']))
+        ImportJob.objects.filter(pk=preview.pk).update(
+            dry_run=True,
+            status=ImportJob.Status.SUCCEEDED,
+        )
+
+        response = self.client.get(
+            reverse('admin:store_importjob_change', args=(preview.pk,))
+        )
+        self.assertNotContains(response, 'Применить изменения')
+
+        with patch('store.admin.import_products_job.delay') as delay:
+            response = self.client.post(
+                reverse('admin:store_importjob_apply', args=(preview.pk,))
+            )
+
+        self.assertEqual(response.status_code, 403)
+        delay.assert_not_called()
+        self.assertEqual(ImportJob.objects.count(), 1)
+
+    def test_job_imports_products_and_reports_progress(self):
+        job = self.create_job(self.build_excel(['Блеск', 'Тушь', None]))
+
+        import_products_job(job.pk)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, ImportJob.Status.SUCCEEDED)
+        self.assertEqual(job.total_rows, 3)
+        self.assertEqual(job.processed_rows, 3)
+        self.assertEqual(job.progress, 100)
+        self.assertEqual(job.result['imported'], 2)
+        self.assertEqual(job.result['skipped_rows'], 1)
+        self.assertIsNotNone(job.finished_at)
+        self.assertEqual(
+            set(Product.objects.values_list('title', flat=True)),
+            {'Блеск', 'Тушь'},
+        )
+
+    def test_csv_job_imports_products(self):
+        content = (
+            'Название;Цена;Категории;Фото\n'
+            'Это номер или название товара;Единица измерения;;\n'
+            'Блеск;1 299,50;Блески, Новинки;\n'
+            ';;;\n'
+            'Тушь;300;;\n'
+        ).encode('utf-8-sig')
+        job = self.create_job(content, name='products.csv')
+
+        import_products_job(job.pk)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, ImportJob.Status.SUCCEEDED)
+        self.assertEqual(job.result['imported'], 2)
+        self.assertEqual(job.progress, 100)
+        product = Product.objects.get(title='Блеск')
+        self.assertEqual(product.price, Decimal('1299.50'))
+        self.assertEqual(
+            set(product.categories.values_list('title', flat=True)),
+            {'Блески', 'Новинки'},
+        )
+
+    def test_broken_file_marks_job_failed(self):
+        job = self.create_job(b'not an excel file')
+
+        with self.assertRaises(Exception):
+            import_products_job(job.pk)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, ImportJob.Status.FAILED)
+        self.assertTrue(job.error_message)
+        self.assertIsNotNone(job.finished_at)
+
+    def test_started_job_is_not_run_twice(self):
+        job = self.create_job(self.build_excel(['Блеск']))
+        ImportJob.objects.filter(pk=job.pk).update(
+            status=ImportJob.Status.RUNNING,
+        )
+
+        result = import_products_job(job.pk)
+
+        self.assertEqual(result['reason'], 'not_pending')
+        self.assertFalse(Product.objects.exists())
+
+
+class ProductBulkImportTests(TestCase):
+    def build_dataframe(self, rows):
+        return pd.DataFrame(
+            rows,
+            columns=('Название', 'Описание', 'Цена', 'Категории', 'Фото'),
+        )
+
+    def test_products_and_categories_are_upserted(self):
+        lipstick = Category.objects.create(title='Помады')
+        gloss = Category.objects.create(title='Блески')
+        product = Product.objects.create(
+            title='Блеск',
+            description='Старое описание',
+            pr_type='Блеск',
+            price=Decimal('250.00'),
+        )
+        product.categories.set((lipstick, gloss))
+
+        result = import_products_dataframe(self.build_dataframe([
+            ('Блеск', 'Новое описание', None, 'Блески; Новинки', None),
+            ('Тушь', 'Описание', 300, 'Помады', None),
+        ]))
+
+        self.assertEqual(result.imported, 2)
+        product.refresh_from_db()
+        self.assertEqual(product.description, 'Новое описание')
+        self.assertEqual(product.price, Decimal('250.00'))
+        self.assertEqual(product.pr_type, 'Блеск')
+        self.assertEqual(
+            set(product.categories.values_list('title', flat=True)),
+            {'Блески', 'Новинки'},
+        )
+        self.assertTrue(Category.objects.get(title='Новинки').slug)
+        mascara = Product.objects.get(title='Тушь')
+        self.assertEqual(mascara.price, Decimal('300.00'))
+        self.assertEqual(list(mascara.categories.all()), [lipstick])
+        self.assertEqual(mascara.card.category_slugs, [lipstick.slug])
+
+    def test_cards_are_refreshed_after_each_batch(self):
+        card_counts = []
+
+        def record_card_count(product_ids):
+            card_counts.append(ProductCard.objects.count())
+
+        with patch(
+            'store.importers.products_excel.EXCEL_IMPORT_BATCH_SIZE',
+            1,
+        ), patch(
+            'store.importers.products_excel.update_product_search_vectors',
+            side_effect=record_card_count,
+        ):
+            import_products_dataframe(self.build_dataframe([
+                ('Блеск', 'Описание', 100, None, None),
+                ('Тушь', 'Описание', 300, None, None),
+            ]))
+
+        # Карточка первой пачки уже есть, пока сохраняется вторая.
+        self.assertEqual(card_counts, [0, 1])
+
+    def test_cache_is_invalidated_once_after_import(self):
+        with patch(
+            'store.importers.products_excel.bump_cache_generation',
+        ) as bump:
+            import_products_dataframe(self.build_dataframe([
+                ('Блеск', 'Описание', 100, None, None),
+                ('Тушь', 'Описание', 300, None, None),
+            ]))
+
+        bump.assert_called_once_with('product', 'productimage', 'category')
+
+    def test_repeated_title_updates_previous_row(self):
+        result = import_products_dataframe(self.build_dataframe([
+            ('Блеск', 'Первое описание', 100, None, None),
+            ('Блеск', 'Второе описание', None, None, None),
+        ]))
+
+        self.assertEqual(result.imported, 2)
+        self.assertEqual(result.placeholder_price_rows, 0)
+        product = Product.objects.get(title='Блеск')
+        self.assertEqual(product.description, 'Второе описание')
+        self.assertEqual(product.price, Decimal('100.00'))
+
+    def test_unchanged_rows_are_not_written(self):
+        rows = [
+            ('Блеск', 'Описание', 100, 'Блески', 'http://a/1.jpg'),
+            ('Тушь', 'Описание', 300, None, None),
+        ]
+        with patch(
+            'store.importers.products_excel.ImageDownloader.download',
+            return_value=None,
+        ), patch(
+            'store.importers.products_excel.import_product_images',
+            return_value=0,
+        ):
+            import_products_dataframe(self.build_dataframe(rows))
+        Product.objects.create(
+            title='Снят с продажи',
+            description='Описание',
+            pr_type='Тип',
+            price=Decimal('10.00'),
+        )
+        rows[1] = ('Тушь', 'Описание', 350, None, None)
+
+        with patch(
+            'store.importers.products_excel.ImageDownloader.submit',
+        ) as submit, CaptureQueriesContext(connection) as queries:
+            result = import_products_dataframe(self.build_dataframe(rows))
+
+        submit.assert_not_called()
+        self.assertEqual(
+            (result.created, result.updated, result.unchanged),
+            (0, 1, 1),
+        )
+        self.assertEqual(result.imported, 1)
+        self.assertEqual(result.removed_titles, ['Снят с продажи'])
+        self.assertEqual(
+            result.changes,
+            [{'row': 2, 'title': 'Тушь', 'status': 'changed',
+              'fields': ['price']}],
+        )
+        self.assertFalse(any(
+            'Блеск' in query['sql'] and 'INSERT' in query['sql']
+            for query in queries.captured_queries
+        ))
+        self.assertEqual(
+            Product.objects.get(title='Тушь').price,
+            Decimal('350.00'),
+        )
+
+    def test_failed_images_are_retried_on_next_import(self):
+        rows = [('Блеск', 'Описание', 100, None, 'http://a/1.jpg')]
+        with patch(
+            'store.importers.products_excel.ImageDownloader.download',
+            return_value=None,
+        ):
+            result = import_products_dataframe(self.build_dataframe(rows))
+        self.assertEqual(result.failed_images, 1)
+        self.assertEqual(Product.objects.get(title='Блеск').import_hash, '')
+
+        with patch(
+            'store.importers.products_excel.ImageDownloader.submit',
+        ) as submit, patch(
+            'store.importers.products_excel.import_product_images',
+            return_value=0,
+        ):
+            result = import_products_dataframe(self.build_dataframe(rows))
+
+        self.assertEqual((result.updated, result.unchanged), (1, 0))
+        submit.assert_called_once_with('http://a/1.jpg')
+        self.assertTrue(Product.objects.get(title='Блеск').import_hash)
+
+    def test_dry_run_reports_diff_without_writing(self):
+        Product.objects.create(
+            title='Блеск',
+            description='Описание',
+            pr_type='Блеск',
+            price=Decimal('100.00'),
+        )
+
+        result = import_products_dataframe(
+            self.build_dataframe([
+                ('Блеск', 'Новое описание', None, 'Блески', None),
+                ('Тушь', 'Описание', 300, None, None),
+            ]),
+            dry_run=True,
+        )
+
+        self.assertEqual((result.created, result.updated), (1, 1))
+        self.assertEqual(result.imported, 0)
+        self.assertEqual(
+            [change['fields'] for change in result.changes],
+            [['description', 'categories'], []],
+        )
+        self.assertIn(
+            'Предпросмотр импорта из Excel, изменения не сохранены.',
+            result.to_messages(),
+        )
+        self.assertFalse(Product.objects.filter(title='Тушь').exists())
+        self.assertFalse(Category.objects.exists())
+        self.assertEqual(
+            Product.objects.get(title='Блеск').description,
+            'Описание',
+        )
+
+    def test_query_count_does_not_grow_with_rows(self):
+        Category.objects.create(title='Помады')
+
+        def count_queries(titles):
+            with CaptureQueriesContext(connection) as queries:
+                import_products_dataframe(self.build_dataframe([
+                    (title, 'Описание', 100, 'Помады', None)
+                    for title in titles
+                ]))
+            return len(queries)
+
+        small = count_queries([f'Помада {index}' for index in range(5)])
+        large = count_queries([f'Тушь {index}' for index in range(50)])
+
+        self.assertEqual(small, large)
+        self.assertEqual(Product.objects.count(), 55)
+
+
+class ImportBenchmarkCommandTests(TestCase):
+    def test_benchmark_reports_phases_and_rolls_back(self):
+        stdout = StringIO()
+
+        call_command(
+            'benchmark_import',
+            '--rows', '5',
+            '--formats', 'xlsx', 'csv',
+            stdout=stdout,
+        )
+
+        output = stdout.getvalue()
+        self.assertIn('xlsx 5 строк', output)
+        self.assertIn('csv 5 строк', output)
+        self.assertIn('импортировано 5, ошибок фото 0', output)
+        self.assertIn('пиковый RSS процесса', output)
+        self.assertIn('parse', output)
+        self.assertFalse(Product.objects.exists())
+        self.assertFalse(ProductImage.objects.exists())
+
+    def test_deferred_card_refresh_is_timed_as_db(self):
+        product = Product.objects.create(
+            title='Блеск',
+            description='Описание',
+            pr_type='Блеск',
+            price=Decimal('100.00'),
+        )
+        timings = defaultdict(float)
+
+        with measure_phases(timings), defer_product_card_refresh():
+            refresh_product_cards([product.pk])
+            flush_product_card_refresh()
+
+        self.assertGreater(timings['db'], 0)
+        self.assertFalse(hasattr(cards._refresh, '__wrapped__'))
+
+
+class ProductFileReaderTests(SimpleTestCase):
+    def test_xlsx_is_read_in_chunks_after_header(self):
+        buffer = BytesIO()
+        pd.DataFrame([
+            ('Каталог поставщика', None, None),
+            ('Наименование', 'Цена', 'Фото'),
+            ('Максимальное количество значений: 1', None, None),
+            ('Блеск', 100, None),
+            (None, None, None),
+            ('Тушь', 200, 'http://a/1.jpg'),
+            ('Помада', 300, None),
+        ]).to_excel(buffer, index=False, header=False)
+        buffer.seek(0)
+        buffer.name = 'products.xlsx'
+
+        reader = ProductFileReader(buffer, chunk_rows=2)
+        chunks = list(reader)
+
+        self.assertEqual(reader.total_rows, 4)
+        self.assertEqual(
+            [chunk.index.tolist() for chunk in chunks],
+            [[3], [5, 6]],
+        )
+        self.assertEqual(
+            chunks[1]['Наименование'].tolist(),
+            ['Тушь', 'Помада'],
+        )
+        self.assertEqual(chunks[1]['Фото'].tolist(), ['http://a/1.jpg', None])
+
+    def test_csv_encoding_falls_back_to_cp1251(self):
+        buffer = BytesIO(
+            'Название;Цена;Фото\nБлеск;100;\n'.encode('cp1251'),
+        )
+        buffer.name = 'products.csv'
+
+        chunks = list(ProductFileReader(buffer))
+
+        self.assertEqual(chunks[0]['Название'].tolist(), ['Блеск'])
+
+    def test_undecodable_csv_raises_readable_error(self):
+        buffer = BytesIO(
+            'Название;Цена;Фото\nБлеск;100;\n'.encode('utf-8')
+            + b'\x98\xff;200;\n'
+        )
+        buffer.name = 'products.csv'
+
+        with patch(
+            'store.importers.readers.CSV_ENCODING_SAMPLE_SIZE',
+            8,
+        ), self.assertRaisesMessage(ValueError, 'Windows-1251'):
+            list(ProductFileReader(buffer))
+
+
+class ProductRecordNormalizationTests(SimpleTestCase):
+    def test_columns_are_normalized_once_per_file(self):
+        result = ProductImportResult()
+        df = pd.DataFrame(
+            {
+                'Название': ['  Блеск ', None, 'Т' * 200, 'Тушь'],
+                'Наименование': [None, None, 'Запасное', None],
+                'Новинка': ['Нет', 'да', 1, None],
+                'Вес с упаковкой (кг)': [0.25, None, '1,5', None],
+                'Вес полный': [None, None, 40, None],
+                'Цвет': ['Красный; Синий', None, None, None],
+                'Цена': [100, 200, None, 'не число'],
+                'Категории': ['Помады, Блески', None, None, None],
+                'Фото': ['http://a/1.jpg; http://a/2.jpg', None, None, None],
+            },
+            index=[4, 5, 6, 7],
+        )
+
+        records = normalize_products_dataframe(df, result)
+
+        self.assertEqual(result.skipped_rows, 1)
+        self.assertEqual(result.failed_rows, 1)
+        self.assertEqual(result.trimmed_fields, {'title': 1})
+        first, second = records
+        self.assertEqual(
+            (first.position, first.excel_row_number, first.title),
+            (0, 5, 'Блеск'),
+        )
+        self.assertIs(first.is_new, False)
+        self.assertEqual(first.full_weight, 250.0)
+        self.assertEqual(first.color, 'Красный')
+        self.assertEqual(first.price, 100)
+        self.assertIsNone(first.old_price)
+        self.assertEqual(first.category_titles, ['Помады', 'Блески'])
+        self.assertEqual(
+            first.photo_links,
+            ['http://a/1.jpg', 'http://a/2.jpg'],
+        )
+        self.assertEqual((second.position, second.excel_row_number), (2, 7))
+        self.assertEqual(len(second.title), 128)
+        self.assertIs(second.is_new, True)
+        self.assertEqual(second.full_weight, 40)
+        self.assertIsNone(second.price)
+        self.assertEqual(second.category_titles, [])
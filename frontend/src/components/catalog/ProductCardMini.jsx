@@ -28,6 +28,8 @@ export default function ProductCardMini({ product }) {
     const [isFav, setIsFav] = useState(false);
     const [showAuth, setShowAuth] = useState(false);
     const productType = product.pr_type || product.type || "";
+    // Список каталога отдаёт одно поле image, детальный ответ — массив images.
+    const imageUrl = product.image || product.images?.[0]?.image;
 
     useEffect(() => {
         setIsFav(product.is_fav || false);
@@ -71,9 +73,9 @@ export default function ProductCardMini({ product }) {
                 <div className="product-mini-card">
                     <div className="product-mini-image-wrapper">
                         <HeartIcon filled={isFav} onClick={toggleFav} />
-                        {product.images?.[0]?.image ? (
+                        {imageUrl ? (
                             <img
-                                src={product.images[0].image}
+                                src={imageUrl}
                                 alt={product.title}
                                 className="product-mini-image"
                             />